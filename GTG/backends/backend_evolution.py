@@ -29,7 +29,7 @@ import evolution
 from dateutil.tz import tzutc, tzlocal
 
 from GTG import _
-from GTG.backends.genericbackend import GenericBackend
+from GTG.backends.genericbackend import GenericBackend, synchronized
 from GTG.backends.periodicimportbackend import PeriodicImportBackend
 from GTG.backends.syncengine import SyncEngine, SyncMeme
 from GTG.core.task import Task
@@ -104,44 +104,46 @@ class Backend(PeriodicImportBackend):
         """
         See PeriodicImportBackend for an explanation of this function.
         """
-        stored_evolution_task_ids = set(self.sync_engine.get_all_remote())
-        all_tasks = self._evolution_tasks.get_all_objects()
-        current_evolution_task_ids = set([task.get_uid()
-                                          for task in all_tasks])
-        # If it's the very first time the backend is run, it's possible that
-        # the user already synced his tasks in some way (but we don't know that
-        # ). Therefore, we attempt to induce those tasks relationships matching
-        # the titles.
-        if self._parameters["is-first-run"]:
-            gtg_titles_dic = {}
-            for tid in self.datastore.get_all_tasks():
-                gtg_task = self.datastore.get_task(tid)
-                if not self._gtg_task_is_syncable_per_attached_tags(gtg_task):
-                    continue
-                gtg_title = gtg_task.get_title()
-                if gtg_title in gtg_titles_dic:
-                    gtg_titles_dic[gtg_task.get_title()].append(tid)
-                else:
-                    gtg_titles_dic[gtg_task.get_title()] = [tid]
-            for evo_task_id in current_evolution_task_ids:
-                evo_task = self._evo_get_task(evo_task_id)
-                try:
-                    tids = gtg_titles_dic[evo_task.get_summary()]
-                    # we remove the tid, so that it can't be linked to two
-                    # different evolution tasks
-                    tid = tids.pop()
+        with self._sync_lock:
+            stored_evolution_task_ids = set(self.sync_engine.get_all_remote())
+            all_tasks = self._evolution_tasks.get_all_objects()
+            current_evolution_task_ids = set([task.get_uid()
+                                              for task in all_tasks])
+            # If it's the very first time the backend is run, it's possible
+            # that the user already synced his tasks in some way (but we don't
+            # know that). Therefore, we attempt to induce those tasks
+            # relationships matching the titles.
+            if self._parameters["is-first-run"]:
+                gtg_titles_dic = {}
+                for tid in self.datastore.get_all_tasks():
                     gtg_task = self.datastore.get_task(tid)
-                    meme = SyncMeme(gtg_task.get_modified(),
-                                    self._evo_get_modified(evo_task),
-                                    "GTG")
-                    self.sync_engine.record_relationship(
-                        local_id=tid,
-                        remote_id=evo_task.get_uid(),
-                        meme=meme)
-                except KeyError:
-                    pass
-            # a first run has been completed successfully
-            self._parameters["is-first-run"] = False
+                    if not self._gtg_task_is_syncable_per_attached_tags(
+                            gtg_task):
+                        continue
+                    gtg_title = gtg_task.get_title()
+                    if gtg_title in gtg_titles_dic:
+                        gtg_titles_dic[gtg_task.get_title()].append(tid)
+                    else:
+                        gtg_titles_dic[gtg_task.get_title()] = [tid]
+                for evo_task_id in current_evolution_task_ids:
+                    evo_task = self._evo_get_task(evo_task_id)
+                    try:
+                        tids = gtg_titles_dic[evo_task.get_summary()]
+                        # we remove the tid, so that it can't be linked to two
+                        # different evolution tasks
+                        tid = tids.pop()
+                        gtg_task = self.datastore.get_task(tid)
+                        meme = SyncMeme(gtg_task.get_modified(),
+                                        self._evo_get_modified(evo_task),
+                                        "GTG")
+                        self.sync_engine.record_relationship(
+                            local_id=tid,
+                            remote_id=evo_task.get_uid(),
+                            meme=meme)
+                    except KeyError:
+                        pass
+                # a first run has been completed successfully
+                self._parameters["is-first-run"] = False
 
         for evo_task_id in current_evolution_task_ids:
             # Adding and updating
@@ -152,12 +154,13 @@ class Backend(PeriodicImportBackend):
                 current_evolution_task_ids):
             # Removing the old ones
             self.cancellation_point()
-            tid = self.sync_engine.get_local_id(evo_task_id)
-            self.datastore.request_task_deletion(tid)
-            try:
-                self.sync_engine.break_relationship(remote_id=evo_task_id)
-            except KeyError:
-                pass
+            with self._sync_lock:
+                tid = self.sync_engine.get_local_id(evo_task_id)
+                self.datastore.request_task_deletion(tid)
+                try:
+                    self.sync_engine.break_relationship(remote_id=evo_task_id)
+                except KeyError:
+                    pass
 
     def save_state(self):
         '''
@@ -169,6 +172,7 @@ class Backend(PeriodicImportBackend):
 ### Process tasks #############################################################
 ###############################################################################
     @interruptible
+    @synchronized
     def remove_task(self, tid):
         '''
         See GenericBackend for an explanation of this function.
@@ -184,6 +188,7 @@ class Backend(PeriodicImportBackend):
             pass
 
     @interruptible
+    @synchronized
     def set_task(self, task):
         '''
         See GenericBackend for an explanation of this function.
@@ -203,7 +208,7 @@ class Backend(PeriodicImportBackend):
         if action == SyncEngine.ADD:
             evo_task = evolution.ecal.ECalComponent(
                 ical=evolution.ecal.CAL_COMPONENT_TODO)
-            with self.datastore.get_backend_mutex():
+            with self.datastore.get_task_mutex(tid):
                 self._evolution_tasks.add_object(evo_task)
                 self._populate_evo_task(task, evo_task)
                 meme = SyncMeme(task.get_modified(),
@@ -214,19 +219,22 @@ class Backend(PeriodicImportBackend):
                     meme=meme)
 
         elif action == SyncEngine.UPDATE:
-            with self.datastore.get_backend_mutex():
-                evo_task = self._evo_get_task(evo_task_id)
-                meme = self.sync_engine.get_meme_from_local_id(task.get_id())
-                newest = meme.which_is_newest(task.get_modified(),
-                                              self._evo_get_modified(evo_task))
-                if newest == "local":
-                    self._populate_evo_task(task, evo_task)
-                    meme.set_remote_last_modified(
-                        self._evo_get_modified(evo_task))
-                    meme.set_local_last_modified(task.get_modified())
-                else:
-                    # we skip saving the state
-                    return
+            evo_task = self._evo_get_task(evo_task_id)
+            meme = self.sync_engine.get_meme_from_local_id(task.get_id())
+            newest = meme.which_is_newest(task.get_modified(),
+                                          self._evo_get_modified(evo_task))
+            if newest != "local":
+                # we skip saving the state
+                return
+
+            def write():
+                self._populate_evo_task(task, evo_task)
+
+            def commit():
+                meme.set_remote_last_modified(
+                    self._evo_get_modified(evo_task))
+                meme.set_local_last_modified(task.get_modified())
+            self._write_task(task, write, commit)
 
         elif action == SyncEngine.REMOVE:
             self.datastore.request_task_deletion(tid)
@@ -240,6 +248,7 @@ class Backend(PeriodicImportBackend):
             self._exec_lost_syncability(tid, evo_task)
         self.save_state()
 
+    @synchronized
     def _process_evo_task(self, evo_task_id):
         '''
         Takes an evolution task id and carries out the necessary operations to
@@ -269,7 +278,7 @@ class Backend(PeriodicImportBackend):
                 self.datastore.push_task(task)
 
         elif action == SyncEngine.UPDATE:
-            with self.datastore.get_backend_mutex():
+            with self.datastore.get_task_mutex(tid):
                 task = self.datastore.get_task(tid)
                 meme = self.sync_engine.get_meme_from_remote_id(evo_task_id)
                 newest = meme.which_is_newest(task.get_modified(),
@@ -43,15 +43,39 @@ from hashlib import md5
 from GTG.backends.genericbackend import GenericBackend
 from GTG import _
 from GTG.backends.backendsignals import BackendSignals
-from GTG.backends.syncengine import SyncEngine, SyncMeme
+from GTG.backends.syncengine import SyncEngine, SyncMeme, SyncHashes
 from GTG.backends.rtm.rtm import createRTM, RTMError, RTMAPIError
 from GTG.backends.periodicimportbackend import PeriodicImportBackend
 from GTG.tools.dates import Date
 from GTG.core.task import Task
+from GTG.tools.changefeed import ChangeFeed, CursorExpired
 from GTG.tools.interruptible import interruptible
 from GTG.tools.logger import Log
 from GTG.tools.dates import Date
 
+
+def _get_urls(base_url):
+    """ Returns the URLs of the API of a GTGOnline! server """
+    return {
+        'auth': base_url + 'user/auth_gtg/',
+        'tasks': {
+            'get': base_url + 'tasks/serial/',
+            'changes': base_url + 'tasks/changes/',
+            'new': base_url + 'tasks/new/',
+            'update': base_url + 'tasks/bulk_update/',
+            'delete': base_url + 'tasks/delete/',
+        },
+        'tags': base_url + 'tags/all/',
+    }
+
+# Default maximum number of tasks sent in one tasks/bulk_update/ request
+UPDATE_CHUNK_SIZE = 50
+
+
+class ServerError(Exception):
+    '''Raised when the server answers a query with an error'''
+    pass
+
 class Backend(PeriodicImportBackend):
     """
     GTGOnline! Backend
@@ -81,6 +105,9 @@ class Backend(PeriodicImportBackend):
         "period": {
             GenericBackend.PARAM_TYPE: GenericBackend.TYPE_INT,
             GenericBackend.PARAM_DEFAULT_VALUE: 5, },
+        "update chunk size": {
+            GenericBackend.PARAM_TYPE: GenericBackend.TYPE_INT,
+            GenericBackend.PARAM_DEFAULT_VALUE: UPDATE_CHUNK_SIZE, },
     }
     
     # USE BELOW ONLY IF ACCESSING LOCALHOST INSIDE CAMPUS
@@ -89,16 +116,12 @@ class Backend(PeriodicImportBackend):
     IS_REQUESTS_LATEST = True
     
     BASE_URL = "http://gtgonline-parinporecha.rhcloud.com/"
-    URLS = {
-        'auth': BASE_URL + 'user/auth_gtg/',
-        'tasks': {
-            'get': BASE_URL + 'tasks/serial/',
-            'new': BASE_URL + 'tasks/new/',
-            'update': BASE_URL + 'tasks/bulk_update/',
-            'delete': BASE_URL + 'tasks/delete/',
-        },
-        'tags': BASE_URL + 'tags/all/',
-    }
+    URLS = _get_urls(BASE_URL)
+    
+    # One periodic import out of FULL_SYNC_EVERY downloads all the tasks, to
+    # check that both sides are consistent. The others only download the
+    # tasks changed since the previous import.
+    FULL_SYNC_EVERY = 12
     
     CONVERT_24_HR = '%d/%m/%y'
     CONVERT_24_HR_WITH_TIME = '%d/%m/%y %H:%M:%S'
@@ -115,6 +138,11 @@ class Backend(PeriodicImportBackend):
         2: 'Dismiss',
     }
     
+    # Fields of a task which are synchronized with GTGOnline!
+    SYNCED_FIELDS = set([Task.FIELD_TITLE, Task.FIELD_CONTENT,
+                         Task.FIELD_STATUS, Task.FIELD_DATES,
+                         Task.FIELD_CHILDREN])
+    
     def __init__(self, params):
         """ Constructor of the object """
         super(Backend, self).__init__(params)
@@ -126,6 +154,37 @@ class Backend(PeriodicImportBackend):
                                       "sync_engine-" + self.get_id())
         self.sync_engine = self._load_pickled_file(self.data_path,
                                                    SyncEngine())
+        # the server to use instead of GTGOnline! (used by the tests)
+        if "use this server instead" in params:
+            self.URLS = _get_urls(params["use this server instead"])
+        # cursors of the last import: the server one is given by the server,
+        # the local one is a sequence number of the change feed of the
+        # datastore. None means that the next import is a full one.
+        self.sync_cursor = None
+        self.local_cursor = None
+        self._imports_since_full_sync = 0
+        # False once the server has answered that it doesn't support
+        # incremental sync: it's not asked again during this session
+        self._changes_supported = True
+        # the local tasks whose remote update failed during an incremental
+        # import: they're sent again at the next one
+        self._failed_updates = set()
+        # {local id: field versions of the task (see
+        # Task.get_field_versions) when it was last sent to the server}: only
+        # the fields modified since are sent in the next update
+        self._sent_field_versions = {}
+        # the HTTP session used for all the requests to the server: it keeps
+        # the connections open and holds the session cookie
+        self.session = None
+        # True if the server keeps a session for us, so that the credentials
+        # don't have to be sent with every request
+        self._has_session_cookie = False
+        self._auth_lock = threading.Lock()
+        # {local id: (state of the task, hash)}: the hashes of the local
+        # tasks, computed again only when the task has been modified
+        self._local_hashes = {}
+        # {phase: seconds} for the last periodic import
+        self._sync_timings = {}
     
     def initialize(self):
         """ This is called when a backend is enabled """
@@ -136,7 +195,15 @@ class Backend(PeriodicImportBackend):
                                       self._parameters["username"])
         #print "Data path = \n****\n****\n" + str(self.hash_dict_path) + "\n****\n****\n"
         self.hash_dict = self._load_pickled_file(self.hash_dict_path, \
-                                                 default_value = {})
+                                                 default_value = SyncHashes())
+        if isinstance(self.hash_dict, dict):
+            # saved by an older version, as {local id: [hash, remote id]}
+            hash_dict = SyncHashes()
+            for task_id, (task_hash, web_id) in self.hash_dict.iteritems():
+                hash_dict.set_hash(task_id, task_hash)
+                if web_id is not None:
+                    hash_dict.set_remote_id(task_id, str(web_id))
+            self.hash_dict = hash_dict
         if requests.__version__ < '1.0':
             #print "Using requests 0.x"
             self.IS_REQUESTS_LATEST = False
@@ -147,6 +214,7 @@ class Backend(PeriodicImportBackend):
                 self.error_caught_abort(BackendSignals.ERRNO_NETWORK)
         
         pynotify.init("started")
+        self.session = requests.session()
         self.try_auth()
         #print "returned here"
             
@@ -154,13 +222,48 @@ class Backend(PeriodicImportBackend):
         """
         Checks whether the credentials entered match a user on the server.
         """
-        params = {"email": self._parameters["username"],
-                  "password": self._parameters["password"],}
-        auth_response = requests.post(self.URLS['auth'], params)
+        with self._auth_lock:
+            self.session.cookies.clear()
+            auth_response = self.session.post(self.URLS['auth'],
+                                              self._get_credentials())
+            # the session cookie set by the server, if any, is stored in the
+            # cookie jar of the session and sent back with the next requests
+            self._has_session_cookie = len(self.session.cookies) > 0
         if auth_response.status_code != 200:
             self.error_caught_abort(BackendSignals.ERRNO_NETWORK)
+            return False
         if auth_response.text != '1':
             self.error_caught_abort(BackendSignals.ERRNO_AUTHENTICATION)
+            return False
+        return True
+    
+    def _get_credentials(self):
+        return {"email": self._parameters["username"],
+                "password": self._parameters["password"],}
+    
+    def _post(self, url, params):
+        """
+        Sends a request to the server through the session. The credentials
+        are only sent if the server doesn't keep a session for us. If the
+        session has expired, we authenticate again and resend the request.
+        """
+        def post():
+            data = dict(params)
+            if not self._has_session_cookie:
+                data.update(self._get_credentials())
+            return self.session.post(url, data)
+        response = post()
+        if response.status_code in (401, 403) and self._has_session_cookie:
+            Log.info("%s: session expired, authenticating again" %
+                     self.get_id())
+            if self.try_auth():
+                response = post()
+        return response
+    
+    def quit(self, disable=False):
+        super(Backend, self).quit(disable)
+        if self.session is not None:
+            self.session.close()
     
     def error_caught_abort(self, error):
         """
@@ -174,13 +277,80 @@ class Backend(PeriodicImportBackend):
         
     def do_periodic_import(self, ):
         #print "Importing ..."
-        tasks = self.fetch_tasks_from_server()
-        self.process_tasks(tasks)
+        try:
+            self._import_tasks()
+        except ServerError, error:
+            # nothing has been changed yet: the cursors are kept, and the
+            # next import will try again
+            Log.warning("%s: import aborted, the server answered %s" %
+                        (self.get_id(), error))
+
+    def _import_tasks(self):
+        '''
+        Does the periodic import. Raises ServerError, before changing
+        anything, if the server can't be queried.
+        '''
+        timings = {}
+        local_cursor = self.datastore.get_change_cursor()
+        changes = None
+        if self.sync_cursor is not None and \
+                self._imports_since_full_sync < self.FULL_SYNC_EVERY - 1:
+            try:
+                local_changes = self.datastore.get_changes_since(
+                    self.local_cursor)
+                changes = self._run_phase(timings, "fetch",
+                                          self.fetch_changes_from_server,
+                                          self.sync_cursor)
+            except CursorExpired:
+                Log.info("%s: too many local changes, doing a full sync" %
+                         self.get_id())
+        if changes is not None:
+            self.sync_cursor, tasks, deleted = changes
+            self._run_phase(timings, "process", self.process_changes,
+                            tasks, deleted, local_changes)
+            self._imports_since_full_sync += 1
+        else:
+            # full sync. The server cursor is asked along with all the tasks,
+            # so that no change can be missed between the two
+            changes = self._run_phase(timings, "fetch",
+                                      self.fetch_changes_from_server, '')
+            if changes is None:
+                # the server doesn't support incremental sync
+                tasks = self._run_phase(timings, "fetch",
+                                        self.fetch_tasks_from_server)
+                self.sync_cursor = None
+            else:
+                self.sync_cursor, tasks, deleted = changes
+            self._run_phase(timings, "process", self.process_tasks, tasks)
+            self._imports_since_full_sync = 0
+        self.local_cursor = local_cursor
         #tags = self.fetch_tags_from_server()
         #self.process_tags(tags)
-        self.save_state()
+        self._run_phase(timings, "save", self.save_state)
+        self._sync_timings = timings
+        Log.info("Import of %s: %s" % (self.get_id(), ", ".join(
+            "%s %.3fs" % (phase, seconds)
+            for phase, seconds in sorted(timings.iteritems()))))
         pynotify.Notification("Sync Done", "Added: 5 tasks\nUpdated: 9 tasks\nDeleted: 2 tasks\n(^^This isn't real, just a representation)", "dialog-info").show()
         
+    def _run_phase(self, timings, phase, function, *args):
+        """
+        Runs a phase of the periodic import and adds its duration to timings
+        """
+        start = time.time()
+        try:
+            return function(*args)
+        finally:
+            timings[phase] = timings.get(phase, 0) + time.time() - start
+    
+    def get_sync_timings(self):
+        """
+        Returns how long each phase of the last periodic import took
+
+        @returns dict: {phase: seconds}
+        """
+        return dict(self._sync_timings)
+    
     def save_state(self):
         '''Saves the state of the synchronization'''
         #print "Saving Data path = \n****\n****\n" + str(self.hash_dict_path) + "\n****\n****\n"
@@ -203,16 +373,125 @@ class Backend(PeriodicImportBackend):
         The server gives a JSON response which is then sent for parsing
         """
         #print "Fetching tasks started ..."
-        params = {"email": self._parameters["username"],
-                  "password": self._parameters["password"],}
-        tasks = requests.post(self.URLS['tasks']['get'], params)
+        tasks = self._post(self.URLS['tasks']['get'], {})
         #print "response received = " + str(tasks.json)
         if tasks.status_code == 200:
             #print "json = " + str(tasks.json())
             if not self.IS_REQUESTS_LATEST:
                 return tasks.json
             return tasks.json()
-        return ''
+        raise ServerError(tasks.status_code)
+    
+    def fetch_changes_from_server(self, since):
+        """
+        Queries the server for the tasks changed or deleted since a previous
+        query.
+
+        @param since: the cursor returned by the previous query, or '' to get
+                      all the tasks
+        @returns tuple: (the new cursor, the changed tasks, the remote ids of
+                        the deleted tasks), or None if the server does not
+                        support incremental sync
+        @raises ServerError: if the server answers with another error
+        """
+        if not self._changes_supported:
+            return None
+        response = self._post(self.URLS['tasks']['changes'], {"since": since,})
+        if response.status_code == 404:
+            Log.info("%s: the server doesn't support incremental sync" %
+                     self.get_id())
+            self._changes_supported = False
+            return None
+        if response.status_code != 200:
+            raise ServerError(response.status_code)
+        if not self.IS_REQUESTS_LATEST:
+            changes = response.json
+        else:
+            changes = response.json()
+        return changes['cursor'], changes['tasks'], \
+            [str(web_id) for web_id in changes['deleted']]
+    
+    def process_changes(self, remote_tasks, deleted_web_ids, local_changes):
+        """
+        Incremental version of process_tasks: only the tasks changed since
+        the previous import are looked at.
+
+        @param remote_tasks: the tasks changed on the server
+        @param deleted_web_ids: the remote ids of the tasks deleted on the
+                                server
+        @param local_changes: the changes of the datastore, as returned by
+                              get_changes_since
+        """
+        # the local tasks already synced with the remote changes
+        synced = set()
+        remote_updates = []
+        new_remote_tasks = {}
+        for remote_task in remote_tasks:
+            web_id = str(remote_task['id'])
+            if self.hash_dict.get_local_id(web_id) is None:
+                new_remote_tasks[web_id] = remote_task
+        # as in process_tasks, the new tasks are created before the updates,
+        # so that the new subtasks of the updated tasks can be found
+        self.process_local_new_scenario(new_remote_tasks.keys(),
+                                        new_remote_tasks)
+        for remote_task in remote_tasks:
+            web_id = str(remote_task['id'])
+            if web_id in new_remote_tasks:
+                continue
+            tid = self.hash_dict.get_local_id(web_id)
+            if tid is not None and self.datastore.has_task(tid):
+                synced.add(tid)
+                self.process_update_scenario(self.datastore.get_task(tid),
+                                             remote_task,
+                                             self.hash_dict.get_hash(tid),
+                                             remote_updates)
+        
+        for web_id in deleted_web_ids:
+            tid = self.hash_dict.get_local_id(web_id)
+            if tid is None:
+                continue
+            synced.add(tid)
+            self.hash_dict.remove_local_id(tid)
+            if self.datastore.has_task(tid):
+                self.send_task_for_deletion(self.datastore.get_task(tid))
+        
+        remote_add = []
+        deleted_local_tasks = []
+        local_changes = list(local_changes) + \
+            [(None, ChangeFeed.MODIFIED, tid) for tid in self._failed_updates]
+        self._failed_updates = set()
+        for seq, action, tid in local_changes:
+            if tid in synced:
+                continue
+            if action == ChangeFeed.DELETED or \
+                    not self.datastore.has_task(tid):
+                if self.hash_dict.has_local_id(tid):
+                    deleted_local_tasks.append(tid)
+                continue
+            gtg_task = self.datastore.get_task(tid)
+            if not self._gtg_task_is_syncable_per_attached_tags(gtg_task):
+                continue
+            task_hash, web_id = self.get_or_save_hash(tid,
+                                                      task_object = gtg_task)
+            if web_id is None:
+                remote_add.append(gtg_task)
+                continue
+            local_hash = self.compute_task_hash(gtg_task)
+            if local_hash != task_hash:
+                remote_updates.append((gtg_task, web_id, task_hash))
+                self.hash_dict.set_hash(tid, local_hash)
+        failed = self.remote_update_tasks(remote_updates)
+        self._failed_updates.update(task.get_id() for task in failed)
+        if remote_add:
+            id_dict = self.remote_add_tasks(
+                self.modify_tasks_for_gtgonline(remote_add))
+            self.add_remote_id_to_sync_details(id_dict)
+            # the tasks the server didn't add are sent again at the next
+            # import
+            self._failed_updates.update(task.get_id() for task in remote_add
+                                        if task.get_id() not in id_dict)
+        if deleted_local_tasks:
+            self.process_remote_delete_scenario(deleted_local_tasks)
     
     def process_tasks(self, fetched_remote_tasks):
         """
@@ -249,40 +528,49 @@ class Backend(PeriodicImportBackend):
                 #print "NOT SYNCABLE = " + gtg_task.get_title()
                 continue
             
-            sync_details = self.hash_dict.get(tid, [None, None])
-            if sync_details[1] == None:
+            if self.hash_dict.get_remote_id(tid) == None:
                 remote_add.append(gtg_task)
-                self.get_or_save_hash(tid)
                 gtg_task.sync()
+                self.get_or_save_hash(tid)
             else:
                 old_local_tasks.append(gtg_task)
         
         remote_add = self.modify_tasks_for_gtgonline(remote_add)
         id_dict = self.remote_add_tasks(remote_add)
         self.add_remote_id_to_sync_details(id_dict)
+        # the tasks the server didn't add are sent again at the next import
+        self._failed_updates.update(tid for tid in remote_add
+                                    if tid not in id_dict)
         #print "Id dict = " + str(id_dict)
         
-        remote_ids_in_hash_dict = [i[1] for i in self.hash_dict.values()]
-        
-        new_remote_tasks = list(set(server_id_dict.keys()) - \
-                                set(remote_ids_in_hash_dict))
-        deleted_local_tasks = list(set(self.hash_dict.keys()) - set(local_tasks))
+        new_remote_tasks = [web_id for web_id in server_id_dict
+                            if self.hash_dict.get_local_id(web_id) is None]
+        deleted_local_tasks = list(set(self.hash_dict.get_all_local()) - \
+                                   set(local_tasks))
+        for tid in set(self._local_hashes).difference(local_tasks):
+            del self._local_hashes[tid]
+        for tid in set(self._sent_field_versions).difference(local_tasks):
+            del self._sent_field_versions[tid]
         self.process_local_new_scenario(new_remote_tasks, server_id_dict)
         self.process_remote_delete_scenario(deleted_local_tasks)
         
+        remote_updates = []
         for gtg_task in old_local_tasks:
-            sync_details = self.hash_dict.get(gtg_task.get_id(), [None, None])
-            remote_id = sync_details[1]
+            remote_id = self.hash_dict.get_remote_id(gtg_task.get_id())
             remote_ids_list.append(remote_id)
-            if remote_id in server_id_dict.keys():
+            if remote_id in server_id_dict:
                 #print "Sending task to update scenario"
+                task_hash = self.hash_dict.get_hash(gtg_task.get_id())
                 self.process_update_scenario(gtg_task, \
                                              server_id_dict[remote_id], \
-                                             sync_details[0])
+                                             task_hash, remote_updates)
             else:
                 local_delete.append(gtg_task)
                 self.send_task_for_deletion(gtg_task)
-            gtg_task.sync()
+        # the failed updates are sent again at the next full import, as
+        # their hash has been restored
+        self.remote_update_tasks(remote_updates)
+        self._failed_updates = set()
         
         #print "*\n*\nRemote Tasks list = " + str(new_remote_tasks) + "\n*\n*\n"
         #print "*\n*\nOld Local tasks list = " + str(old_local_tasks) + "\n*\n*\n"
@@ -324,21 +612,28 @@ class Backend(PeriodicImportBackend):
         A task list is sent to the server for creation and the server returns
         a dictionary containing Remote task ids of the created tasks as keys
         and Local ids of those tasks as values. This dict is then used to
-        update the hash dictionary ( register the task as synced )
+        update the hash dictionary ( register the task as synced ). If the
+        server fails, an empty dict is returned.
         """
         #print "Adding tasks started ..."
         #print "Task list to send = " + json.dumps(task_list)
-        params = {
-            "email": self._parameters["username"],
-            "password": self._parameters["password"],
-            "task_list": json.dumps(task_list),
-        }
-        ids = requests.post(self.URLS['tasks']['new'], \
-                            data = { key: str(value) for key, value in params.items() })
-        #print "ids received = " + str(ids.json)
-        if not self.IS_REQUESTS_LATEST:
-            return ids.json
-        return ids.json()
+        params = {"task_list": json.dumps(task_list),}
+        response = self._post(self.URLS['tasks']['new'], params)
+        if response.status_code != 200:
+            Log.warning("%s: the server answered %s when adding tasks" %
+                        (self.get_id(), response.status_code))
+            return {}
+        try:
+            ids = json.loads(response.text)
+        except ValueError:
+            ids = None
+        if not isinstance(ids, dict):
+            # the tasks are not synced yet: they're sent again at the next
+            # import
+            Log.warning("%s: unexpected answer when adding tasks" %
+                        self.get_id())
+            return {}
+        return ids
     
     def add_remote_id_to_sync_details(self, id_dict):
         """
@@ -347,23 +642,30 @@ class Backend(PeriodicImportBackend):
         """
         for key, value in id_dict.iteritems():
             
-            self.hash_dict[key][1] = value
+            self.hash_dict.set_remote_id(key, str(value))
             
             #with self.datastore.get_backend_mutex():
                 #gtg_task = self.datastore.get_task(key)
                 #gtg_task.add_remote_id(self.get_id(), value)
                 #self.datastore.push_task(gtg_task)
     
-    def process_update_scenario(self, local_task, remote_task, task_hash):
+    def process_update_scenario(self, local_task, remote_task, task_hash, \
+                                remote_updates = None):
         """
         This method takes input a local task, remote task and the latest hash
         from hash dictionary. Both the tasks are hashed and compared with the
-        latest hash and this way it is decided which one to update
+        latest hash and this way it is decided which one to update.
+        If remote_updates is given, the remote update is appended to it, to
+        be sent later with remote_update_tasks
         """
         task = self.get_latest_task(local_task, remote_task, task_hash)
         if task == local_task:
             #print "Sent remote task to update"
-            self.remote_update_task(local_task, remote_task['id'])
+            update = (local_task, remote_task['id'], task_hash)
+            if remote_updates is None:
+                self.remote_update_tasks([update])
+            else:
+                remote_updates.append(update)
         elif task == remote_task:
             #print "Send local task to update"
             self.local_update_task(remote_task, local_task)
@@ -383,15 +685,15 @@ class Backend(PeriodicImportBackend):
             return None
         elif local_hash != task_hash and remote_hash == task_hash:
             #print "Local is Latest. Update Remote"
-            self.hash_dict[local_id][0] = local_hash
+            self.hash_dict.set_hash(local_id, local_hash)
             return local_task
         elif local_hash == task_hash and remote_hash != task_hash:
             #print "Remote is Latest. Update Local"
-            self.hash_dict[local_id][0] = remote_hash
+            self.hash_dict.set_hash(local_id, remote_hash)
             return remote_task
         else:
             #print "BOTH HASHES ARE DIFFERENT, Update local"
-            self.hash_dict[local_id][0] = remote_hash
+            self.hash_dict.set_hash(local_id, remote_hash)
             return remote_task
         
         '''
@@ -408,37 +710,127 @@ class Backend(PeriodicImportBackend):
         '''
     
     def remote_update_task(self, task, task_id):
+        """
+        "Remote Update" implementation, for a single task.
+
+        @returns bool: True if the server has updated the task
+        """
+        task_hash = self.hash_dict.get_hash(task.get_id())
+        return not self.remote_update_tasks([(task, task_id, task_hash)])
+    
+    def get_task_update_details(self, task, task_id, fields = None):
+        """
+        Returns the details sent to the server to update a remote task
+
+        @param fields: the Task.FIELD_* values of the fields to send, or None
+                       to send all of them
+        """
+        def changed(*names):
+            return fields is None or fields.intersection(names)
+        
+        details = {"task_id": task_id}
+        if changed(Task.FIELD_TITLE):
+            details["name"] = task.get_title()
+        # the tags are part of the description
+        if changed(Task.FIELD_CONTENT, Task.FIELD_TAGS):
+            details["description"] = self.strip_xml_tags(task.get_text())
+        if changed(Task.FIELD_DATES):
+            details["start_date"] = self.convert_date_to_str(
+                task.get_start_date().date())
+            details["due_date"] = self.convert_date_to_str(
+                task.get_due_date().date())
+        if changed(Task.FIELD_STATUS):
+            details["status"] = task.get_status()
+        if changed(Task.FIELD_CHILDREN):
+            details["subtask_ids"] = self.get_subtask_remote_ids(task)
+        return details
+    
+    def _get_unsent_fields(self, task, versions):
+        """
+        Returns the fields of a task modified since it was last sent to the
+        server, or None if it has not been sent since GTG started
+
+        @param versions: the current field versions of the task
+        """
+        sent = self._sent_field_versions.get(task.get_id())
+        if sent is None:
+            return None
+        return set(field for field, version in versions.iteritems()
+                   if sent.get(field) != version)
+    
+    def remote_update_tasks(self, updates):
         """
         "Remote Update" implementation.
-        A dictionary with remote task ids as keys and the new details as values
-        is sent to the server. Server returns '1' on success and '0' on failure
-        """
-        #print "Updating remote task started ..."
-        start_date = self.convert_date_to_str(task.get_start_date().date())
-        due_date = self.convert_date_to_str(task.get_due_date().date())
-        #print "Due Date = " + str(due_date)
-        #print "Is due date fuzzy ? = " + str(task.get_due_date().is_fuzzy())
-        task_list = [
-            {
-                "task_id": task_id,
-                "name": task.get_title(),
-                "description": self.strip_xml_tags(task.get_text()),
-                "start_date": start_date,
-                "due_date": due_date,
-                "status": task.get_status(),
-                "subtask_ids": self.get_subtask_remote_ids(task),
-            }
-        ]
+        The updates are sent to tasks/bulk_update/ in chunks of "update
+        chunk size" tasks. The server answers, for each task, 1 on
+        success and 0 on failure (or a single '1' or '0' for the whole
+        chunk). The hash of a task which could not be updated is restored,
+        so that the update is tried again at the next import.
+
+        @param updates: a list of (local task, remote id, hash of the task
+                        before the update)
+        @returns list: the local tasks which could not be updated
+        """
+        failed = []
+        chunk_size = max(1, int(self._parameters.get("update chunk size",
+                                                     UPDATE_CHUNK_SIZE)))
+        for start in xrange(0, len(updates), chunk_size):
+            chunk = updates[start:start + chunk_size]
+            task_list = []
+            versions = {}
+            for task, task_id, task_hash in chunk:
+                task_versions = task.get_field_versions()
+                details = self.get_task_update_details(
+                    task, task_id, self._get_unsent_fields(task, task_versions))
+                if None in details.get("subtask_ids", ()):
+                    # some subtasks are not on the server yet: the subtasks
+                    # will be sent again
+                    task_versions.pop(Task.FIELD_CHILDREN, None)
+                versions[task.get_id()] = task_versions
+                task_list.append(details)
+            results = self._post_task_updates(task_list)
+            for task, task_id, task_hash in chunk:
+                if results.get(str(task_id)):
+                    self._sent_field_versions[task.get_id()] = \
+                        versions[task.get_id()]
+                    continue
+                failed.append(task)
+                if self.hash_dict.has_local_id(task.get_id()):
+                    self.hash_dict.set_hash(task.get_id(), task_hash)
+        if failed:
+            Log.error("%s: %d tasks could not be updated on the server" %
+                      (self.get_id(), len(failed)))
+        return failed
+    
+    def _post_task_updates(self, task_list):
+        """
+        Sends a chunk of updates to the server
+
+        @returns dict: {remote id: True if the task has been updated}
+        """
         params = {
-            "email": self._parameters["username"],
-            "password": self._parameters["password"],
             "task_list": json.dumps(task_list),
             "origin": "gtg",
         }
-        response = requests.post(self.URLS['tasks']['update'], params)
-        
-        #print "Update response = " + str(response.json)
-        return
+        response = self._post(self.URLS['tasks']['update'], params)
+        if response.status_code != 200:
+            return {}
+        try:
+            results = json.loads(response.text)
+        except ValueError:
+            results = None
+        if isinstance(results, dict):
+            successes = {}
+            for task_id, result in results.iteritems():
+                try:
+                    successes[str(task_id)] = bool(int(result))
+                except (TypeError, ValueError):
+                    # an unexpected answer: the update is tried again
+                    successes[str(task_id)] = False
+            return successes
+        success = response.text.strip() == '1'
+        return dict((str(details["task_id"]), success)
+                    for details in task_list)
     
     def get_subtask_remote_ids(self, local_task):
         """
@@ -448,8 +840,8 @@ class Backend(PeriodicImportBackend):
         #print "Subtasks of local task = " + str(local_subtask_ids)
         remote_subtask_ids = []
         for task in local_subtask_ids:
-            remote_subtask_ids.append(self.hash_dict.get(task.get_id(), \
-                                                         None)[1])
+            remote_subtask_ids.append(
+                self.hash_dict.get_remote_id(task.get_id()))
         #print "Remote Subtask Ids = " + str(remote_subtask_ids)
         return remote_subtask_ids
     
@@ -504,9 +896,10 @@ class Backend(PeriodicImportBackend):
         #print "Remote_subtasks = " + str(remote_subtasks)
         remote_subtask_local_id = []
         
-        for key, value in self.hash_dict.iteritems():
-            if value[1] in remote_subtasks:
-                remote_subtask_local_id.append(key)
+        for web_id in remote_subtasks:
+            local_id = self.hash_dict.get_local_id(str(web_id))
+            if local_id is not None:
+                remote_subtask_local_id.append(local_id)
         
         #print "Local Subtasks = " + str(list(local_subtasks))
         #print "Remote subtask local id = " + str(remote_subtask_local_id)
@@ -538,36 +931,34 @@ class Backend(PeriodicImportBackend):
         for key, value in local_tasks_dict.iteritems():
             remote_subtask_ids = remote_task_dict[key]["subtasks"]
             #print "Remote subtask Ids = " + str(remote_subtask_ids)
+            # with an incremental import, the subtasks may be old tasks
             local_subtask_ids = [local_tasks_dict[str(task_id)].get_id() \
-                                 for task_id in remote_subtask_ids]
+                                 for task_id in remote_subtask_ids \
+                                 if str(task_id) in local_tasks_dict]
             #print "Local subtask ids = " + str(local_subtask_ids)
             for local_id in local_subtask_ids:
                 value.add_child(local_id)
-            self.datastore.push_task(value)
+        self.datastore.push_tasks(local_tasks_dict.values())
             
     
     def process_remote_delete_scenario(self, local_ids):
         ids_to_be_deleted = []
         for task_id in local_ids:
-            web_id = self.hash_dict.get(task_id, [None, None])[1]
+            web_id = self.hash_dict.get_remote_id(task_id)
             #print "web_id = " + str(web_id)
             if web_id != None:
                 ids_to_be_deleted.append(web_id)
-                self.hash_dict.pop(task_id, None)
+                self.hash_dict.remove_local_id(task_id)
         self.remote_delete_task(ids_to_be_deleted)
     
     def remote_delete_task(self, web_id_list):
         #print "Deleting remote tasks started ..." + str(web_id_list)
-        params = {"email": self._parameters["username"],
-                  "password": self._parameters["password"],
-                  "task_id_list": json.dumps(web_id_list), "origin": "gtg",}
-        tags = requests.post(self.URLS['tasks']['delete'], params)
+        params = {"task_id_list": json.dumps(web_id_list), "origin": "gtg",}
+        self._post(self.URLS['tasks']['delete'], params)
     
     def fetch_tags_from_server(self, ):
         #print "Fetching tags started ..."
-        params = {"email": self._parameters["username"],
-                  "password": self._parameters["password"],}
-        tags = requests.post(self.URLS['tags'], params)
+        tags = self._post(self.URLS['tags'], {})
         #print "response received = " + str(tags.json)
         return tags.json()
     
@@ -624,6 +1015,13 @@ class Backend(PeriodicImportBackend):
             return current_due_date
         return due_date
     
+    def set_task_fields(self, task, fields):
+        """
+        Only the changes of the synchronized fields need to be saved
+        """
+        if fields is None or fields & self.SYNCED_FIELDS:
+            self.set_task(task)
+    
     def set_task(self, task):
         #print "BACKEND_GTGONLINE : Set task was called"
         #task.sync()
@@ -635,27 +1033,32 @@ class Backend(PeriodicImportBackend):
         Searches hash dictionary if a task is present or not.
         If not, it creates it.
         If you know the remote id of the task, give it in keyword arg 'web_id'
+
+        @returns tuple: (hash, remote id or None)
         """
-        task_hash_list = self.hash_dict.get(task_id, None)
-        #print "Task hash list = " + str(task_hash_list)
-        if task_hash_list == None:
-            if task_object != None:
-                task = task_object
-            else:
-                task = self.datastore.get_task(task_id)
-            #print "For task_id = " + str(task_id) + " task = " + str(task)
-            task_hash = self.compute_task_hash(task, mode = self.LOCAL)
-            #remote_ids = task.get_remote_ids()
-            #web_id = remote_ids.get(self.get_id(), None)
-            task_hash_list = [task_hash, web_id]
-            self.hash_dict[task_id] = task_hash_list
-        return task_hash_list
+        if self.hash_dict.has_local_id(task_id):
+            return self.hash_dict.get_hash(task_id), \
+                self.hash_dict.get_remote_id(task_id)
+        if task_object != None:
+            task = task_object
+        else:
+            task = self.datastore.get_task(task_id)
+        #print "For task_id = " + str(task_id) + " task = " + str(task)
+        task_hash = self.compute_task_hash(task, mode = self.LOCAL)
+        #remote_ids = task.get_remote_ids()
+        #web_id = remote_ids.get(self.get_id(), None)
+        self.hash_dict.set_hash(task_id, task_hash)
+        if web_id is not None:
+            self.hash_dict.set_remote_id(task_id, web_id)
+        return task_hash, web_id
     
     def compute_task_hash(self, task, mode = None):
         """
         Computes the hash of a task.
         Requires task name, description, start date, due date, status and
-        no. of subtasks
+        no. of subtasks.
+        The hash of a local task is cached, and computed again only if the
+        task has been modified since.
         """
         if mode == self.REMOTE:
             in_str = task['name']
@@ -664,11 +1067,19 @@ class Backend(PeriodicImportBackend):
             in_str += task['due_date']
             in_str += self.WEB_STATUS_TO_GTG.get(task['status'], 'Active')
             in_str += str(len(task['subtasks']))
-        else:
-            in_str = task.get_title()
-            in_str += self.strip_xml_tags(task.get_text())
-            in_str += self.convert_date_to_str(task.get_start_date().date())
-            in_str += self.convert_date_to_str(task.get_due_date().date())
-            in_str += task.get_status()
-            in_str += str(len(task.get_subtasks()))
-        return md5(in_str).hexdigest()
+            return md5(in_str).hexdigest()
+        # set_text doesn't change the modified date, but every change of a
+        # field is counted in the field versions
+        state = (task.get_modified(), task.get_field_versions())
+        cached = self._local_hashes.get(task.get_id())
+        if cached is not None and cached[0] == state:
+            return cached[1]
+        in_str = task.get_title()
+        in_str += self.strip_xml_tags(task.get_text())
+        in_str += self.convert_date_to_str(task.get_start_date().date())
+        in_str += self.convert_date_to_str(task.get_due_date().date())
+        in_str += task.get_status()
+        in_str += str(len(task.get_subtasks()))
+        task_hash = md5(in_str).hexdigest()
+        self._local_hashes[task.get_id()] = (state, task_hash)
+        return task_hash
@@ -155,10 +155,12 @@ class Backend(PeriodicImportBackend):
                                                             "Triaged",
                                                             "In Progress",
                                                             "Fix Committed"])
-        # Adding and updating
+        # Adding and updating. The new tasks are pushed all at once.
+        new_tasks = []
         for bug_task in my_bugs_tasks:
             self.cancellation_point()
-            self._process_launchpad_bug(bug_task)
+            self._process_launchpad_bug(bug_task, new_tasks)
+        self._push_new_tasks(new_tasks)
 
         # removing the old ones
         last_bug_list = self.sync_engine.get_all_remote()
@@ -182,7 +184,7 @@ class Backend(PeriodicImportBackend):
 ###############################################################################
 ### Process tasks #############################################################
 ###############################################################################
-    def _process_launchpad_bug(self, bug):
+    def _process_launchpad_bug(self, bug, new_tasks=None):
         '''
         Given a bug object, finds out if it must be synced to a GTG note and,
         if so, it carries out the synchronization (by creating or
@@ -190,6 +192,10 @@ class Backend(PeriodicImportBackend):
         been deleted)
 
         @param note: a launchpad bug
+        @param new_tasks: if given, the new tasks are appended to this list
+                          instead of being pushed in the datastore, as
+                          (task, remote id, meme). Their relationship must
+                          be recorded once they're pushed.
         '''
         has_task = self.datastore.has_task
         action, tid = self.sync_engine.analyze_remote_id(bug.self_link,
@@ -206,21 +212,23 @@ class Backend(PeriodicImportBackend):
         # To be sure of that, set bug to None
         bug = None
 
-        with self.datastore.get_backend_mutex():
-            if action == SyncEngine.ADD:
+        if action == SyncEngine.ADD:
+            with self.datastore.get_backend_mutex():
                 tid = str(uuid.uuid4())
                 task = self.datastore.task_factory(tid)
                 self._populate_task(task, bug_dic)
-                self.sync_engine.record_relationship(local_id=tid,
-                                                     remote_id=str(
-                                                     bug_dic['self_link']),
-                                                     meme=SyncMeme(
-                                                     task.get_modified(),
-                                                     bug_dic['modified'],
-                                                     self.get_id()))
-                self.datastore.push_task(task)
+                meme = SyncMeme(task.get_modified(), bug_dic['modified'],
+                                self.get_id())
+                remote_id = str(bug_dic['self_link'])
+                if new_tasks is None:
+                    self.sync_engine.record_relationship(
+                        local_id=tid, remote_id=remote_id, meme=meme)
+                    self.datastore.push_task(task)
+                else:
+                    new_tasks.append((task, remote_id, meme))
 
-            elif action == SyncEngine.UPDATE:
+        elif action == SyncEngine.UPDATE:
+            with self.datastore.get_task_mutex(tid):
                 task = self.datastore.get_task(tid)
                 self._populate_task(task, bug_dic)
                 meme = self.sync_engine.get_meme_from_remote_id(
@@ -26,14 +26,29 @@ wants to write a backend.
 '''
 
 import os
+import threading
+import xml.dom.minidom
+import xml.sax
 
 from GTG import _
 from GTG.backends.genericbackend import GenericBackend
 from GTG.core import CoreConfig
-from GTG.tools import cleanxml, taskxml
+from GTG.core.task import Task, LazyTask
+from GTG.tools import cleanxml, taskxml, tasksnapshot
+from GTG.tools.logger import Log
+from GTG.tools.savescheduler import SaveScheduler, SAVE_INTERVAL, \
+    SAVE_MAX_DELAY
+from GTG.tools.taskjournal import TaskJournal
+from GTG.tools.taskshards import ShardedTaskFile
 
 # Ignore all other elements but this one
 TASK_NODE = "task"
+# In journal mode, the journal is folded in the XML file once it holds this
+# many records
+JOURNAL_COMPACTION_THRESHOLD = 500
+# Tasks are pushed in GTG core by batches of this many tasks, so that the
+# first ones show up before the whole file has been read
+PUSH_BATCH_SIZE = 200
 
 
 class Backend(GenericBackend):
@@ -68,11 +83,35 @@ class Backend(GenericBackend):
     # parameter has a name, a type and a default value.
     # Here, we define a parameter "path", which is a string, and has a default
     # value as a random file in the default path
+    # If "path" is a directory (or ends with a "/"), the tasks are stored in
+    # several XML files (shards) in that directory: only the modified shards
+    # are written.
+    # The "journal" parameter enables the journal mode: modifications are
+    # appended to a small journal file instead of rewriting the whole XML file
+    # every time.
+    # The "snapshot" parameter enables a binary snapshot of the tasks, written
+    # when GTG quits, which is loaded instead of the XML file if the XML file
+    # hasn't changed since.
+    # Out of journal mode, the XML file is written once it hasn't been
+    # modified for "save interval" seconds, or "save max delay" seconds after
+    # a modification at most.
     _static_parameters = {
         "path": {
             GenericBackend.PARAM_TYPE: GenericBackend.TYPE_STRING,
             GenericBackend.PARAM_DEFAULT_VALUE:
-            "gtg_tasks.xml"}}
+            "gtg_tasks.xml"},
+        "journal": {
+            GenericBackend.PARAM_TYPE: GenericBackend.TYPE_BOOL,
+            GenericBackend.PARAM_DEFAULT_VALUE: False},
+        "snapshot": {
+            GenericBackend.PARAM_TYPE: GenericBackend.TYPE_BOOL,
+            GenericBackend.PARAM_DEFAULT_VALUE: False},
+        "save interval": {
+            GenericBackend.PARAM_TYPE: GenericBackend.TYPE_INT,
+            GenericBackend.PARAM_DEFAULT_VALUE: SAVE_INTERVAL},
+        "save max delay": {
+            GenericBackend.PARAM_TYPE: GenericBackend.TYPE_INT,
+            GenericBackend.PARAM_DEFAULT_VALUE: SAVE_MAX_DELAY}}
 
     def __init__(self, parameters):
         """
@@ -94,10 +133,36 @@ class Backend(GenericBackend):
         if not self.KEY_DEFAULT_BACKEND in parameters:
             parameters[self.KEY_DEFAULT_BACKEND] = True
 
-        self.doc, self.xmlproj = cleanxml.openxmlfile(
-            self.get_path(), "project")
-        # Make safety daily backup after loading
-        cleanxml.savexml(self.get_path(), self.doc, backup=True)
+        # Protects self.doc, which is saved by the compaction thread while
+        # the setting thread modifies it
+        self._doc_lock = threading.RLock()
+        self._compaction_thread = None
+        if self.is_sharded():
+            self.journal = TaskJournal(os.path.join(self.get_path(),
+                                                    "journal"))
+        else:
+            self.journal = TaskJournal(self.get_path() + ".journal")
+        self._save_scheduler = SaveScheduler(
+            self._write_xml_file,
+            parameters.get("save interval", SAVE_INTERVAL),
+            parameters.get("save max delay", SAVE_MAX_DELAY))
+        self._backup_pending = False
+        # The XML file is read when the backend is enabled (see initialize and
+        # start_get_tasks)
+        self.doc = None
+        self.xmlproj = None
+        self._task_nodes = {}
+        # in sharded mode, the ShardedTaskFile and a dictionary
+        # {tid: shard holding the task}. self.doc is then only used to create
+        # nodes.
+        self._shards = None
+        self._task_shards = {}
+        # dictionary {tid: digest of the task as last written}, see set_task
+        self._task_digests = {}
+        self._task_stream = None
+        # the snapshot holding the tasks to push, when they are loaded from a
+        # snapshot
+        self._snapshot = None
 
     def get_path(self):
         """
@@ -112,11 +177,251 @@ class Backend(GenericBackend):
             path = os.path.join(data_dir, path)
         return os.path.abspath(path)
 
+    def is_sharded(self):
+        """
+        Returns True if the tasks are stored in a directory of shards instead
+        of a single XML file
+        """
+        return self._parameters["path"].endswith(os.sep) or \
+            os.path.isdir(self.get_path())
+
+    def is_journal_enabled(self):
+        """
+        Returns True if modifications are appended to the journal instead of
+        being written directly into the XML file
+        """
+        return self._parameters.get("journal", False)
+
+    def is_snapshot_enabled(self):
+        """
+        Returns True if the tasks are loaded from a snapshot when possible.
+        Snapshots are not supported in sharded mode.
+        """
+        return self._parameters.get("snapshot", False) and \
+            not self.is_sharded()
+
+    def get_snapshot_path(self):
+        """
+        Return the path of the snapshot of the XML file
+        """
+        return self.get_path() + ".snapshot"
+
     def initialize(self):
         """ This is called when a backend is enabled """
         super(Backend, self).initialize()
+        self._task_nodes = {}
+        self._task_digests = {}
+        if os.path.exists(self.journal.path):
+            # A journal is left over from the last run: its records must be
+            # applied on the whole document before pushing any task, so the
+            # file is not streamed. We fold the journal and make the safety
+            # daily backup right away.
+            self._load_xml_file()
+            self._replay_journal()
+            if self._write_tasks(backup=True):
+                self.journal.truncate()
+            return
+        if self.is_snapshot_enabled():
+            self._snapshot = tasksnapshot.load_snapshot(
+                self.get_snapshot_path(), self.get_path())
+        if self._snapshot is not None:
+            # The XML file is parsed only when a task is first written
+            self.doc = None
+            self.xmlproj = None
+        elif self.is_sharded():
+            # The shards are parsed in parallel in start_get_tasks
+            self._open_shards()
+            self._task_stream = self._stream_shards()
+        else:
+            # The task nodes are parsed one at a time in start_get_tasks
+            self.doc, self.xmlproj, self._task_stream = \
+                cleanxml.streamxmlfile(self.get_path(), "project", TASK_NODE)
+
+    def _replay_journal(self):
+        """
+        Applies the records of the journal on top of the loaded XML file.
+
+        @returns bool: True if some record has been applied
+        """
+        records = self.journal.replay()
+        for op, tid, task_xml in records:
+            if op == TaskJournal.OP_REMOVE:
+                self._remove_task_node(tid)
+                continue
+            try:
+                node = xml.dom.minidom.parseString(
+                    task_xml.encode("utf-8")).documentElement
+            except xml.parsers.expat.ExpatError, msg:
+                Log.warning("Skipping damaged journal record for %s: %s" %
+                            (tid, msg))
+                continue
+            self._set_task_node(tid, self.doc.importNode(node, True))
+        return len(records) > 0
+
+    def _load_xml_file(self):
+        """
+        Loads the XML file in self.doc (or all the shards) and indexes the
+        task nodes by task id
+        """
+        # dictionary {tid: task XML node}, so that finding the node of a task
+        # doesn't require scanning the whole document
+        self._task_nodes = {}
+        if self.is_sharded():
+            self._open_shards()
+            for node in self._stream_shards():
+                self._task_nodes[node.getAttribute("id")] = node
+            return
         self.doc, self.xmlproj = cleanxml.openxmlfile(
             self.get_path(), "project")
+        for node in self.xmlproj.childNodes:
+            if node.nodeName == TASK_NODE:
+                self._task_nodes[node.getAttribute("id")] = node
+
+    def _open_shards(self):
+        """
+        Prepares the sharded mode. The shards are read by _stream_shards.
+        """
+        self._shards = ShardedTaskFile(self.get_path(), "project", TASK_NODE)
+        self._task_shards = {}
+        # the task nodes are in the shards, not in xmlproj
+        self.doc = cleanxml.emptydoc("project")[0]
+        self.xmlproj = None
+
+    def _stream_shards(self):
+        """
+        Yields the task nodes of the shards, as soon as each shard is parsed
+        """
+        for shard in self._shards.load():
+            for node in shard.get_task_nodes():
+                self._task_shards[node.getAttribute("id")] = shard
+                yield node
+
+    def _iter_task_nodes(self):
+        """
+        Yields all the task nodes, in the order they are stored
+        """
+        if self._shards is not None:
+            for node in self._shards.iter_task_nodes():
+                yield node
+            return
+        for node in self.xmlproj.childNodes:
+            if node.nodeName == TASK_NODE:
+                yield node
+
+    def _set_task_node(self, tid, node):
+        """
+        Puts a task node in the document, replacing the previous node of the
+        same task if there is one.
+        NOTE: the previous node is updated in place, since minidom's
+              replaceChild looks for the node in the whole document.
+
+        @param tid: the task id
+        @param node: the new XML node of the task. Its content is moved in
+                     the previous node, if there is one.
+        @returns: the XML node of the task which is in the document
+        """
+        existing = self._task_nodes.get(tid, None)
+        if existing is None:
+            if self._shards is not None:
+                self._task_shards[tid] = self._shards.add_task_node(node)
+            else:
+                self.xmlproj.appendChild(node)
+            self._task_nodes[tid] = node
+            return node
+        if self._shards is not None:
+            self._task_shards[tid].dirty = True
+        for name in existing.attributes.keys():
+            existing.removeAttribute(name)
+        for name, value in node.attributes.items():
+            existing.setAttribute(name, value)
+        while existing.firstChild:
+            existing.removeChild(existing.firstChild)
+        while node.firstChild:
+            existing.appendChild(node.firstChild)
+        return existing
+
+    def _remove_task_node(self, tid):
+        """
+        Removes the node of a task from the document.
+
+        @param tid: the task id
+        @returns bool: True if the task was in the document
+        """
+        existing = self._task_nodes.pop(tid, None)
+        self._task_digests.pop(tid, None)
+        if existing:
+            if self._shards is not None:
+                self._shards.remove_task_node(self._task_shards.pop(tid),
+                                              existing)
+            else:
+                self.xmlproj.removeChild(existing)
+            return True
+        return False
+
+    def _save_modifications(self, tid, t_xml=None, backup=False):
+        """
+        Makes a modification of self.doc persistent. In journal mode, the
+        modification is appended to the journal, otherwise the whole XML file
+        is written by the save scheduler, which coalesces the modifications
+        done in a short time.
+
+        @param tid: the modified task id
+        @param t_xml: the new XML node of the task, or None if the task has
+                      been removed
+        @param backup: whether to backup the XML file when writing it
+        """
+        if not self.is_journal_enabled():
+            if backup:
+                self._backup_pending = True
+            self._save_scheduler.mark_dirty()
+            return
+        if t_xml is None:
+            self.journal.append_remove(tid)
+        else:
+            self.journal.append_set(tid, t_xml.toxml())
+        if self.journal.records >= JOURNAL_COMPACTION_THRESHOLD and \
+                self._compaction_thread is None:
+            self._compaction_thread = threading.Thread(
+                target=self._compact_journal)
+            self._compaction_thread.setDaemon(True)
+            self._compaction_thread.start()
+
+    def _write_tasks(self, backup=False):
+        """
+        Writes the whole XML file or, in sharded mode, the modified shards
+
+        @param backup: whether to backup the written files
+        @returns bool: True if everything has been written
+        """
+        if self._shards is not None:
+            return self._shards.write(backup=backup)
+        return cleanxml.savexml(self.get_path(), self.doc, backup=backup)
+
+    def _write_xml_file(self):
+        """
+        Writes the XML file (or shards). Called by the save scheduler.
+
+        @returns bool: True if the file has been written
+        """
+        with self._doc_lock:
+            backup, self._backup_pending = self._backup_pending, False
+            if not self._write_tasks(backup=backup):
+                self._backup_pending = self._backup_pending or backup
+                return False
+            if self.journal.records > 0:
+                # the journal mode has been switched off while running
+                self.journal.truncate()
+            return True
+
+    def _compact_journal(self):
+        """
+        Folds the journal in the XML file: the XML file is written and the
+        journal is emptied.
+        """
+        with self._doc_lock:
+            if self._write_tasks():
+                self.journal.truncate()
+            self._compaction_thread = None
 
     def this_is_the_first_run(self, xml):
         """ Called upon the very first GTG startup.
@@ -127,9 +432,18 @@ class Backend(GenericBackend):
         @param xml: an xml object containing the default tasks.
         """
         self._parameters[self.KEY_DEFAULT_BACKEND] = True
-        cleanxml.savexml(self.get_path(), xml)
-        self.doc, self.xmlproj = cleanxml.openxmlfile(
-            self.get_path(), "project")
+        self._task_stream = None
+        if self.is_sharded():
+            with self._doc_lock:
+                self._load_xml_file()
+                for node in xml.getElementsByTagName(TASK_NODE):
+                    self._set_task_node(node.getAttribute("id"),
+                                        self.doc.importNode(node, True))
+                self._write_tasks()
+        else:
+            cleanxml.savexml(self.get_path(), xml)
+            self._load_xml_file()
+        self.journal.truncate()
 
     def start_get_tasks(self):
         """ This function starts submitting the tasks from the XML file into
@@ -137,14 +451,142 @@ class Backend(GenericBackend):
 
         @return: start_get_tasks() might not return or finish
         """
-        for node in self.xmlproj.childNodes:
-            if node.nodeName != TASK_NODE:
+        with self._doc_lock:
+            if self._snapshot is not None:
+                snapshot, self._snapshot = self._snapshot, None
+                dates = {}
+                self._push_tasks(self._task_from_record(record, snapshot,
+                                                        dates)
+                                 for record in snapshot.records)
+                # Make safety daily backup after loading
+                cleanxml.backupxml(self.get_path())
+                return
+            if self._task_stream is not None:
+                stream, self._task_stream = self._task_stream, None
+                # {tid: task} of the tasks pushed from the stream
+                streamed = {}
+                try:
+                    # the tasks are pushed while the next nodes are parsed
+                    self._push_tasks(self._tasks_from_stream(stream,
+                                                             streamed))
+                except xml.sax.SAXParseException, msg:
+                    Log.error("Error parsing %s: %s" % (self.get_path(), msg))
+                    self._recover_streamed_tasks(streamed)
+                    return
+                if self._shards is None:
+                    # The task nodes have not been kept: the XML file is
+                    # parsed again when a task is first written
+                    self.doc = None
+                    self.xmlproj = None
+                    self._task_nodes = {}
+                # Make safety daily backup after loading
+                self._backup_tasks()
+                return
+            elif self.doc is None:
+                self._load_xml_file()
+            self._push_tasks(self._task_from_node(node)
+                             for node in self._iter_task_nodes())
+
+    def _tasks_from_stream(self, nodes, streamed):
+        """
+        Yields the tasks of task nodes read from a stream. In sharded mode,
+        the nodes are kept by their shard.
+
+        @param nodes: an iterable of task nodes
+        @param streamed: a dictionary {tid: task} where the tasks are added
+        """
+        for node in nodes:
+            task = self._task_from_node(node)
+            if task is None:
                 continue
-            tid = node.getAttribute("id")
-            task = self.datastore.task_factory(tid)
-            if task:
-                task = taskxml.task_from_xml(task, node)
-                self.datastore.push_task(task)
+            if self._shards is not None:
+                self._task_nodes[task.get_id()] = node
+            streamed[task.get_id()] = task
+            yield task
+
+    def _recover_streamed_tasks(self, streamed):
+        """
+        Called when a parsing error stops the stream of the XML file, after
+        some tasks have been pushed. The document is loaded from the backups
+        (see cleanxml.openxmlfile), and the tasks already pushed are put back
+        in it, as they were read from the damaged file. The other tasks of
+        the backup are then pushed, so that the loading completes.
+
+        @param streamed: {tid: task} of the tasks already pushed
+        """
+        self._load_xml_file()
+        for tid, task in streamed.iteritems():
+            self._set_task_node(tid, taskxml.task_to_xml(self.doc, task))
+        self._push_tasks(self._task_from_node(node)
+                         for node in list(self._iter_task_nodes())
+                         if node.getAttribute("id") not in streamed)
+
+    def _push_tasks(self, tasks):
+        """
+        Pushes tasks in GTG core, by batches of PUSH_BATCH_SIZE tasks
+
+        @param tasks: an iterable of tasks. None values are skipped.
+        """
+        batch = []
+        try:
+            for task in tasks:
+                if task is None:
+                    continue
+                batch.append(task)
+                if len(batch) >= PUSH_BATCH_SIZE:
+                    self.datastore.push_tasks(batch)
+                    batch = []
+        finally:
+            # the tasks read before an error are pushed too
+            if batch:
+                self.datastore.push_tasks(batch)
+
+    def _backup_tasks(self):
+        """
+        Backups the XML file, or all the shards
+        """
+        if self._shards is not None:
+            self._shards.backup()
+        else:
+            cleanxml.backupxml(self.get_path())
+
+    def _task_from_node(self, node):
+        """
+        Creates a task from its XML node
+
+        @param node: the XML node of the task
+        @returns Task: the task, or None
+        """
+        tid = node.getAttribute("id")
+        task = self.datastore.task_factory(tid)
+        if task:
+            task = taskxml.task_from_xml(task, node)
+            self._task_digests[tid] = taskxml.task_digest(task)
+        return task
+
+    def _task_from_record(self, record, snapshot, dates):
+        """
+        Creates a task from its snapshot record.
+        The content and the attributes of closed tasks are read from the
+        snapshot only when they are accessed.
+
+        @param record: the record of the task
+        @param snapshot: the snapshot holding the record
+        @param dates: the cache of parsed dates, see
+                      tasksnapshot.task_from_record
+        @returns Task: the task, or None
+        """
+        tid = record[tasksnapshot.RECORD_ID]
+        loader = None
+        if record[tasksnapshot.RECORD_STATUS] in [Task.STA_DONE,
+                                                  Task.STA_DISMISSED]:
+            loader = tasksnapshot.get_lazy_fields(record, snapshot)
+        task = self.datastore.task_factory(tid, loader=loader)
+        if task:
+            task = tasksnapshot.task_from_record(task, record, snapshot,
+                                                 dates)
+            self._task_digests[tid] = record[tasksnapshot.RECORD_DIGEST]
+        return task
 
     def set_task(self, task):
         """
@@ -160,30 +602,25 @@ class Backend(GenericBackend):
         #print "LOCALFILE: set_task was called"
         
         tid = task.get_id()
-        # We create an XML representation of the task
-        t_xml = taskxml.task_to_xml(self.doc, task)
+        with self._doc_lock:
+            if self.doc is None:
+                self._load_xml_file()
+            # We will write only if the task has changed since the last time
+            # it has been written (or loaded): comparing digests of the task
+            # fields spares building and serializing its XML representation
+            digest = taskxml.task_digest(task)
+            if self._task_digests.get(tid, None) == digest:
+                return
 
-        # we find if the task exists in the XML treenode.
-        existing = None
-        for node in self.xmlproj.childNodes:
-            if node.nodeName == TASK_NODE and node.getAttribute("id") == tid:
-                existing = node
-
-        modified = False
-        # We then replace the existing node
-        if existing and t_xml:
-            # We will write only if the task has changed
-            if t_xml.toxml() != existing.toxml():
-                self.xmlproj.replaceChild(t_xml, existing)
-                modified = True
-        # If the node doesn't exist, we create it
-        else:
-            self.xmlproj.appendChild(t_xml)
-            modified = True
+            # We create an XML representation of the task, and replace the
+            # existing node (or create it, if it doesn't exist)
+            t_xml = taskxml.task_to_xml(self.doc, task)
+            t_xml = self._set_task_node(tid, t_xml)
+            self._task_digests[tid] = digest
 
-        # if the XML object has changed, we save it to file
-        if modified and self._parameters["path"] and self.doc:
-            cleanxml.savexml(self.get_path(), self.doc)
+            # the XML object has changed, we save it
+            if self._parameters["path"] and self.doc:
+                self._save_modifications(tid, t_xml)
 
     def remove_task(self, tid):
         """ This function is called from GTG core whenever a task must be
@@ -191,12 +628,58 @@ class Backend(GenericBackend):
 
         @param tid: the id of the task to delete
         """
-        modified = False
-        for node in self.xmlproj.childNodes:
-            if node.nodeName == TASK_NODE and node.getAttribute("id") == tid:
-                modified = True
-                self.xmlproj.removeChild(node)
+        with self._doc_lock:
+            if self.doc is None:
+                self._load_xml_file()
+            # We save the modification only if it's necessary
+            if self._remove_task_node(tid):
+                self._save_modifications(tid, backup=True)
+
+    def save_state(self):
+        """
+        Called when the backend quits, after the pending actions have been
+        done: we write the modifications not written yet by the save
+        scheduler, fold the journal in the XML file and take the snapshot.
+        """
+        self._save_scheduler.flush()
+        Log.debug("%s: %d writes of the XML file, %d avoided" %
+                  (self.get_id(), self._save_scheduler.writes,
+                   self._save_scheduler.get_writes_avoided()))
+        if self.journal.records > 0 and self.doc is not None:
+            self._compact_journal()
+        self.journal.close()
+        if self.is_snapshot_enabled():
+            self._save_snapshot()
 
-        # We save the XML file only if it's necessary
-        if modified:
-            cleanxml.savexml(self.get_path(), self.doc, backup=True)
+    def _save_snapshot(self):
+        """
+        Writes the snapshot of the XML file. If the XML file doesn't hold
+        exactly the tasks in memory, the snapshot is removed instead.
+        """
+        with self._doc_lock:
+            if self.doc is None:
+                # Nothing has been written since the snapshot was loaded:
+                # it's still valid
+                return
+            snapshot_path = self.get_snapshot_path()
+            records = None
+            if self.journal.records == 0 and \
+                    not self._save_scheduler.is_dirty():
+                records = []
+                for node in self._iter_task_nodes():
+                    tid = node.getAttribute("id")
+                    task = self.datastore.get_task(tid)
+                    digest = self._task_digests.get(tid, None)
+                    # A lazy task which has not been materialized has not
+                    # been modified: its digest is the loaded one
+                    lazy = isinstance(task, LazyTask) and \
+                        not task.is_materialized()
+                    if task is None or digest is None or \
+                            (not lazy and
+                             digest != taskxml.task_digest(task)):
+                        records = None
+                        break
+                    records.append(tasksnapshot.task_to_record(task, digest))
+            if records is None or not tasksnapshot.save_snapshot(
+                    snapshot_path, self.get_path(), records):
+                tasksnapshot.remove_snapshot(snapshot_path)
@@ -119,6 +119,8 @@ class Backend(PeriodicImportBackend):
         # Fetching the issues
         self.cancellation_point()
         my_issues = []
+        # the new tasks are pushed all at once
+        new_tasks = []
         for filt in filters:
             if filt['name'] == 'gtg':
                 for project in projects:
@@ -129,7 +131,8 @@ class Backend(PeriodicImportBackend):
                         filt['id'], 0, 100)
                     for issue in my_issues:
                         self.cancellation_point()
-                        self._process_mantis_issue(issue)
+                        self._process_mantis_issue(issue, new_tasks)
+        self._push_new_tasks(new_tasks)
         last_issue_list = self.sync_engine.get_all_remote()
         new_issue_list = [str(issue['id']) for issue in my_issues]
         for issue_link in set(last_issue_list).difference(set(new_issue_list)):
@@ -148,7 +151,7 @@ class Backend(PeriodicImportBackend):
 ###############################################################################
 ### Process tasks #############################################################
 ###############################################################################
-    def _process_mantis_issue(self, issue):
+    def _process_mantis_issue(self, issue, new_tasks=None):
         '''
         Given a issue object, finds out if it must be synced to a GTG note and,
         if so, it carries out the synchronization (by creating or
@@ -156,6 +159,10 @@ class Backend(PeriodicImportBackend):
         been deleted)
 
         @param note: a mantis issue
+        @param new_tasks: if given, the new tasks are appended to this list
+                          instead of being pushed in the datastore, as
+                          (task, remote id, meme). Their relationship must
+                          be recorded once they're pushed.
         '''
         has_task = self.datastore.has_task
         action, tid = self.sync_engine.analyze_remote_id(str(issue['id']),
@@ -172,21 +179,23 @@ class Backend(PeriodicImportBackend):
         # To be sure of that, set issue to None
         issue = None
 
-        with self.datastore.get_backend_mutex():
-            if action == SyncEngine.ADD:
+        if action == SyncEngine.ADD:
+            with self.datastore.get_backend_mutex():
                 tid = str(uuid.uuid4())
                 task = self.datastore.task_factory(tid)
                 self._populate_task(task, issue_dic)
-                self.sync_engine.record_relationship(local_id=tid,
-                                                     remote_id=str(
-                                                     issue_dic['number']),
-                                                     meme=SyncMeme(
-                                                     task.get_modified(),
-                                                     issue_dic['modified'],
-                                                     self.get_id()))
-                self.datastore.push_task(task)
+                meme = SyncMeme(task.get_modified(), issue_dic['modified'],
+                                self.get_id())
+                remote_id = str(issue_dic['number'])
+                if new_tasks is None:
+                    self.sync_engine.record_relationship(
+                        local_id=tid, remote_id=remote_id, meme=meme)
+                    self.datastore.push_task(task)
+                else:
+                    new_tasks.append((task, remote_id, meme))
 
-            elif action == SyncEngine.UPDATE:
+        elif action == SyncEngine.UPDATE:
+            with self.datastore.get_task_mutex(tid):
                 task = self.datastore.get_task(tid)
                 self._populate_task(task, issue_dic)
                 meme = self.sync_engine.get_meme_from_remote_id(
@@ -31,7 +31,7 @@ import subprocess
 import exceptions
 from dateutil.tz import tzutc, tzlocal
 
-from GTG.backends.genericbackend import GenericBackend
+from GTG.backends.genericbackend import GenericBackend, synchronized
 from GTG import _
 from GTG.backends.backendsignals import BackendSignals
 from GTG.backends.syncengine import SyncEngine, SyncMeme
@@ -138,47 +138,49 @@ class Backend(PeriodicImportBackend):
 
         # we get the old list of synced tasks, and compare with the new tasks
         # set
-        stored_rtm_task_ids = self.sync_engine.get_all_remote()
-        current_rtm_task_ids = [tid for tid in
-                                self.rtm_proxy.get_rtm_tasks_dict().iterkeys()]
-
-        if self._this_is_the_first_loop:
-            self._on_successful_authentication()
-
-        # If it's the very first time the backend is run, it's possible that
-        # the user already synced his tasks in some way (but we don't know
-        # that). Therefore, we attempt to induce those tasks relationships
-        # matching the titles.
-        if self._parameters["is-first-run"]:
-            gtg_titles_dic = {}
-            for tid in self.datastore.get_all_tasks():
-                gtg_task = self.datastore.get_task(tid)
-                if not self._gtg_task_is_syncable_per_attached_tags(gtg_task):
-                    continue
-                gtg_title = gtg_task.get_title()
-                if gtg_title in gtg_titles_dic:
-                    gtg_titles_dic[gtg_task.get_title()].append(tid)
-                else:
-                    gtg_titles_dic[gtg_task.get_title()] = [tid]
-            for rtm_task_id in current_rtm_task_ids:
-                rtm_task = self.rtm_proxy.get_rtm_tasks_dict()[rtm_task_id]
-                try:
-                    tids = gtg_titles_dic[rtm_task.get_title()]
-                    # we remove the tid, so that it can't be linked to two
-                    # different rtm tasks
-                    tid = tids.pop()
+        with self._sync_lock:
+            stored_rtm_task_ids = self.sync_engine.get_all_remote()
+            current_rtm_task_ids = [
+                tid for tid in self.rtm_proxy.get_rtm_tasks_dict().iterkeys()]
+
+            if self._this_is_the_first_loop:
+                self._on_successful_authentication()
+
+            # If it's the very first time the backend is run, it's possible
+            # that the user already synced his tasks in some way (but we don't
+            # know that). Therefore, we attempt to induce those tasks
+            # relationships matching the titles.
+            if self._parameters["is-first-run"]:
+                gtg_titles_dic = {}
+                for tid in self.datastore.get_all_tasks():
                     gtg_task = self.datastore.get_task(tid)
-                    meme = SyncMeme(gtg_task.get_modified(),
-                                    rtm_task.get_modified(),
-                                    "GTG")
-                    self.sync_engine.record_relationship(
-                        local_id=tid,
-                        remote_id=rtm_task.get_id(),
-                        meme=meme)
-                except KeyError:
-                    pass
-            # a first run has been completed successfully
-            self._parameters["is-first-run"] = False
+                    if not self._gtg_task_is_syncable_per_attached_tags(
+                            gtg_task):
+                        continue
+                    gtg_title = gtg_task.get_title()
+                    if gtg_title in gtg_titles_dic:
+                        gtg_titles_dic[gtg_task.get_title()].append(tid)
+                    else:
+                        gtg_titles_dic[gtg_task.get_title()] = [tid]
+                for rtm_task_id in current_rtm_task_ids:
+                    rtm_task = self.rtm_proxy.get_rtm_tasks_dict()[rtm_task_id]
+                    try:
+                        tids = gtg_titles_dic[rtm_task.get_title()]
+                        # we remove the tid, so that it can't be linked to two
+                        # different rtm tasks
+                        tid = tids.pop()
+                        gtg_task = self.datastore.get_task(tid)
+                        meme = SyncMeme(gtg_task.get_modified(),
+                                        rtm_task.get_modified(),
+                                        "GTG")
+                        self.sync_engine.record_relationship(
+                            local_id=tid,
+                            remote_id=rtm_task.get_id(),
+                            meme=meme)
+                    except KeyError:
+                        pass
+                # a first run has been completed successfully
+                self._parameters["is-first-run"] = False
 
         for rtm_task_id in current_rtm_task_ids:
             self.cancellation_point()
@@ -190,13 +192,15 @@ class Backend(PeriodicImportBackend):
             self.cancellation_point()
             # Removing the old ones
             if not self.please_quit:
-                tid = self.sync_engine.get_local_id(rtm_task_id)
-                self.datastore.request_task_deletion(tid)
-                try:
-                    self.sync_engine.break_relationship(remote_id=rtm_task_id)
-                    self.save_state()
-                except KeyError:
-                    pass
+                with self._sync_lock:
+                    tid = self.sync_engine.get_local_id(rtm_task_id)
+                    self.datastore.request_task_deletion(tid)
+                    try:
+                        self.sync_engine.break_relationship(
+                            remote_id=rtm_task_id)
+                        self.save_state()
+                    except KeyError:
+                        pass
 
     def _on_successful_authentication(self):
         '''
@@ -211,6 +215,7 @@ class Backend(PeriodicImportBackend):
                         args=(self.get_id(),)).start()
 
     @interruptible
+    @synchronized
     def remove_task(self, tid):
         """
         See GenericBackend for an explanation of this function.
@@ -238,6 +243,7 @@ class Backend(PeriodicImportBackend):
 ### Process tasks #############################################################
 ###############################################################################
     @interruptible
+    @synchronized
     def set_task(self, task):
         """
         See GenericBackend for an explanation of this function.
@@ -283,23 +289,25 @@ class Backend(PeriodicImportBackend):
                 # of what's on the rtm website
                 self.rtm_proxy.refresh_rtm_tasks_dict()
                 rtm_task = self.rtm_proxy.get_rtm_tasks_dict()[rtm_task_id]
-            with self.datastore.get_backend_mutex():
-                meme = self.sync_engine.get_meme_from_local_id(task.get_id())
-                newest = meme.which_is_newest(task.get_modified(),
-                                              rtm_task.get_modified())
-                if newest == "local":
-                    transaction_ids = []
-                    try:
-                        self._populate_rtm_task(
-                            task, rtm_task, transaction_ids)
-                    except:
-                        self.rtm_proxy.unroll_changes(transaction_ids)
-                        raise
-                    meme.set_remote_last_modified(rtm_task.get_modified())
-                    meme.set_local_last_modified(task.get_modified())
-                else:
-                    # we skip saving the state
-                    return
+            meme = self.sync_engine.get_meme_from_local_id(task.get_id())
+            newest = meme.which_is_newest(task.get_modified(),
+                                          rtm_task.get_modified())
+            if newest != "local":
+                # we skip saving the state
+                return
+
+            def write():
+                transaction_ids = []
+                try:
+                    self._populate_rtm_task(task, rtm_task, transaction_ids)
+                except:
+                    self.rtm_proxy.unroll_changes(transaction_ids)
+                    raise
+
+            def commit():
+                meme.set_remote_last_modified(rtm_task.get_modified())
+                meme.set_local_last_modified(task.get_modified())
+            self._write_task(task, write, commit)
 
         elif action == SyncEngine.REMOVE:
             self.datastore.request_task_deletion(tid)
@@ -337,6 +345,7 @@ class Backend(PeriodicImportBackend):
         else:
             self.datastore.request_task_deletion(tid)
 
+    @synchronized
     def _process_rtm_task(self, rtm_task_id):
         '''
         Takes a rtm task id and carries out the necessary operations to
@@ -377,7 +386,7 @@ class Backend(PeriodicImportBackend):
 
         elif action == SyncEngine.UPDATE:
             task = self.datastore.get_task(tid)
-            with self.datastore.get_backend_mutex():
+            with self.datastore.get_task_mutex(tid):
                 meme = self.sync_engine.get_meme_from_remote_id(rtm_task_id)
                 newest = meme.which_is_newest(task.get_modified(),
                                               rtm_task.get_modified())
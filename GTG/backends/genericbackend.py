@@ -24,17 +24,36 @@ the GenericBackend class
 
 import os
 import errno
+import functools
 import pickle
 import threading
-from collections import deque
 
 from GTG.backends.backendsignals import BackendSignals
+from GTG.tools.backupstore import BackupStore
+from GTG.tools.dispatcher import Dispatcher
 from GTG.tools.keyring import Keyring
 from GTG.core import CoreConfig
 from GTG.tools.logger import Log
 from GTG.tools.interruptible import _cancellation_point
+from GTG.tools.workqueue import WorkQueue
 
 PICKLE_BACKUP_NBR = 2
+# how many times a write conflicting with a change of the task is retried
+# before it's done holding the task mutex (see GenericBackend._write_task)
+WRITE_RETRIES = 3
+
+
+def synchronized(fn):
+    '''
+    A decorator for the methods of a backend which use its synchronization
+    state: they're run holding the backend's sync lock.
+    '''
+
+    @functools.wraps(fn)
+    def new(self, *args, **kwargs):
+        with self._sync_lock:
+            return fn(self, *args, **kwargs)
+    return new
 
 
 class GenericBackend(object):
@@ -115,6 +134,22 @@ class GenericBackend(object):
         '''
         pass
 
+    def set_task_fields(self, task, fields):
+        '''
+        Optional. Called instead of set_task with the fields of the task which
+        have been modified since the task was last saved in this backend, so
+        that a backend can save only those. By default, the whole task is
+        saved with set_task.
+        Only the fields listed in Task.FIELD_* are tracked: a backend which
+        stores anything else (attributes, for example) should keep the
+        default behavior.
+
+        @param task: the task object to save
+        @param fields: a set of Task.FIELD_* values, or None if the task has
+                       not been saved since this backend was started
+        '''
+        self.set_task(task)
+
     def remove_task(self, tid):
         ''' This function is called from GTG core whenever a task must be
         removed from the backend. Note that the task could be not present here.
@@ -297,8 +332,22 @@ class GenericBackend(object):
         self.please_quit = False
         self.cancellation_point = lambda: _cancellation_point(
             lambda: self.please_quit)
-        self.to_set = deque()
-        self.to_remove = deque()
+        # the tasks to save or remove
+        self.work_queue = WorkQueue()
+        # {tid: the field versions of the task when it was last saved}
+        self._saved_field_versions = {}
+        # the (action, tid) being done by launch_setting_thread
+        self._current_operation = None
+        # taken to pop an operation from the work_queue and mark it as the
+        # current one. Once the pending operations are spilled, nothing is
+        # popped anymore.
+        self._operation_lock = threading.Lock()
+        self._spilled = False
+        # serializes the use of the sync state of the backend (e.g., its
+        # SyncEngine and its connection to the remote service), which is
+        # shared by the setting jobs and the periodic import. It must be
+        # acquired before the task mutexes of the DataStore.
+        self._sync_lock = threading.RLock()
 
     def get_attached_tags(self):
         '''
@@ -528,6 +577,8 @@ class GenericBackend(object):
     def _store_pickled_file(self, path, data):
         '''
         A helper function to save some object in a file.
+        The file is backed up in the backup store of its directory, which
+        keeps its PICKLE_BACKUP_NBR last versions.
 
         @param path: a relative path. A good choice is
         "backend_name/object_name"
@@ -541,26 +592,25 @@ class GenericBackend(object):
             if exception.errno != errno.EEXIST:
                 raise
 
-        # Shift backups
-        for i in range(PICKLE_BACKUP_NBR, 1, -1):
-            destination = "%s.bak.%d" % (path, i)
-            source = "%s.bak.%d" % (path, i - 1)
-
-            if os.path.exists(destination):
-                os.unlink(destination)
-
-            if os.path.exists(source):
-                os.rename(source, destination)
+        # saving
+        pickled = pickle.dumps(data)
+        with open(path + "__", 'wb') as file:
+            file.write(pickled)
+        os.rename(path + "__", path)
 
-        # Backup main file
+        # the store writes nothing if the data hasn't changed
         if PICKLE_BACKUP_NBR > 0:
-            destination = "%s.bak.1" % path
-            if os.path.exists(path):
-                os.rename(path, destination)
+            try:
+                self._get_pickle_backup_store(path).backup(
+                    os.path.basename(path), pickled, PICKLE_BACKUP_NBR)
+            except (IOError, OSError), exception:
+                Log.error("Could not backup '%s': %s" % (path, exception))
 
-        # saving
-        with open(path, 'wb') as file:
-                pickle.dump(data, file)
+    def _get_pickle_backup_store(self, path):
+        '''
+        Returns the backup store of a pickled file
+        '''
+        return BackupStore.get(os.path.join(os.path.dirname(path), "backup"))
 
     def _load_pickled_file(self, path, default_value=None):
         '''
@@ -582,7 +632,7 @@ class GenericBackend(object):
                 Log.error("Pickle file for backend '%s' is damaged" %
                           self.get_name())
 
-        # Loading file failed, trying backups
+        # Loading file failed, trying backups (made by older versions of GTG)
         for i in range(1, PICKLE_BACKUP_NBR + 1):
             backup_file = "%s.bak.%d" % (path, i)
             if os.path.exists(backup_file):
@@ -596,6 +646,18 @@ class GenericBackend(object):
                         Log.error("Backup #%d for '%s' is damaged as well" %
                                  (i, self.get_name()))
 
+        # then the versions in the backup store
+        store = self._get_pickle_backup_store(path)
+        for timestamp, version in store.get_versions(os.path.basename(path)):
+            try:
+                data = pickle.loads(store.restore_version(version))
+                Log.info("Succesfully restored backup %s for '%s'" %
+                         (version, self.get_name()))
+                return data
+            except Exception:
+                Log.error("Backup %s for '%s' is damaged as well" %
+                          (version, self.get_name()))
+
         # Data could not be loaded, degrade to default data
         Log.error("There is no suitable backup for '%s', "
                   "loading default data" % self.get_name())
@@ -626,17 +688,16 @@ class GenericBackend(object):
         Helper function to launch the setting thread, if it's not running.
         '''
         if self.to_set_timer is None and self.is_enabled():
-            self.to_set_timer = threading.Timer(self.timer_timestep,
-                                                self.launch_setting_thread)
-            self.to_set_timer.start()
+            self.to_set_timer = Dispatcher.get().submit(
+                self.get_id(), self.launch_setting_thread,
+                delay=self.timer_timestep)
 
     def launch_setting_thread(self, bypass_quit_request=False):
         '''
         This function is launched as a separate thread. Its job is to perform
         the changes that have been issued from GTG core.
-        In particular, for each task in the self.to_set queue, a task
-        has to be modified or to be created (if the tid is new), and for
-        each task in the self.to_remove queue, a task has to be deleted
+        In particular, for each task queued in self.work_queue, a task has
+        to be modified or to be created (if the tid is new), or to be deleted
 
         @param bypass_quit_request: if True, the thread should not be stopped
                                     even if asked by self.please_quit = True.
@@ -644,48 +705,165 @@ class GenericBackend(object):
                                     syncing all pending tasks
         '''
         while not self.please_quit or bypass_quit_request:
-            try:
-                task = self.to_set.pop()
-            except IndexError:
-                break
-            tid = task.get_id()
-            if tid not in self.to_remove:
-                self.set_task(task)
-
-        while not self.please_quit or bypass_quit_request:
-            try:
-                tid = self.to_remove.pop()
-            except IndexError:
-                break
-            self.remove_task(tid)
+            with self._operation_lock:
+                if self._spilled:
+                    break
+                try:
+                    action, tid, task = self.work_queue.pop()
+                except IndexError:
+                    break
+                self._current_operation = (action, tid)
+            if action == WorkQueue.SET:
+                self._set_modified_fields(task)
+            else:
+                self._saved_field_versions.pop(tid, None)
+                self.remove_task(tid)
+            self._current_operation = None
         # we release the weak lock
         self.to_set_timer = None
 
+    def _set_modified_fields(self, task):
+        '''
+        Saves a task with set_task_fields, passing the fields modified since
+        the task was last saved. All the modifications made while the task
+        was waiting in the queue are saved at once.
+        '''
+        tid = task.get_id()
+        versions = task.get_field_versions()
+        saved = self._saved_field_versions.get(tid)
+        if saved is None:
+            fields = None
+        else:
+            fields = set(field for field, version in versions.iteritems()
+                         if saved.get(field) != version)
+        self.set_task_fields(task, fields)
+        # not reached if set_task_fields raised: the next save will include
+        # these fields again
+        self._saved_field_versions[tid] = versions
+
+    def _write_task(self, task, write, commit):
+        '''
+        Saves a task to the remote service without holding its task mutex,
+        so that slow writes don't block the others. write() saves the task,
+        then commit() is called holding the task mutex to record the sync
+        state, if the task hasn't changed in the meantime. Otherwise, the
+        write conflicted with another change of the task: it's retried with
+        the new state of the task. After WRITE_RETRIES conflicts, the write
+        is done holding the task mutex.
+
+        @param task: the task to save
+        @param write: a function saving the task
+        @param commit: a function recording that the task has been saved
+        '''
+        def version():
+            return task.get_modified(), task.get_field_versions()
+
+        mutex = self.datastore.get_task_mutex(task.get_id())
+        for attempt in xrange(WRITE_RETRIES):
+            written = version()
+            write()
+            with mutex:
+                if version() == written:
+                    commit()
+                    return
+            Log.debug("%s: task %s modified while saving it, retrying" %
+                      (self.get_id(), task.get_id()))
+        with mutex:
+            write()
+            commit()
+
     def queue_set_task(self, task):
         ''' Save the task in the backend. In particular, it just enqueues the
-        task in the self.to_set queue. A thread will shortly run to apply the
+        task in self.work_queue. A thread will shortly run to apply the
         requested changes.
 
         @param task: the task that should be saved
         '''
-        tid = task.get_id()
-        if task not in self.to_set and tid not in self.to_remove:
-            self.to_set.appendleft(task)
+        if self.work_queue.queue_set(task.get_id(), task):
             self.__try_launch_setting_thread()
 
     def queue_remove_task(self, tid):
         '''
         Queues task to be removed. In particular, it just enqueues the
-        task in the self.to_remove queue. A thread will shortly run to apply
-        the requested changes.
+        task in self.work_queue, where it replaces a pending save of the
+        task. A thread will shortly run to apply the requested changes.
 
         @param tid: The Task ID of the task to be removed
         '''
-        if tid not in self.to_remove:
-            self.to_remove.appendleft(tid)
+        if self.work_queue.queue_remove(tid):
             self.__try_launch_setting_thread()
             return None
 
+    def _get_spill_path(self):
+        return os.path.join('backends', 'pending-' + self.get_id())
+
+    def spill_pending_operations(self, operations=()):
+        '''
+        Saves the operations which are still queued in a spill file, so that
+        they're done the next time the backend is loaded. It's used when the
+        backend stalls while GTG quits. The operation which is being done is
+        saved too, as it may not complete. The setting thread stops before
+        the queue is drained: it doesn't start any other operation.
+
+        @param operations: a list of (action, tid) queued before reaching
+                           this backend. action is WorkQueue.SET or
+                           WorkQueue.REMOVE.
+        '''
+        self.please_quit = True
+        if self.to_set_timer is not None:
+            try:
+                self.to_set_timer.cancel()
+            except:
+                pass
+        spilled = self._load_pickled_file(self._get_spill_path(), [])
+        spilled.extend(operations)
+        with self._operation_lock:
+            self._spilled = True
+            current = self._current_operation
+            if current is not None:
+                spilled.append(current)
+            while True:
+                try:
+                    action, tid, task = self.work_queue.pop()
+                except IndexError:
+                    break
+                spilled.append((action, tid))
+        if spilled:
+            Log.info("%s: saving %d pending operations for the next start" %
+                     (self.get_id(), len(spilled)))
+            self._store_pickled_file(self._get_spill_path(), spilled)
+
+    def replay_spilled_operations(self):
+        '''
+        Queues again the operations saved by spill_pending_operations. It
+        must be called once the tasks have been loaded, as the tasks to save
+        are taken from the DataStore. The operations on tasks which aren't
+        there (yet) are kept in the spill file for the next time.
+        '''
+        path = self._get_spill_path()
+        spilled = self._load_pickled_file(path, [])
+        if not spilled:
+            return
+        Log.info("%s: replaying %d pending operations" %
+                 (self.get_id(), len(spilled)))
+        left = []
+        for action, tid in spilled:
+            if action == WorkQueue.REMOVE:
+                self.queue_remove_task(tid)
+            elif self.datastore.has_task(tid):
+                self.queue_set_task(self.datastore.get_task(tid))
+            else:
+                left.append((action, tid))
+        if left:
+            Log.info("%s: %d pending operations are kept for later" %
+                     (self.get_id(), len(left)))
+            self._store_pickled_file(path, left)
+            return
+        try:
+            os.remove(os.path.join(CoreConfig().get_data_dir(), path))
+        except OSError:
+            pass
+
     def sync(self):
         '''
         Helper method. Forces the backend to perform all the pending changes.
@@ -702,4 +880,7 @@ class GenericBackend(object):
             except:
                 pass
         self.launch_setting_thread(bypass_quit_request=True)
+        jobs, wait_time, run_time = Dispatcher.get().get_latency(self.get_id())
+        Log.debug("%s: %d background jobs, waited %.3fs and ran %.3fs on "
+                  "average" % (self.get_id(), jobs, wait_time, run_time))
         self.save_state()
@@ -32,7 +32,7 @@ import unicodedata
 
 from GTG.tools.testingmode import TestingMode
 from GTG.tools.borg import Borg
-from GTG.backends.genericbackend import GenericBackend
+from GTG.backends.genericbackend import GenericBackend, synchronized
 from GTG.backends.backendsignals import BackendSignals
 from GTG.backends.syncengine import SyncEngine, SyncMeme
 from GTG.tools.logger import Log
@@ -133,6 +133,7 @@ class GenericTomboy(GenericBackend):
 ### Something got removed #####################################################
 ###############################################################################
     @interruptible
+    @synchronized
     def on_note_deleted(self, note, something):
         '''
         Callback, executed when a tomboy note is deleted.
@@ -152,11 +153,12 @@ class GenericTomboy(GenericBackend):
                 self.break_relationship(remote_id=note)
 
     @interruptible
+    @synchronized
     def remove_task(self, tid):
         '''
         See GenericBackend for an explanation of this function.
         '''
-        with self.datastore.get_backend_mutex():
+        with self.datastore.get_task_mutex(tid):
             self.cancellation_point()
             try:
                 note = self.sync_engine.get_remote_id(tid)
@@ -192,6 +194,7 @@ class GenericTomboy(GenericBackend):
 ###############################################################################
 ### Process tasks #############################################################
 ###############################################################################
+    @synchronized
     def _process_tomboy_note(self, note):
         '''
         Given a tomboy note, finds out if it must be synced to a GTG note and,
@@ -249,6 +252,7 @@ class GenericTomboy(GenericBackend):
                 self._exec_lost_syncability(tid, note)
 
     @interruptible
+    @synchronized
     def set_task(self, task):
         '''
         See GenericBackend for an explanation of this function.
@@ -256,7 +260,7 @@ class GenericTomboy(GenericBackend):
         self.cancellation_point()
         is_syncable = self._gtg_task_is_syncable_per_attached_tags(task)
         tid = task.get_id()
-        with self.datastore.get_backend_mutex():
+        with self.datastore.get_task_mutex(tid):
             with self.TomboyConnection(self, *self.BUS_ADDRESS) as tomboy:
                 has_task = self.datastore.has_task
                 has_note = tomboy.NoteExists
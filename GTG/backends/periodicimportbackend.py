@@ -99,6 +99,25 @@ class PeriodicImportBackend(GenericBackend):
         self.do_periodic_import()
         BackendSignals().backend_sync_ended(self.get_id())
 
+    def _push_new_tasks(self, new_tasks):
+        '''
+        Pushes the tasks created by an import all at once, then records the
+        relationship of each task which has been pushed with its remote
+        object in self.sync_engine. If the import is cancelled before, no
+        relationship is left for tasks which don't exist.
+
+        @param new_tasks: a list of (task, remote id, meme)
+        '''
+        with self.datastore.get_backend_mutex():
+            pushed = self.datastore.push_tasks(
+                [task for task, remote_id, meme in new_tasks])
+            pushed_ids = set(task.get_id() for task in pushed)
+            for task, remote_id, meme in new_tasks:
+                if task.get_id() in pushed_ids:
+                    self.sync_engine.record_relationship(
+                        local_id=task.get_id(), remote_id=remote_id,
+                        meme=meme)
+
     def quit(self, disable=False):
         '''
         Called when GTG quits or disconnects the backend.
@@ -150,6 +150,84 @@ class SyncMemes(TwoKeyDict):
     get_all_remote = TwoKeyDict._get_all_secondary_keys
 
 
+class SyncHashes(TwoKeyDict):
+    '''
+    A TwoKeyDict storing the hash of the last synchronized state of each
+    object, keyed by its local id and by the id of the related remote object.
+    Unlike in SyncMemes, an object can have a hash but no remote id yet (it
+    hasn't been created on the remote side). All the lookups take constant
+    time, in both directions.
+    '''
+
+    def set_hash(self, local_id, object_hash):
+        '''
+        Stores the hash of an object
+
+        @param local_id: the id of the local object
+        @param object_hash: the hash of its last synchronized state
+        '''
+        self._primary_to_value[local_id] = object_hash
+
+    def get_hash(self, local_id, default=None):
+        '''
+        Returns the hash of an object, or default if it's not stored
+        '''
+        return self._primary_to_value.get(local_id, default)
+
+    has_local_id = TwoKeyDict.has_primary_key
+
+    def set_remote_id(self, local_id, remote_id):
+        '''
+        Records the id of the remote object related to a local one, which
+        must have a hash already. If the remote object was related to
+        another local object, that relationship is forgotten.
+
+        @param local_id: the id of the local object
+        @param remote_id: the id of the remote object
+        '''
+        self.set_secondary_key(local_id, remote_id)
+
+    def get_remote_id(self, local_id, default=None):
+        '''
+        Returns the id of the remote object related to a local one, or
+        default if there is none
+        '''
+        try:
+            return self._get_secondary_key(local_id)
+        except KeyError:
+            return default
+
+    def get_local_id(self, remote_id, default=None):
+        '''
+        Returns the id of the local object related to a remote one, or
+        default if there is none
+        '''
+        try:
+            return self._get_primary_key(remote_id)
+        except KeyError:
+            return default
+
+    def remove_local_id(self, local_id):
+        '''
+        Forgets an object, and its remote id if it has one. Nothing is done
+        if the object is not stored.
+        '''
+        if local_id not in self._primary_to_value:
+            return
+        del self._primary_to_value[local_id]
+        self.remove_secondary_key(local_id)
+
+    def get_all_local(self):
+        '''
+        Returns the ids of all the local objects having a hash
+
+        @returns list: list of local ids
+        '''
+        return list(self._primary_to_value)
+
+    get_all_remote = TwoKeyDict._get_all_secondary_keys
+
+
 class SyncEngine(object):
     '''
     The SyncEngine is an object useful in keeping two sets of objects
@@ -23,23 +23,33 @@ Contains the Datastore object, which is the manager of all the active backends
 
 TAG_XMLFILE = "tags.xml"
 TAG_XMLROOT = "tagstore"
+# Seconds given to all the backends to quit, when GTG quits
+QUIT_TIMEOUT = 10
 
 import threading
+import time
 import uuid
 import os.path
-from collections import deque
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
 
 from GTG.backends.backendsignals import BackendSignals
 from GTG.backends.genericbackend import GenericBackend
 from GTG.core import CoreConfig
 from GTG.core import requester
 from GTG.core.search import parse_search_query, search_filter, InvalidQuery
+from GTG.core.startup import StartupOrchestrator
 from GTG.core.tag import Tag
-from GTG.core.task import Task
+from GTG.core.task import Task, LazyTask
 from GTG.core.treefactory import TreeFactory
 from GTG.tools import cleanxml
 from GTG.tools.borg import Borg
+from GTG.tools.changefeed import ChangeFeed
+from GTG.tools.dispatcher import Dispatcher
 from GTG.tools.logger import Log
+from GTG.tools.tasklocks import TaskLocks
+from GTG.tools.workqueue import WorkQueue
 
 
 class DataStore(object):
@@ -57,8 +67,12 @@ class DataStore(object):
         """
         # dictionary {backend_name_string: Backend instance}
         self.backends = {}
+        # the nodes modified during the batch in progress, in each thread
+        self._batch = threading.local()
         self.treefactory = TreeFactory()
         self._tasks = self.treefactory.get_tasks_tree()
+        self._changes = ChangeFeed()
+        self._connect_change_feed()
         self.requester = requester.Requester(self, global_conf)
         self.tagfile = None
         self._tagstore = self.treefactory.get_tags_tree(self.requester)
@@ -75,7 +89,8 @@ class DataStore(object):
         self._backend_signals.connect('default-backend-loaded',
                                       self._activate_non_default_backends)
         self.filtered_datastore = FilteredDataStore(self)
-        self._backend_mutex = threading.Lock()
+        self._startup = StartupOrchestrator(self)
+        self._task_locks = TaskLocks()
 
     ### Accessor to embedded objects in DataStore ############################
     def get_tagstore(self):
@@ -103,6 +118,39 @@ class DataStore(object):
         """
         return self._tasks
 
+    ### Change feed ###########################################################
+    def _connect_change_feed(self):
+        """
+        Records the changes of the task tree in the change feed
+        """
+        main_view = self._tasks.get_main_view()
+        for signal, action in [('node-added', ChangeFeed.ADDED),
+                               ('node-modified', ChangeFeed.MODIFIED),
+                               ('node-deleted', ChangeFeed.DELETED)]:
+            main_view.register_cllbck(
+                signal, lambda tid, path=None, action=action:
+                self._changes.append(action, tid))
+
+    def get_change_cursor(self):
+        """
+        Returns the sequence number of the last change made to the tasks.
+        It can be passed later to get_changes_since.
+        """
+        return self._changes.get_cursor()
+
+    def get_changes_since(self, cursor):
+        """
+        Returns the tasks changed after a cursor, each one once
+
+        @param cursor: a value returned by get_change_cursor, or the sequence
+                       number of the last change seen
+        @returns list: (seq, action, tid) tuples, oldest first. action is
+                       ChangeFeed.ADDED, MODIFIED or DELETED.
+        @raises CursorExpired: if the changes are too old to be known. The
+                               caller must then look at all the tasks.
+        """
+        return self._changes.get_changes(cursor)
+
     ### Tags functions ########################################################
     def _add_new_tag(self, name, tag, filter_func, parameters, parent_id=None):
         """ Add tag into a tree """
@@ -302,14 +350,18 @@ class DataStore(object):
             # might not exist yet.
             return None
 
-    def task_factory(self, tid, newtask=False):
+    def task_factory(self, tid, newtask=False, loader=None):
         """
         Instantiates the given task id as a Task object.
 
         @param tid: a task id. Must be unique
         @param newtask: True if the task has never been seen before
+        @param loader: if given, a LazyTask is created, whose content and
+                       attributes are returned by loader when first accessed
         @return Task: a Task instance
         """
+        if loader is not None:
+            return LazyTask(tid, self.requester, loader, newtask)
         return Task(tid, self.requester, newtask)
 
     def new_task(self):
@@ -331,22 +383,102 @@ class DataStore(object):
         the given task in the GTG task set.
         This function is used in mutual exclusion: only a backend at a time is
         allowed to push tasks.
+        While the default backend is loading, the task is added later, in the
+        main loop, and True is returned.
 
         @param task: A valid task object  (a GTG.core.task.Task)
         @return bool: True if the task has been accepted
         """
+        if self._startup.is_loading_default_backend():
+            self._startup.run_in_main_loop(self._add_tasks, [task])
+            return True
+        return self._add_tasks([task]) != []
 
-        def adding(task):
+    def push_tasks(self, tasks):
+        """
+        Adds many task objects to the task tree at once. This is the same as
+        calling push_task for each task, but the tasks are synced in a
+        single pass once all of them are in the tree.
+        This function is used in mutual exclusion: only a backend at a time is
+        allowed to push tasks.
+        While the default backend is loading, the tasks are added later, in
+        the main loop, and all of them are returned.
+
+        @param tasks: an iterable of valid task objects
+        @return list: the tasks which have been accepted
+        """
+        tasks = list(tasks)
+        if self._startup.is_loading_default_backend():
+            self._startup.run_in_main_loop(self._add_tasks, tasks)
+            return tasks
+        return self._add_tasks(tasks)
+
+    def _add_tasks(self, tasks):
+        """
+        Adds tasks to the task tree, and returns the ones which weren't
+        there yet (see push_tasks)
+        """
+        accepted = []
+        pushed_ids = set()
+        for task in tasks:
+            tid = task.get_id()
+            if tid in pushed_ids or self.has_task(tid):
+                continue
             self._tasks.add_node(task)
             task.set_loaded()
-            if self.is_default_backend_loaded:
+            pushed_ids.add(tid)
+            accepted.append(task)
+        if self.is_default_backend_loaded:
+            for task in accepted:
                 task.sync()
-        if self.has_task(task.get_id()):
+        return accepted
+
+    def run_in_main_loop(self, function, *args):
+        """
+        Runs a function in the main loop if it's called while the default
+        backend is loading in the background, right away otherwise. It's used
+        to modify the tree of the tasks, which is done in the main loop only.
+
+        @param function: the function to run
+        @param args: its arguments
+        """
+        self._startup.run_in_main_loop(function, *args)
+
+    @contextmanager
+    def batch(self):
+        """
+        Groups the changes made to many tasks (and tags): inside a "with"
+        block, the notifications of the tree are deferred. When the block
+        ends, each modified node is notified once, so the views and the
+        backends see a single change per task. Batches can be nested: only
+        the outermost one notifies the nodes.
+        """
+        if getattr(self._batch, 'nodes', None) is not None:
+            yield
+            return
+        self._batch.nodes = OrderedDict()
+        try:
+            yield
+        finally:
+            nodes = self._batch.nodes
+            self._batch.nodes = None
+            for node in nodes.itervalues():
+                node.modified()
+
+    def defer_modified(self, node):
+        """
+        Records that a node has been modified, if a batch is in progress in
+        this thread
+
+        @param node: a Task or a Tag
+        @returns bool: True if the notification of the node has been
+                       deferred to the end of the batch
+        """
+        nodes = getattr(self._batch, 'nodes', None)
+        if nodes is None:
             return False
-        else:
-            # Thread protection
-            adding(task)
-            return True
+        nodes[(node.__class__, node.get_id())] = node
+        return True
 
     ##########################################################################
     ### Backends functions
@@ -412,6 +544,10 @@ class DataStore(object):
                 source.set_parameter(GenericBackend.KEY_ENABLED, True)
             if not GenericBackend.KEY_DEFAULT_BACKEND in backend_dic:
                 source.set_parameter(GenericBackend.KEY_DEFAULT_BACKEND, True)
+            if source.is_default():
+                # the tasks must be saved even if the remote backends take
+                # all the shared threads
+                Dispatcher.get().reserve_lane(source.get_id())
             # if it's enabled, we initialize it
             if source.is_enabled() and \
                     (self.is_default_backend_loaded or source.is_default()):
@@ -419,7 +555,11 @@ class DataStore(object):
                 # Filling the backend
                 # Doing this at start is more efficient than
                 # after the GUI is launched
-                source.start_get_tasks()
+                if source.is_default() and not self.is_default_backend_loaded:
+                    # the tasks are loaded while the GUI starts
+                    self._startup.load_default_backend(source)
+                else:
+                    source.start_get_tasks()
             return source
         else:
             Log.error("Tried to register a backend without a  pid")
@@ -437,31 +577,27 @@ class DataStore(object):
             return
 
         self.is_default_backend_loaded = True
-        for backend in self.backends.itervalues():
-            if backend.is_enabled() and not backend.is_default():
-                self._backend_startup(backend)
+        self._startup.start_backends([
+            backend for backend in self.backends.itervalues()
+            if backend.is_enabled() and not backend.is_default()])
 
     def _backend_startup(self, backend):
         """
-        Helper function to launch a thread that starts a backend.
+        Helper function to start a backend in the background (see
+        StartupOrchestrator)
 
         @param backend: the backend object
         """
+        self._startup.start_backends([backend])
 
-        def __backend_startup(self, backend):
-            """
-            Helper function to start a backend
-
-            @param backend: the backend object
-            """
-            backend.initialize()
-            backend.start_get_tasks()
-            self.flush_all_tasks(backend.get_id())
+    def get_startup_timings(self, backend_id):
+        """
+        Returns how long the startup of a backend took
 
-        thread = threading.Thread(target=__backend_startup,
-                                  args=(self, backend))
-        thread.setDaemon(True)
-        thread.start()
+        @param backend_id: a backend id
+        @returns dict: {step: seconds}
+        """
+        return self._startup.get_timings(backend_id)
 
     def set_backend_enabled(self, backend_id, state):
         """
@@ -535,17 +671,23 @@ class DataStore(object):
 
         @param backend_id: a backend id
         """
-
-        def _internal_flush_all_tasks():
-            backend = self.backends[backend_id]
-            for task_id in self.get_all_tasks():
-                if self.please_quit:
-                    break
-                backend.queue_set_task(task_id)
-        t = threading.Thread(target=_internal_flush_all_tasks)
-        t.start()
+        Dispatcher.get().submit(backend_id, self.queue_all_tasks,
+                                args=(backend_id, ))
         self.backends[backend_id].start_get_tasks()
 
+    def queue_all_tasks(self, backend_id):
+        """
+        Queues all the tasks to be saved in a backend: the ones which have
+        one of its attached tags
+
+        @param backend_id: a backend id
+        """
+        backend = self.backends[backend_id]
+        for task_id in backend.get_stored_task_ids():
+            if self.please_quit:
+                break
+            backend.queue_set_task(task_id)
+
     def save(self, quit=False):
         """
         Saves the backends parameters.
@@ -559,18 +701,7 @@ class DataStore(object):
         doc, xmlconfig = cleanxml.emptydoc("config")
         # we ask all the backends to quit first.
         if quit:
-            # we quit backends in parallel
-            threads_dic = {}
-            for b in self.get_all_backends():
-                thread = threading.Thread(target=b.quit)
-                threads_dic[b.get_id()] = thread
-                thread.start()
-            for backend_id, thread in threads_dic.iteritems():
-                # after 20 seconds, we give up
-                thread.join(20)
-                if thread.isAlive():
-                    Log.error("The %s backend stalled while quitting",
-                              backend_id)
+            self._quit_backends()
         # we save the parameters
         for b in self.get_all_backends(disabled=True):
             t_xml = doc.createElement("backend")
@@ -590,6 +721,28 @@ class DataStore(object):
         # Saving the tagstore
         self.save_tagtree()
 
+    def _quit_backends(self, timeout=QUIT_TIMEOUT):
+        """
+        Quits the backends in parallel. The backends which haven't finished
+        after "timeout" seconds (all together) are left behind: the
+        operations they still have to do are saved in their spill file,
+        and done the next time they're initialized.
+        """
+        threads_dic = {}
+        for b in self.get_all_backends():
+            thread = threading.Thread(target=b.quit)
+            # a stalled backend must not prevent GTG from exiting
+            thread.setDaemon(True)
+            threads_dic[b.get_id()] = thread
+            thread.start()
+        deadline = time.time() + timeout
+        for backend_id, thread in threads_dic.iteritems():
+            thread.join(max(deadline - time.time(), 0))
+            if thread.isAlive():
+                Log.error("The %s backend stalled while quitting" %
+                          backend_id)
+                self.backends[backend_id].spill_pending_operations()
+
     def request_task_deletion(self, tid):
         """
         This is a proxy function to request a task deletion from a backend
@@ -599,13 +752,27 @@ class DataStore(object):
         self.requester.delete_task(tid)
 
     def get_backend_mutex(self):
+        """
+        Returns the mutex object used by backends to avoid modifying the set
+        of tasks (pushing or deleting tasks) at the same time. It excludes
+        all the task mutexes: to modify a single task, use get_task_mutex
+        instead.
+
+        @returns: a lock, which can be used in a "with" statement
+        """
+        return self._task_locks.get_global_lock()
+
+    def get_task_mutex(self, tid):
         """
         Returns the mutex object used by backends to avoid modifying a task
-        at the same time.
+        at the same time. Backends modifying different tasks don't wait for
+        each other.
+        Don't acquire the backend mutex while holding a task mutex.
 
-        @returns: threading.Lock
+        @param tid: the id of the task
+        @returns: a lock, which can be used in a "with" statement
         """
-        return self._backend_mutex
+        return self._task_locks.get_task_lock(tid)
 
 
 class TaskSource():
@@ -625,11 +792,14 @@ class TaskSource():
         self.backend = backend
         self.req = requester
         self.backend.register_datastore(datastore)
-        self.tasktree = datastore.get_tasks_tree().get_main_view()
-        self.to_set = deque()
-        self.to_remove = deque()
+        self._datastore = datastore
+        self._basetree = datastore.get_tasks_tree()
+        self._filter_name = "backend-%s" % self.backend.get_id()
+        self._attached_tags = set()
+        self._filtered_view = None
+        self.tasktree = self._get_backend_view()
+        self.work_queue = WorkQueue()
         self.please_quit = False
-        self.task_filter = self.get_task_filter_for_backend()
         if Log.is_debugging_mode():
             self.timer_timestep = 5
         else:
@@ -641,40 +811,135 @@ class TaskSource():
 
     def start_get_tasks(self):
         """ Loads all task from the backend and connects its signals
-        afterwards. """
-        self.backend.start_get_tasks()
+        afterwards. The operations spilled when GTG last quit are queued
+        again once the tasks are there. """
+        if not self.backend.is_default():
+            self.backend.start_get_tasks()
+            self._connect_signals()
+            self.backend.replay_spilled_operations()
+            return
+        # The default backend is loaded while the GUI is running: the tasks
+        # created, modified or deleted in the meantime must be saved. The
+        # backend never deletes tasks while loading them, so deletions can
+        # be queued right away (they're done after the loading, which runs
+        # in the same lane). The field versions of each task are recorded
+        # when it's added, to find out which ones have been edited.
+        # The tasks are added to the tree in the main loop: the callbacks
+        # are registered and the loading is finished there too, in order.
+        started = datetime.now()
+        loaded_versions = {}
+
+        def record_versions(tid, path=None):
+            task = self.req.get_task(tid)
+            if task is not None and tid not in loaded_versions:
+                loaded_versions[tid] = task.get_field_versions()
+
+        added = self._view_signals[0]
+        handles = []
+
+        def register():
+            handles.append(self.tasktree.register_cllbck(added,
+                                                         record_versions))
+            self.remove_task_handle = self.tasktree.register_cllbck(
+                self._view_signals[2], self.queue_remove_task)
+
+        self._datastore.run_in_main_loop(register)
+        try:
+            self.backend.start_get_tasks()
+        finally:
+            self._datastore.run_in_main_loop(
+                lambda: self.tasktree.deregister_cllbck(added, handles[0]))
+        self._datastore.run_in_main_loop(self._finish_default_loading,
+                                         started, loaded_versions)
+
+    def _finish_default_loading(self, started, loaded_versions):
+        """
+        Connects the signals of the default backend once all its tasks are
+        in the tree, and queues the tasks edited while it was loading
+
+        @param started: when the loading started
+        @param loaded_versions: {tid: field versions of the task when it
+                                was loaded}
+        """
         self._connect_signals()
-        if self.backend.is_default():
-            BackendSignals().default_backend_loaded()
+        for tid in self.tasktree.get_all_nodes():
+            task = self.req.get_task(tid)
+            if task is None:
+                continue
+            if task.get_modified() >= started or (
+                    tid in loaded_versions and
+                    task.get_field_versions() != loaded_versions[tid]):
+                self.queue_set_task(tid)
+        self.backend.replay_spilled_operations()
+        BackendSignals().default_backend_loaded()
+
+    def _get_backend_view(self):
+        """
+        Returns the view of the tasks which should be stored in this backend.
+        Backends attached to all the tasks get the main view, the others a
+        view filtered by their attached tags: tasks entering and leaving
+        the view are the ones to save and remove. The filtered view is
+        created once, and filtered again when the attached tags change.
+        """
+        self._attached_tags = set(self.backend.get_attached_tags())
+        if CoreConfig.ALLTASKS_TAG in self._attached_tags:
+            self._view_signals = ('node-added', 'node-modified',
+                                  'node-deleted')
+            self._remove_backend_filter()
+            return self._basetree.get_main_view()
+        self._view_signals = ('node-added-inview', 'node-modified-inview',
+                              'node-deleted-inview')
+        self._basetree.add_filter(self._filter_name, self._backend_filter)
+        if self._filtered_view is None:
+            self._filtered_view = self._basetree.get_viewtree(
+                name=self._filter_name, refresh=False)
+        self._filtered_view.apply_filter(self._filter_name, reset=True)
+        return self._filtered_view
 
-    def get_task_filter_for_backend(self):
+    def _remove_backend_filter(self):
+        """
+        Removes the filter of the attached tags, and unapplies it from the
+        filtered view
         """
-        Filter that checks if the task should be stored in this backend.
+        if self._filtered_view is not None:
+            self._filtered_view.reset_filters(refresh=False)
+        self._basetree.remove_filter(self._filter_name)
 
-        @returns function: a function that accepts a task and returns
-                 True/False whether the task should be stored or not
+    def _backend_filter(self, task, parameters=None):
         """
+        Filter that checks if a task has one of the attached tags of the
+        backend
 
-        def backend_filter(req, task, parameters):
-            """
-            Filter that checks if two tags sets intersect. It is used to check
-            if a task should be stored inside a backend
-            @param task: a task object
-            @param tags_to_match_set: a *set* of tag names
-            """
-            try:
-                tags_to_match_set = parameters['tags']
-            except KeyError:
-                return []
-            all_tasks_tag = req.get_alltag_tag().get_name()
-            if all_tasks_tag in tags_to_match_set:
-                return True
-            task_tags = set(task.get_tags_name())
-            return task_tags.intersection(tags_to_match_set)
-
-        attached_tags = self.backend.get_attached_tags()
-        return lambda task: backend_filter(self.requester, task,
-                                           {"tags": set(attached_tags)})
+        @param task: a task object
+        """
+        return not self._attached_tags.isdisjoint(task.get_tags_name())
+
+    def set_attached_tags(self, tags):
+        """
+        Changes the set of attached tags of the backend. The tasks which
+        enter the new view are queued to be saved, the ones which leave it
+        are queued to be removed.
+
+        @param tags: the new attached_tags set
+        """
+        self.backend.set_attached_tags(tags)
+        connected = self.add_task_handle is not None
+        self._disconnect_signals()
+        old_tids = set(self.tasktree.get_all_nodes())
+        self.tasktree = self._get_backend_view()
+        new_tids = set(self.tasktree.get_all_nodes())
+        if connected:
+            self._connect_signals()
+        for tid in new_tids - old_tids:
+            self.queue_set_task(tid)
+        for tid in old_tids - new_tids:
+            self.queue_remove_task(tid)
+
+    def get_stored_task_ids(self):
+        """
+        Returns the ids of the tasks which should be stored in this backend
+        """
+        return self.tasktree.get_all_nodes()
 
     def should_task_id_be_stored(self, task_id):
         """
@@ -683,11 +948,7 @@ class TaskSource():
         @param task_id: a task id
         @returns bool: True if the task should be stored
         """
-        # task = self.req.get_task(task_id)
-        # FIXME: it will be a lot easier to add, instead,
-        # a filter to a tree and check that this task is well in the tree
-#        return self.task_filter(task)
-        return True
+        return self.tasktree.is_displayed(task_id)
 
     def queue_set_task(self, tid, path=None):
         """
@@ -698,8 +959,7 @@ class TaskSource():
         @param path: its path in TreeView widget => not used there
         """
         if self.should_task_id_be_stored(tid):
-            if tid not in self.to_set and tid not in self.to_remove:
-                self.to_set.appendleft(tid)
+            if self.work_queue.queue_set(tid):
                 self.__try_launch_setting_thread()
         else:
             self.queue_remove_task(tid, path)
@@ -717,23 +977,17 @@ class TaskSource():
         """
         while not self.please_quit or bypass_please_quit:
             try:
-                tid = self.to_set.pop()
+                action, tid, value = self.work_queue.pop()
             except IndexError:
                 break
-            # we check that the task is not already marked for deletion
-            # and that it's still to be stored in this backend
+            if action == WorkQueue.REMOVE:
+                self.backend.queue_remove_task(tid)
+            # we check that the task is still to be stored in this backend
             # NOTE: no need to lock, we're reading
-            if tid not in self.to_remove and \
-                    self.should_task_id_be_stored(tid) and \
+            elif self.should_task_id_be_stored(tid) and \
                     self.req.has_task(tid):
                 task = self.req.get_task(tid)
                 self.backend.queue_set_task(task)
-        while not self.please_quit or bypass_please_quit:
-            try:
-                tid = self.to_remove.pop()
-            except IndexError:
-                break
-            self.backend.queue_remove_task(tid)
         # we release the weak lock
         self.to_set_timer = None
 
@@ -744,8 +998,7 @@ class TaskSource():
         @param sender: not used, any value will do
         @param tid: The Task ID of the task to be removed
         """
-        if tid not in self.to_remove:
-            self.to_remove.appendleft(tid)
+        if self.work_queue.queue_remove(tid):
             self.__try_launch_setting_thread()
 
     def __try_launch_setting_thread(self):
@@ -753,10 +1006,9 @@ class TaskSource():
         Helper function to launch the setting thread, if it's not running
         """
         if self.to_set_timer is None and not self.please_quit:
-            self.to_set_timer = threading.Timer(self.timer_timestep,
-                                                self.launch_setting_thread)
-            self.to_set_timer.setDaemon(True)
-            self.to_set_timer.start()
+            self.to_set_timer = Dispatcher.get().submit(
+                self.backend.get_id(), self.launch_setting_thread,
+                delay=self.timer_timestep)
 
     def initialize(self, connect_signals=True):
         """
@@ -772,30 +1024,30 @@ class TaskSource():
         """
         Helper function to connect signals
         """
+        added, modified, deleted = self._view_signals
         if not self.add_task_handle:
             self.add_task_handle = self.tasktree.register_cllbck(
-                'node-added', self.queue_set_task)
+                added, self.queue_set_task)
         if not self.set_task_handle:
             self.set_task_handle = self.tasktree.register_cllbck(
-                'node-modified', self.queue_set_task)
+                modified, self.queue_set_task)
         if not self.remove_task_handle:
             self.remove_task_handle = self.tasktree.register_cllbck(
-                'node-deleted', self.queue_remove_task)
+                deleted, self.queue_remove_task)
 
     def _disconnect_signals(self):
         """
         Helper function to disconnect signals
         """
+        added, modified, deleted = self._view_signals
         if self.add_task_handle:
-            self.tasktree.deregister_cllbck('node-added',
-                                            self.set_task_handle)
+            self.tasktree.deregister_cllbck(added, self.add_task_handle)
             self.add_task_handle = None
         if self.set_task_handle:
-            self.tasktree.deregister_cllbck('node-modified',
-                                            self.set_task_handle)
+            self.tasktree.deregister_cllbck(modified, self.set_task_handle)
             self.set_task_handle = None
         if self.remove_task_handle:
-            self.tasktree.deregister_cllbck('node-deleted',
+            self.tasktree.deregister_cllbck(deleted,
                                             self.remove_task_handle)
             self.remove_task_handle = None
 
@@ -803,20 +1055,29 @@ class TaskSource():
         """
         Forces the TaskSource to sync all the pending tasks
         """
+        # no need to wait for a running job: the queue can be drained from
+        # several threads
         try:
             self.to_set_timer.cancel()
         except Exception:
             pass
-        try:
-            self.to_set_timer.join(3)
-        except Exception:
-            pass
-        try:
-            self.start_get_tasks_thread.join(3)
-        except Exception:
-            pass
         self.launch_setting_thread(bypass_please_quit=True)
 
+    def spill_pending_operations(self):
+        """
+        Saves the operations which are still queued, here and in the
+        backend, so that they're done the next time the backend is
+        initialized. Used when the backend stalls while quitting.
+        """
+        operations = []
+        while True:
+            try:
+                action, tid, value = self.work_queue.pop()
+            except IndexError:
+                break
+            operations.append((action, tid))
+        self.backend.spill_pending_operations(operations)
+
     def quit(self, disable=False):
         """
         Quits the backend and disconnect the signals
@@ -824,6 +1085,7 @@ class TaskSource():
         @param disable: if True, the backend is disabled.
         """
         self._disconnect_signals()
+        self._remove_backend_filter()
         self.please_quit = True
         self.sync()
         self.backend.quit(disable)
@@ -855,11 +1117,16 @@ class FilteredDataStore(Borg):
     def __getattr__(self, attr):
         if attr in ['task_factory',
                     'push_task',
+                    'push_tasks',
                     'get_task',
                     'has_task',
                     'get_all_tasks',
                     'get_tasks_tree',
                     'get_backend_mutex',
+                    'get_task_mutex',
+                    'get_change_cursor',
+                    'get_changes_since',
+                    'run_in_main_loop',
                     'flush_all_tasks',
                     'request_task_deletion']:
             return getattr(self.datastore, attr)
@@ -126,6 +126,36 @@ class Requester(gobject.GObject):
                 task.tag_added(t)
         return task
 
+    def get_change_cursor(self):
+        """Get the sequence number of the last change made to the tasks."""
+        return self.ds.get_change_cursor()
+
+    def get_changes_since(self, cursor):
+        """Get the tasks changed since a cursor.
+
+        @param cursor: a value returned by L{get_change_cursor}
+        @return: a list of (seq, action, tid) tuples, oldest first
+        @raise CursorExpired: if the changes are too old to be known
+        """
+        return self.ds.get_changes_since(cursor)
+
+    def batch(self):
+        """Group the changes made to many tasks.
+
+        Use it in a "with" statement: the tree and the backends are
+        notified once per modified task when the block ends, instead of
+        once per change.
+        """
+        return self.ds.batch()
+
+    def defer_modified(self, node):
+        """Defer the notification of a modified node to the end of the
+        batch in progress, if any.
+
+        @return: C{True} if the notification has been deferred
+        """
+        return self.ds.defer_modified(node)
+
     def delete_task(self, tid, recursive=True):
         """Delete the task 'tid' and, by default, delete recursively
         all the childrens.
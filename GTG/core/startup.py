@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Getting Things GNOME! - a personal organizer for the GNOME desktop
+# Copyright (c) 2008-2012 - Lionel Dricot & Bertrand Rousseau
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+"""
+Contains StartupOrchestrator, which starts the backends when GTG starts.
+
+The default backend is read in the background while the UI comes up: the
+tasks it reads are added to the tree in the main loop. The other backends
+(remote ones, usually) start once the default backend has loaded all its
+tasks, a few at a time, so that they don't take all the threads of the
+dispatcher.
+"""
+
+import threading
+import time
+from collections import deque
+
+import gobject
+
+from GTG.tools.dispatcher import Dispatcher
+from GTG.tools.logger import Log
+
+# Number of backends which can be starting at the same time
+STARTUP_CONCURRENCY = 2
+
+
+class StartupOrchestrator(object):
+    """
+    Starts the backends of a DataStore, and records how long each step of
+    their startup took
+    """
+
+    def __init__(self, datastore, concurrency=STARTUP_CONCURRENCY):
+        """
+        @param datastore: the DataStore
+        @param concurrency: the number of backends which can be starting at
+                            the same time
+        """
+        self._datastore = datastore
+        self.concurrency = concurrency
+        # "default" is True in the thread loading the default backend
+        self._loading = threading.local()
+        self._lock = threading.Lock()
+        # backends waiting for their turn to start
+        self._waiting = deque()
+        self._starting = 0
+        # {backend_id: {step: seconds}}
+        self._timings = {}
+
+    def load_default_backend(self, source):
+        """
+        Loads the tasks of the default backend in the background, and returns
+        right away. The changes it makes to the tree of the tasks are done in
+        the main loop (see run_in_main_loop).
+
+        @param source: the TaskSource of the default backend
+        """
+
+        def load():
+            self._loading.default = True
+            try:
+                self._run_step(source, "start_get_tasks",
+                               source.start_get_tasks)
+            except SystemExit, error:
+                # The tasks file can't be read nor recovered: GTG can't run
+                # without its tasks, so it quits from the main loop
+                Log.error("%s: the tasks could not be loaded" %
+                          source.get_id())
+                gobject.idle_add(self._abort, error)
+            finally:
+                self._loading.default = False
+                self._log_timings(source.get_id())
+
+        Dispatcher.get().submit(source.get_id(), load)
+
+    def is_loading_default_backend(self):
+        """
+        Returns True if it's called by the loading of the default backend
+        """
+        return getattr(self._loading, "default", False)
+
+    def run_in_main_loop(self, function, *args):
+        """
+        Runs a function in the main loop if it's called by the loading of the
+        default backend, right away otherwise. liblarch trees must only be
+        modified in the main loop. The functions passed by the loading run in
+        the order they've been passed.
+
+        @param function: the function to run
+        @param args: its arguments
+        """
+        if self.is_loading_default_backend():
+            gobject.idle_add(self._run_once, function, args)
+        else:
+            function(*args)
+
+    def _run_once(self, function, args):
+        function(*args)
+        # the idle callback is not run again
+        return False
+
+    def _abort(self, error):
+        """
+        Raises again, in the main loop, the SystemExit which stopped the
+        loading of the default backend
+        """
+        raise error
+
+    def start_backends(self, sources):
+        """
+        Starts some backends in the background: they are initialized, their
+        tasks are loaded and the tasks of GTG are queued to be saved in them.
+        At most "concurrency" backends are starting at the same time.
+
+        @param sources: a list of TaskSource
+        """
+        with self._lock:
+            self._waiting.extend(sources)
+        self._start_waiting_backends()
+
+    def get_timings(self, backend_id):
+        """
+        Returns how long the startup of a backend took
+
+        @returns dict: {step: seconds}
+        """
+        with self._lock:
+            return dict(self._timings.get(backend_id, {}))
+
+    def _start_waiting_backends(self):
+        """
+        Starts the waiting backends, as long as the limit is not reached
+        """
+        while True:
+            with self._lock:
+                if self._starting >= self.concurrency or not self._waiting:
+                    return
+                source = self._waiting.popleft()
+                self._starting += 1
+            Dispatcher.get().submit(source.get_id(), self._start_backend,
+                                    args=(source, ))
+
+    def _start_backend(self, source):
+        """
+        Starts a backend. Run by the dispatcher.
+        """
+        try:
+            self._run_step(source, "initialize", source.initialize)
+            self._run_step(source, "start_get_tasks",
+                           source.start_get_tasks)
+            self._run_step(source, "queue_all_tasks",
+                           self._datastore.queue_all_tasks, source.get_id())
+        finally:
+            self._log_timings(source.get_id())
+            with self._lock:
+                self._starting -= 1
+            self._start_waiting_backends()
+
+    def _run_step(self, source, step, function, *args):
+        """
+        Runs a step of the startup of a backend and records its duration
+        """
+        start = time.time()
+        try:
+            function(*args)
+        finally:
+            with self._lock:
+                self._timings.setdefault(source.get_id(), {})[step] = \
+                    time.time() - start
+
+    def _log_timings(self, backend_id):
+        timings = self.get_timings(backend_id)
+        Log.info("Startup of %s: %s" % (backend_id, ", ".join(
+            "%s %.3fs" % (step, seconds)
+            for step, seconds in sorted(timings.iteritems()))))
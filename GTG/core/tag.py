@@ -105,6 +105,12 @@ class Tag(TreeNode):
         """Return the name of the tag."""
         return self.get_attribute("name")
 
+    def modified(self, *args, **kwargs):
+        """Notify the tree that the tag has changed, at the end of the batch
+        in progress if there is one."""
+        if self.req is None or not self.req.defer_modified(self):
+            TreeNode.modified(self, *args, **kwargs)
+
     def set_save_callback(self, save):
         self._save = save
 
@@ -43,7 +43,17 @@ class Task(TreeNode):
     STA_DISMISSED = "Dismiss"
     STA_DONE = "Done"
 
+    # Fields whose modifications are counted (see get_field_versions)
+    FIELD_TITLE = "title"
+    FIELD_CONTENT = "content"
+    FIELD_STATUS = "status"
+    FIELD_DATES = "dates"
+    FIELD_TAGS = "tags"
+    FIELD_CHILDREN = "children"
+
     def __init__(self, ze_id, requester, newtask=False):
+        # {field: number of modifications}
+        self._field_versions = {}
         TreeNode.__init__(self, ze_id)
         # the id of this task in the project should be set
         # tid is a string ! (we have to choose a type and stick to it)
@@ -74,6 +84,20 @@ class Task(TreeNode):
     def is_loaded(self):
         return self.loaded
 
+    def _field_changed(self, field):
+        self._field_versions[field] = self._field_versions.get(field, 0) + 1
+
+    def get_field_versions(self):
+        '''
+        Returns how many times each field of the task has been modified. A
+        backend can compare it with the versions it has saved to know which
+        fields have changed since (see GenericBackend.set_task_fields).
+        Only the FIELD_* fields are counted.
+
+        @returns dict: {field: version}
+        '''
+        return dict(self._field_versions)
+
     def set_loaded(self, signal=True):
         # avoid doing it multiple times
         if not self.loaded:
@@ -136,6 +160,7 @@ class Task(TreeNode):
             self.title = "(no title task)"
         # Avoid unnecessary sync
         if self.title != old_title:
+            self._field_changed(self.FIELD_TITLE)
             self.sync()
             return True
         else:
@@ -234,6 +259,7 @@ class Task(TreeNode):
             # or to today
             else:
                 self.closed_date = Date.today()
+        self._field_changed(self.FIELD_STATUS)
         self.sync()
 
     def get_status(self):
@@ -323,6 +349,7 @@ class Task(TreeNode):
         old_due_date = self.due_date
         new_duedate_obj = Date(new_duedate)  # caching the conversion
         self.due_date = new_duedate_obj
+        self._field_changed(self.FIELD_DATES)
         # If the new date is fuzzy or undefined, we don't update related tasks
         if not new_duedate_obj.is_fuzzy():
             # if the task's start date happens later than the
@@ -412,6 +439,7 @@ class Task(TreeNode):
     # Undefined/fizzy start dates don't constraint the task due date.
     def set_start_date(self, fulldate):
         self.start_date = Date(fulldate)
+        self._field_changed(self.FIELD_DATES)
         if not Date(fulldate).is_fuzzy() and \
             not self.due_date.is_fuzzy() and \
                 Date(fulldate) > self.due_date:
@@ -428,6 +456,7 @@ class Task(TreeNode):
     # dates.
     def set_closed_date(self, fulldate):
         self.closed_date = Date(fulldate)
+        self._field_changed(self.FIELD_STATUS)
         self.sync()
 
     def get_closed_date(self):
@@ -514,6 +543,7 @@ class Task(TreeNode):
             self.content = str(texte)
         else:
             self.content = ''
+        self._field_changed(self.FIELD_CONTENT)
 
     ### SUBTASKS #############################################################
     #
@@ -535,6 +565,7 @@ class Task(TreeNode):
         self.can_be_deleted = False
         # the core of the method is in the TreeNode object
         TreeNode.add_child(self, tid)
+        self._field_changed(self.FIELD_CHILDREN)
         # now we set inherited attributes only if it's a new task
         child = self.req.get_task(tid)
         if self.is_loaded() and child and child.can_be_deleted:
@@ -552,6 +583,7 @@ class Task(TreeNode):
         """
         c = self.req.get_task(tid)
         c.remove_parent(self.get_id())
+        self._field_changed(self.FIELD_CHILDREN)
         if c.can_be_deleted:
             self.req.delete_task(tid)
             self.sync()
@@ -625,6 +657,15 @@ class Task(TreeNode):
         else:
             return False
 
+    def modified(self, *args, **kwargs):
+        """
+        Notifies the tree that the task has changed. Inside a
+        Requester.batch(), the notification is deferred to the end of the
+        batch.
+        """
+        if self.req is None or not self.req.defer_modified(self):
+            TreeNode.modified(self, *args, **kwargs)
+
     def _modified_update(self):
         '''
         Updates the modified timestamp
@@ -651,6 +692,7 @@ class Task(TreeNode):
         eold = saxutils.escape(saxutils.unescape(old))
         enew = saxutils.escape(saxutils.unescape(new))
         self.content = self.content.replace(eold, enew)
+        self._field_changed(self.FIELD_CONTENT)
         oldt = self.req.get_tag(old)
         self.remove_tag(old)
         oldt.modified()
@@ -666,6 +708,7 @@ class Task(TreeNode):
         # Do not add the same tag twice
         if not t in self.tags:
             self.tags.append(t)
+            self._field_changed(self.FIELD_TAGS)
             if self.is_loaded():
                 for child in self.get_subtasks():
                     if child.can_be_deleted:
@@ -700,6 +743,7 @@ class Task(TreeNode):
 
             self.content = "<content><tag>%s</tag>%s%s</content>" % (
                 tagname, sep, c)
+            self._field_changed(self.FIELD_CONTENT)
             # we modify the task internal state, thus we have to call for a
             # sync
             self.sync()
@@ -709,11 +753,15 @@ class Task(TreeNode):
         modified = False
         if tagname in self.tags:
             self.tags.remove(tagname)
+            self._field_changed(self.FIELD_TAGS)
             modified = True
             for child in self.get_subtasks():
                 if child.can_be_deleted:
                     child.remove_tag(tagname)
-        self.content = self._strip_tag(self.content, tagname)
+        content = self._strip_tag(self.content, tagname)
+        if content != self.content:
+            self.content = content
+            self._field_changed(self.FIELD_CONTENT)
         if modified:
             tag = self.req.get_tag(tagname)
             # The ViewCount of the tag still doesn't know that
@@ -789,3 +837,54 @@ class Task(TreeNode):
         s = s + "Status: " + self.status + "\n"
         s = s + "Tags:   " + str(self.tags)
         return s
+
+
+class LazyTask(Task):
+    """
+    A task whose content and attributes are only read the first time they
+    are accessed. Closed tasks loaded from a snapshot are LazyTasks, since
+    they are rarely opened (see GTG.tools.tasksnapshot).
+    """
+
+    def __init__(self, ze_id, requester, loader, newtask=False):
+        """
+        @param loader: a function which returns the tuple
+                       (content, attributes)
+        """
+        self._lazy_loader = None
+        Task.__init__(self, ze_id, requester, newtask)
+        self._lazy_loader = loader
+
+    def get_lazy_loader(self):
+        """
+        Returns the loader of the content and the attributes, if they have
+        not been loaded yet, or None
+        """
+        return self._lazy_loader
+
+    def is_materialized(self):
+        return self._lazy_loader is None
+
+    def _materialize(self):
+        if self._lazy_loader is not None:
+            loader, self._lazy_loader = self._lazy_loader, None
+            self._content, self._attributes = loader()
+
+    def _get_content(self):
+        self._materialize()
+        return self._content
+
+    def _set_content(self, content):
+        self._materialize()
+        self._content = content
+
+    def _get_attributes(self):
+        self._materialize()
+        return self._attributes
+
+    def _set_attributes(self, attributes):
+        self._materialize()
+        self._attributes = attributes
+
+    content = property(_get_content, _set_content)
+    attributes = property(_get_attributes, _set_attributes)
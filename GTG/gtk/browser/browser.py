@@ -1021,8 +1021,9 @@ class TaskBrowser(gobject.GObject):
         start_date = Date.parse(new_start_date)
 
         # FIXME:If the task dialog is displayed, refresh its start_date widget
-        for task in tasks:
-            task.set_start_date(start_date)
+        with self.req.batch():
+            for task in tasks:
+                task.set_start_date(start_date)
 
     def on_mark_as_started(self, widget):
         self.update_start_date(widget, "today")
@@ -1050,8 +1051,9 @@ class TaskBrowser(gobject.GObject):
         due_date = Date.parse(new_due_date)
 
         # FIXME: If the task dialog is displayed, refresh its due_date widget
-        for task in tasks:
-            task.set_due_date(due_date)
+        with self.req.batch():
+            for task in tasks:
+                task.set_due_date(due_date)
 
     def on_set_due_today(self, widget):
         self.update_due_date(widget, "today")
@@ -1107,18 +1109,19 @@ class TaskBrowser(gobject.GObject):
             return
         tasks = [self.req.get_task(uid) for uid in tasks_uid]
         tasks_status = [task.get_status() for task in tasks]
-        for uid, task, status in zip(tasks_uid, tasks, tasks_status):
-            if status == Task.STA_DONE:
-                # Marking as undone
-                task.set_status(Task.STA_ACTIVE)
-                # Parents of that task must be updated - not to be shown
-                # in workview, update children count, etc.
-                for parent_id in task.get_parents():
-                    parent = self.req.get_task(parent_id)
-                    parent.modified()
-            else:
-                task.set_status(Task.STA_DONE)
-                self.close_all_task_editors(uid)
+        with self.req.batch():
+            for uid, task, status in zip(tasks_uid, tasks, tasks_status):
+                if status == Task.STA_DONE:
+                    # Marking as undone
+                    task.set_status(Task.STA_ACTIVE)
+                    # Parents of that task must be updated - not to be shown
+                    # in workview, update children count, etc.
+                    for parent_id in task.get_parents():
+                        parent = self.req.get_task(parent_id)
+                        parent.modified()
+                else:
+                    task.set_status(Task.STA_DONE)
+                    self.close_all_task_editors(uid)
 
     def on_dismiss_task(self, widget):
         tasks_uid = [uid for uid in self.get_selected_tasks()
@@ -1127,12 +1130,13 @@ class TaskBrowser(gobject.GObject):
             return
         tasks = [self.req.get_task(uid) for uid in tasks_uid]
         tasks_status = [task.get_status() for task in tasks]
-        for uid, task, status in zip(tasks_uid, tasks, tasks_status):
-            if status == Task.STA_DISMISSED:
-                task.set_status(Task.STA_ACTIVE)
-            else:
-                task.set_status(Task.STA_DISMISSED)
-                self.close_all_task_editors(uid)
+        with self.req.batch():
+            for uid, task, status in zip(tasks_uid, tasks, tasks_status):
+                if status == Task.STA_DISMISSED:
+                    task.set_status(Task.STA_ACTIVE)
+                else:
+                    task.set_status(Task.STA_DISMISSED)
+                    self.close_all_task_editors(uid)
 
     def apply_filter_on_panes(self, filter_name, refresh=True):
         """ Apply filters for every pane: active tasks, closed tasks """
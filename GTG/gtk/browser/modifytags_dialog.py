@@ -85,14 +85,15 @@ class ModifyTagsDialog:
                     if subtask_id not in self.tasks:
                         self.tasks.append(subtask_id)
 
-        for task_id in self.tasks:
-            task = self.req.get_task(task_id)
-            for tag, is_positive in tags:
-                if is_positive:
-                    task.add_tag(tag)
-                else:
-                    task.remove_tag(tag)
-            task.sync()
+        with self.req.batch():
+            for task_id in self.tasks:
+                task = self.req.get_task(task_id)
+                for tag, is_positive in tags:
+                    if is_positive:
+                        task.add_tag(tag)
+                    else:
+                        task.remove_tag(tag)
+                task.sync()
 
         # Rember the last actions
         self.last_tag_entry = self.tag_entry.get_text()
@@ -0,0 +1,468 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Getting Things GNOME! - a personal organizer for the GNOME desktop
+# Copyright (c) 2008-2012 - Lionel Dricot & Bertrand Rousseau
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+""" Tests for the incremental sync of the GTGOnline! backend """
+
+import BaseHTTPServer
+import Cookie
+import json
+import SocketServer
+import threading
+import unittest
+import urlparse
+import uuid
+
+from GTG.backends.backend_gtgonline import Backend
+from GTG.backends.genericbackend import GenericBackend
+from GTG.core.datastore import DataStore
+from GTG.core.task import Task
+
+GTG_STATUS_TO_WEB = {Task.STA_ACTIVE: 0, Task.STA_DONE: 1,
+                     Task.STA_DISMISSED: 2}
+
+
+class TestBackendGTGOnline(unittest.TestCase):
+    """ Tests for the GTGOnline! backend, against FakeGTGOnline """
+
+    def setUp(self):
+        self.server = FakeGTGOnline()
+        self.server.start()
+        self.datastore = DataStore()
+        self.backend = Backend({
+            # the state of the backend is saved in files named after its id
+            "pid": str(uuid.uuid4()),
+            "username": "user@example.com",
+            "password": "secret",
+            "period": 60,
+            GenericBackend.KEY_ENABLED: True,
+            GenericBackend.KEY_DEFAULT_BACKEND: False,
+            GenericBackend.KEY_ATTACHED_TAGS: [GenericBackend.ALLTASKS_TAG],
+            "use this server instead": self.server.get_url(),
+        })
+        self.backend.register_datastore(self.datastore.filtered_datastore)
+        self.backend.initialize()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def get_local_titles(self):
+        return sorted(self.datastore.get_task(tid).get_title()
+                      for tid in self.datastore.get_all_tasks())
+
+    def test_full_sync(self):
+        """ The first import downloads all the tasks """
+        self.server.add_task("remote")
+        self.datastore.new_task().set_title("local")
+        self.backend.do_periodic_import()
+        self.assertIn(("changes", ""), self.server.requests)
+        self.assertEqual(self.get_local_titles(), ["local", "remote"])
+        self.assertEqual(self.server.get_titles(), ["local", "remote"])
+
+    def test_delta_sync(self):
+        """ The next imports only exchange the changed tasks """
+        remote = self.server.add_task("remote")
+        gone = self.server.add_task("gone")
+        local = self.datastore.new_task()
+        local.set_title("local")
+        self.backend.do_periodic_import()
+        cursor = self.backend.sync_cursor
+        del self.server.requests[:]
+
+        self.server.update_task(remote, "remote changed")
+        self.server.delete_task(gone)
+        local.set_title("local changed")
+        self.datastore.new_task().set_title("local new")
+        self.backend.do_periodic_import()
+
+        self.assertIn(("changes", cursor), self.server.requests)
+        self.assertNotIn(("changes", ""), self.server.requests)
+        self.assertNotIn(("get", None), self.server.requests)
+        self.assertEqual(self.get_local_titles(),
+                         ["local changed", "local new", "remote changed"])
+        self.assertEqual(self.server.get_titles(),
+                         ["local changed", "local new", "remote changed"])
+
+    def test_bulk_updates(self):
+        """ The local changes are sent in chunks, and the failed ones are
+        sent again """
+        tasks = [self.datastore.new_task() for i in xrange(5)]
+        for task in tasks:
+            task.set_title("task")
+        self.backend.do_periodic_import()
+        self.backend.set_parameter("update chunk size", 2)
+        for number, task in enumerate(tasks):
+            task.set_title("task %d" % number)
+        failing = self.backend.hash_dict.get_remote_id(tasks[0].get_id())
+        self.server.failing.add(int(failing))
+        del self.server.requests[:]
+        self.backend.do_periodic_import()
+        self.assertEqual(self.server.requests.count(("update", None)), 3)
+        self.assertEqual(self.server.get_titles(),
+                         ["task", "task 1", "task 2", "task 3", "task 4"])
+        # the failed update is sent at the next import
+        self.server.failing.clear()
+        del self.server.requests[:]
+        self.backend.do_periodic_import()
+        self.assertEqual(self.server.requests.count(("update", None)), 1)
+        self.assertEqual(self.server.get_titles(),
+                         ["task %d" % number for number in xrange(5)])
+
+    def test_unparseable_update_result(self):
+        """ An unexpected answer for a task only fails that task """
+        tasks = [self.datastore.new_task() for i in xrange(2)]
+        for task in tasks:
+            task.set_title("task")
+        self.backend.do_periodic_import()
+        for number, task in enumerate(tasks):
+            task.set_title("task %d" % number)
+        garbled = self.backend.hash_dict.get_remote_id(tasks[0].get_id())
+        self.server.garbled.add(int(garbled))
+        self.backend.do_periodic_import()
+        self.assertEqual(self.server.get_titles(), ["task", "task 1"])
+        self.server.garbled.clear()
+        self.backend.do_periodic_import()
+        self.assertEqual(self.server.get_titles(), ["task 0", "task 1"])
+
+    def test_changed_fields(self):
+        """ Only the fields modified since the last update are sent """
+        task = self.datastore.new_task()
+        task.set_title("task")
+        self.backend.do_periodic_import()
+        task.set_title("renamed")
+        self.backend.do_periodic_import()
+        task.set_text("text")
+        self.backend.do_periodic_import()
+        web_id = self.backend.hash_dict.get_remote_id(task.get_id())
+        # the first update of a task since GTG started sends all the fields
+        self.assertEqual(self.server.updates[0]["name"], "renamed")
+        self.assertIn("status", self.server.updates[0])
+        self.assertEqual(self.server.updates[1],
+                         {"task_id": int(web_id), "description": "text"})
+        self.assertEqual(self.server.get_titles(), ["renamed"])
+
+    def test_new_remote_subtask(self):
+        """ A new remote subtask of a synced task is added under it """
+        parent = self.server.add_task("parent")
+        self.backend.do_periodic_import()
+        child = self.server.add_task("child")
+        self.server.add_subtask(parent, child)
+        self.backend.do_periodic_import()
+        tid = self.backend.hash_dict.get_local_id(str(parent))
+        self.assertEqual([subtask.get_title() for subtask in
+                          self.datastore.get_task(tid).get_subtasks()],
+                         ["child"])
+        # the relation is not sent back as removed
+        self.backend.do_periodic_import()
+        self.assertEqual([details for details in self.server.updates
+                          if details.get("subtask_ids") == []], [])
+
+    def test_server_error(self):
+        """ An import is aborted, and nothing deleted, if the server answers
+        with an error """
+        self.server.add_task("remote")
+        self.datastore.new_task().set_title("local")
+        self.backend.do_periodic_import()
+        cursor = self.backend.sync_cursor
+        for status in (500, 404):
+            self.server.error = status
+            self.backend.sync_cursor = None
+            self.backend.do_periodic_import()
+            self.assertEqual(self.get_local_titles(), ["local", "remote"])
+            self.assertEqual(self.server.get_titles(), ["local", "remote"])
+        self.server.error = 500
+        self.backend.sync_cursor = cursor
+        self.backend.do_periodic_import()
+        self.assertEqual(self.backend.sync_cursor, cursor)
+        self.assertEqual(self.get_local_titles(), ["local", "remote"])
+
+    def test_no_incremental_sync(self):
+        """ A server without incremental sync is asked for it only once """
+        self.server.forced['changes'] = (404, '')
+        self.server.add_task("remote")
+        for i in xrange(3):
+            self.backend.do_periodic_import()
+        self.assertEqual(self.server.requests.count(("changes", None)), 1)
+        self.assertEqual(self.server.requests.count(("get", None)), 3)
+        self.assertEqual(self.get_local_titles(), ["remote"])
+
+    def test_add_error(self):
+        """ The tasks the server fails to add are sent again at the next
+        import """
+        self.backend.do_periodic_import()
+        for answer in ((500, ''), (200, '<html>Server Error</html>')):
+            self.server.forced['new'] = answer
+            self.datastore.new_task().set_title("local %d" % answer[0])
+            self.backend.do_periodic_import()
+        self.assertEqual(self.server.get_titles(), [])
+        del self.server.forced['new']
+        self.backend.do_periodic_import()
+        self.assertEqual(self.server.get_titles(), ["local 200", "local 500"])
+
+    def test_periodic_full_sync(self):
+        """ A full import is done every FULL_SYNC_EVERY imports """
+        for i in xrange(Backend.FULL_SYNC_EVERY + 1):
+            self.backend.do_periodic_import()
+        full_syncs = [request for request in self.server.requests
+                      if request == ("changes", "")]
+        self.assertEqual(len(full_syncs), 2)
+
+    def test_hash_cache(self):
+        """ The hash of a local task is only computed again if the task has
+        been modified """
+        tasks = [self.datastore.new_task() for i in xrange(3)]
+        for task in tasks:
+            task.set_title("task")
+        self.backend.do_periodic_import()
+        hashed = []
+        strip_xml_tags = self.backend.strip_xml_tags
+
+        def counting_strip_xml_tags(text):
+            hashed.append(text)
+            return strip_xml_tags(text)
+        self.backend.strip_xml_tags = counting_strip_xml_tags
+        # a full import looks at all the tasks
+        self.backend.sync_cursor = None
+        self.backend.do_periodic_import()
+        self.assertEqual(hashed, [])
+        tasks[0].set_title("changed")
+        self.backend.sync_cursor = None
+        self.backend.do_periodic_import()
+        # hashed, then sent to the server
+        self.assertEqual(len(hashed), 2)
+        self.assertEqual(self.server.get_titles(), ["changed", "task", "task"])
+        self.assertEqual(sorted(self.backend.get_sync_timings()),
+                         ["fetch", "process", "save"])
+
+    def test_session(self):
+        """ The backend authenticates once, and again when the session
+        expires """
+        self.server.add_task("remote")
+        self.backend.do_periodic_import()
+        self.datastore.new_task().set_title("local")
+        self.backend.do_periodic_import()
+        self.assertEqual(self.server.requests.count(("auth", None)), 1)
+        self.assertEqual(self.server.credentials_sent, 0)
+        self.server.expire_sessions()
+        self.server.update_task(1, "remote changed")
+        self.backend.do_periodic_import()
+        self.assertEqual(self.server.requests.count(("auth", None)), 2)
+        self.assertEqual(self.server.credentials_sent, 0)
+        self.assertEqual(self.get_local_titles(), ["local", "remote changed"])
+
+
+class FakeGTGOnline(threading.Thread):
+    """
+    A stand-in for the GTGOnline! server, running on localhost. It keeps the
+    tasks in memory, and numbers each change so that it can answer the
+    "tasks/changes/" queries.
+    """
+
+    def __init__(self):
+        super(FakeGTGOnline, self).__init__()
+        self.setDaemon(True)
+        # {remote id: task dictionary}
+        self.tasks = {}
+        # {remote id: sequence number of the last change}
+        self.changed = {}
+        self.deleted = {}
+        self.seq = 0
+        self.next_id = 1
+        # (API name, "since" parameter)
+        self.requests = []
+        # the remote ids of the tasks which can't be updated
+        self.failing = set()
+        # the remote ids of the tasks whose update gets an unexpected answer
+        self.garbled = set()
+        # the details of the tasks received by bulk_update
+        self.updates = []
+        # the HTTP status of the answers to the queries of the tasks, if set
+        self.error = None
+        # {API name: (HTTP status, body)}: the answers to give instead of
+        # handling the requests
+        self.forced = {}
+        # the ids of the open sessions
+        self.sessions = set()
+        # number of requests, other than auth, sent with the credentials
+        self.credentials_sent = 0
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+            # keeps the connections open between the requests
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.getheader('content-length'))
+                params = dict((key, values[0]) for key, values in
+                              urlparse.parse_qs(self.rfile.read(length),
+                                                keep_blank_values=True)
+                              .iteritems())
+                cookies = Cookie.SimpleCookie(self.headers.getheader('cookie'))
+                session = cookies['sessionid'].value \
+                    if 'sessionid' in cookies else None
+                with server.lock:
+                    status, body, session = server.handle(self.path, params,
+                                                          session)
+                self.send_response(status)
+                if session is not None:
+                    self.send_header('Set-Cookie',
+                                     'sessionid=%s; Path=/' % session)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+            daemon_threads = True
+
+        self.httpd = Server(('127.0.0.1', 0), Handler)
+
+    def get_url(self):
+        return "http://127.0.0.1:%d/" % self.httpd.server_address[1]
+
+    def run(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _changed(self, web_id):
+        self.seq += 1
+        self.changed[web_id] = self.seq
+
+    def add_task(self, name, status=0, start_date='', due_date=''):
+        web_id = self.next_id
+        self.next_id += 1
+        self.tasks[web_id] = {
+            'id': web_id,
+            'name': name,
+            'description': '',
+            'start_date': start_date,
+            'due_date': due_date,
+            'status': status,
+            'subtasks': [],
+            'tags': [],
+        }
+        self._changed(web_id)
+        return web_id
+
+    def update_task(self, web_id, name):
+        self.tasks[web_id]['name'] = name
+        self._changed(web_id)
+
+    def add_subtask(self, web_id, subtask_id):
+        self.tasks[web_id]['subtasks'].append(subtask_id)
+        self._changed(web_id)
+
+    def delete_task(self, web_id):
+        del self.tasks[web_id]
+        self.changed.pop(web_id, None)
+        self.seq += 1
+        self.deleted[web_id] = self.seq
+
+    def expire_sessions(self):
+        with self.lock:
+            self.sessions.clear()
+
+    def get_titles(self):
+        return sorted(task['name'] for task in self.tasks.itervalues())
+
+    def handle(self, path, params, session):
+        """
+        Answers a request of the API. The requests must carry either the
+        cookie of an open session or the credentials.
+
+        @returns tuple: (HTTP status, body, id of the session to set in a
+                        cookie, or None)
+        """
+        api = path.strip('/').split('/')[-1]
+        authenticated = params.get('email') == "user@example.com" and \
+            params.get('password') == "secret"
+        if api == 'auth_gtg':
+            self.requests.append(("auth", None))
+            if not authenticated:
+                return 200, '0', None
+            session = str(uuid.uuid4())
+            self.sessions.add(session)
+            return 200, '1', session
+        if session not in self.sessions and not authenticated:
+            return 403, '', None
+        if 'password' in params:
+            self.credentials_sent += 1
+        status, body = self._handle_api(api, params)
+        return status, body, None
+
+    def _handle_api(self, api, params):
+        if api in self.forced:
+            self.requests.append((api, None))
+            return self.forced[api]
+        if self.error is not None and api in ('serial', 'changes'):
+            return self.error, ''
+        if api == 'serial':
+            self.requests.append(("get", None))
+            return 200, json.dumps(self.tasks.values())
+        if api == 'changes':
+            since = params['since']
+            self.requests.append(("changes", since))
+            since = int(since) if since else 0
+            return 200, json.dumps({
+                'cursor': str(self.seq),
+                'tasks': [self.tasks[web_id] for web_id, seq in
+                          self.changed.iteritems() if seq > since],
+                'deleted': [web_id for web_id, seq in
+                            self.deleted.iteritems() if seq > since],
+            })
+        if api == 'new':
+            self.requests.append(("new", None))
+            ids = {}
+            for tid, details in json.loads(params['task_list']).iteritems():
+                ids[tid] = str(self.add_task(
+                    details['name'], GTG_STATUS_TO_WEB[details['status']],
+                    details['start_date'], details['due_date']))
+            return 200, json.dumps(ids)
+        if api == 'bulk_update':
+            self.requests.append(("update", None))
+            results = {}
+            for details in json.loads(params['task_list']):
+                web_id = int(details['task_id'])
+                if web_id in self.failing or web_id not in self.tasks:
+                    results[web_id] = 0
+                elif web_id in self.garbled:
+                    results[web_id] = "error"
+                else:
+                    self.updates.append(details)
+                    # only the modified fields are sent
+                    self.update_task(web_id, details.get(
+                        'name', self.tasks[web_id]['name']))
+                    results[web_id] = 1
+            return 200, json.dumps(results)
+        if api == 'delete':
+            self.requests.append(("delete", None))
+            for web_id in json.loads(params['task_id_list']):
+                self.delete_task(int(web_id))
+            return 200, '1'
+        return 404, ''
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromTestCase(TestBackendGTGOnline)
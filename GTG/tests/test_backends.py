@@ -26,12 +26,21 @@ xdg.BaseDirectory.xdg_data_home/gtg directory.
 # Standard imports
 import unittest
 import os
+import uuid
+import shutil
+import tempfile
+import threading
 import xdg
 
 # GTG imports
 from GTG.backends import backend_localfile as localfile
+from GTG.backends.genericbackend import GenericBackend, synchronized
+from GTG.backends.periodicimportbackend import PeriodicImportBackend
+from GTG.backends.syncengine import SyncEngine, SyncMeme
+from GTG.tools.workqueue import WorkQueue
 from GTG.tools import cleanxml
 from GTG.core import CoreConfig
+from GTG.core.datastore import DataStore
 
 
 class GtgBackendsUniTests(unittest.TestCase):
@@ -106,6 +115,75 @@ class GtgBackendsUniTests(unittest.TestCase):
         expectedres = True
         self.assertEqual(res, expectedres)
 
+    def test_localfile_damaged_stream(self):
+        """Tests that a parsing error in the middle of the task file falls
+        back on the backup, keeping the tasks already loaded."""
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, "tasks.xml")
+            task = '\t<task id="%d@1" status="Active" tags="">\n' \
+                '\t\t<title>\n\t\t\t%s\n\t\t</title>\n\t</task>\n'
+            xml = '<?xml version="1.0" ?>\n<project>\n%s</project>\n'
+            with open(path, "w") as xml_file:
+                xml_file.write(xml % "".join(task % (i, "saved %d" % i)
+                                             for i in (0, 1, 1000)))
+            self.assertTrue(cleanxml.backupxml(path))
+            # the error comes after the first chunk read by the parser
+            edited = ["edited %d" % i for i in xrange(300)]
+            with open(path, "w") as xml_file:
+                xml_file.write(xml % ("".join(task % (i, title)
+                                              for i, title in
+                                              enumerate(edited)) +
+                                      "<task id=>"))
+            datastore = DataStore()
+            backend = localfile.Backend({"pid": str(uuid.uuid4()),
+                                         "path": path,
+                                         GenericBackend.KEY_ENABLED: True})
+            backend.register_datastore(datastore.filtered_datastore)
+            backend.initialize()
+            backend.start_get_tasks()
+            loaded = sorted(datastore.get_task(tid).get_title()
+                            for tid in datastore.get_all_tasks())
+            # the tasks read before the error are kept, the others come
+            # from the backup
+            self.assertTrue("edited 0" in loaded)
+            self.assertFalse("saved 0" in loaded)
+            self.assertTrue("saved 1000" in loaded)
+            titles = [cleanxml.readTextNode(node, "title")
+                      for node in backend.xmlproj.childNodes]
+            self.assertEqual(sorted(titles), loaded)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_localfile_stream_drops_nodes(self):
+        """Tests that the task nodes are not kept once streamed, and that
+        the file is parsed again when a task is written."""
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, "tasks.xml")
+            with open(path, "w") as xml_file:
+                xml_file.write('<?xml version="1.0" ?>\n<project>\n'
+                               '\t<task id="0@1" status="Active" tags="">\n'
+                               '\t\t<title>\n\t\t\tfirst\n'
+                               '\t\t</title>\n\t</task>\n</project>\n')
+            datastore = DataStore()
+            backend = localfile.Backend({"pid": str(uuid.uuid4()),
+                                         "path": path,
+                                         GenericBackend.KEY_ENABLED: True})
+            backend.register_datastore(datastore.filtered_datastore)
+            backend.initialize()
+            backend.start_get_tasks()
+            self.assertEqual(backend.doc, None)
+            task = datastore.get_task("0@1")
+            task.set_title("renamed")
+            backend.set_task(task)
+            self.assertTrue(backend._write_xml_file())
+            doc, xmlproject = cleanxml.openxmlfile(path, "project")
+            self.assertEqual(cleanxml.readTextNode(xmlproject, "title"),
+                             "renamed")
+        finally:
+            shutil.rmtree(tmpdir)
+
     def create_test_environment(self):
         """Create the test environment"""
         self.taskfile = 'test.xml'
@@ -134,6 +212,188 @@ class GtgBackendsUniTests(unittest.TestCase):
         open(self.taskpath, 'w').writelines(tasks)
         open(self.datapath, 'w').writelines(data)
 
+    def test_spill_pending_operations(self):
+        """Tests that the operations spilled when quitting are queued again
+        once the tasks of the backend are loaded, and that the ones on tasks
+        which aren't loaded yet are kept."""
+        parameters = {"pid": str(uuid.uuid4()),
+                      GenericBackend.KEY_ENABLED: False}
+        backend = SpillBackend(dict(parameters))
+        backend.queue_remove_task("removed")
+        backend.queue_set_task(FakeTask("saved"))
+        backend.queue_set_task(FakeTask("later"))
+        backend.spill_pending_operations([(WorkQueue.SET, "other")])
+        self.assertEqual(backend.work_queue.get_depth(), 0)
+        # the setting thread doesn't pop operations anymore
+        backend.queue_set_task(FakeTask("late"))
+        backend.launch_setting_thread(bypass_quit_request=True)
+        self.assertTrue(backend.work_queue.is_queued("late", WorkQueue.SET))
+
+        backend = SpillBackend(dict(parameters))
+        backend.register_datastore(FakeDataStore(["saved", "other"]))
+        backend.initialize()
+        # nothing is replayed before the tasks are loaded
+        self.assertEqual(backend.work_queue.get_depth(), 0)
+        backend.replay_spilled_operations()
+        self.assertTrue(
+            backend.work_queue.is_queued("removed", WorkQueue.REMOVE))
+        self.assertTrue(backend.work_queue.is_queued("saved", WorkQueue.SET))
+        self.assertTrue(backend.work_queue.is_queued("other", WorkQueue.SET))
+        self.assertFalse(backend.work_queue.is_queued("later", WorkQueue.SET))
+        # the operations are replayed only once, except the ones which
+        # couldn't be queued
+        backend = SpillBackend(dict(parameters))
+        backend.register_datastore(FakeDataStore(["saved", "later"]))
+        backend.initialize()
+        backend.replay_spilled_operations()
+        self.assertEqual(backend.work_queue.get_depth(), 1)
+        self.assertTrue(backend.work_queue.is_queued("later", WorkQueue.SET))
+        backend = SpillBackend(dict(parameters))
+        backend.register_datastore(FakeDataStore(["saved", "later"]))
+        backend.initialize()
+        backend.replay_spilled_operations()
+        self.assertEqual(backend.work_queue.get_depth(), 0)
+
+    def test_push_new_tasks(self):
+        """Tests that the relationships of the imported tasks are recorded
+        only for the tasks which have been pushed."""
+        backend = PeriodicImportBackend({"pid": str(uuid.uuid4())})
+        backend.sync_engine = SyncEngine()
+        backend.register_datastore(FakeDataStore(["old"]))
+        backend._push_new_tasks([(FakeTask("old"), "remote-old", SyncMeme()),
+                                 (FakeTask("new"), "remote-new", SyncMeme())])
+        self.assertEqual(backend.sync_engine.get_all_local(), ["new"])
+        self.assertEqual(backend.sync_engine.get_local_id("remote-new"),
+                         "new")
+
+    def test_synchronized_methods(self):
+        """Tests that the synchronized methods of a backend don't run at the
+        same time, while those of another backend do."""
+        first = SpillBackend({"pid": str(uuid.uuid4())})
+        second = SpillBackend({"pid": str(uuid.uuid4())})
+        entered = threading.Event()
+        release = threading.Event()
+        thread = threading.Thread(target=first.hold_sync_state,
+                                  args=(entered,),
+                                  kwargs={"release": release})
+        thread.start()
+        entered.wait(5)
+        try:
+            self.assertTrue(entered.is_set())
+            self.assertFalse(first.try_sync_state())
+            self.assertTrue(second.try_sync_state())
+        finally:
+            release.set()
+            thread.join()
+        self.assertTrue(first.try_sync_state())
+        self.assertEqual(first.hold_sync_state.__name__, "hold_sync_state")
+
+    def test_write_task_conflict(self):
+        """Tests that a write is retried when the task is modified while
+        it's being written, and that the sync state is recorded once."""
+        backend = SpillBackend({"pid": str(uuid.uuid4())})
+        backend.register_datastore(FakeDataStore(["task"]))
+        task = backend.datastore.get_task("task")
+        written = []
+        committed = []
+
+        def write():
+            written.append(task.version)
+            # the first write conflicts with a change of the task
+            if len(written) == 1:
+                task.version += 1
+
+        backend._write_task(task, write, lambda: committed.append(
+            task.version))
+        self.assertEqual(written, [0, 1])
+        self.assertEqual(committed, [1])
+
+        def conflicting_write():
+            written.append(task.version)
+            task.version += 1
+
+        del written[:]
+        del committed[:]
+        backend._write_task(task, conflicting_write,
+                            lambda: committed.append(task.version))
+        # the last try holds the task mutex
+        self.assertEqual(len(written), 4)
+        self.assertEqual(len(committed), 1)
+
+
+class SpillBackend(GenericBackend):
+    """A backend which never saves anything"""
+
+    _general_description = {
+        GenericBackend.BACKEND_NAME: "backend_spilltest",
+        GenericBackend.BACKEND_TYPE: GenericBackend.TYPE_READWRITE,
+    }
+
+    def __init__(self, parameters):
+        super(SpillBackend, self).__init__(parameters)
+        # the queued operations must not run during the test
+        self.timer_timestep = 60
+
+    @synchronized
+    def hold_sync_state(self, entered, release):
+        entered.set()
+        release.wait(5)
+
+    def try_sync_state(self):
+        """Returns True if the sync state is free for this thread"""
+        result = []
+
+        def try_acquire():
+            if self._sync_lock.acquire(False):
+                self._sync_lock.release()
+                result.append(True)
+            else:
+                result.append(False)
+
+        thread = threading.Thread(target=try_acquire)
+        thread.start()
+        thread.join()
+        return result[0]
+
+
+class FakeTask(object):
+
+    def __init__(self, tid):
+        self.tid = tid
+        self.version = 0
+
+    def get_id(self):
+        return self.tid
+
+    def get_modified(self):
+        return None
+
+    def get_field_versions(self):
+        return {"title": self.version}
+
+
+class FakeDataStore(object):
+
+    def __init__(self, tids):
+        self.tasks = dict((tid, FakeTask(tid)) for tid in tids)
+
+    def has_task(self, tid):
+        return tid in self.tasks
+
+    def get_task(self, tid):
+        return self.tasks[tid]
+
+    def push_tasks(self, tasks):
+        accepted = [task for task in tasks if task.get_id() not in self.tasks]
+        self.tasks.update((task.get_id(), task) for task in accepted)
+        return accepted
+
+    def get_backend_mutex(self):
+        return threading.Lock()
+
+    def get_task_mutex(self, tid):
+        return threading.Lock()
+
 
 def test_suite():
     return unittest.TestLoader().loadTestsFromName(__name__)
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Getting Things GNOME! - a personal organizer for the GNOME desktop
+# Copyright (c) 2008-2012 - Lionel Dricot & Bertrand Rousseau
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+""" Tests for the content-addressed backup store """
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from GTG.tools import cleanxml
+from GTG.tools.backupstore import BackupStore, split_blocks
+
+XML = '<?xml version="1.0" ?>\n<project>\n%s</project>\n'
+TASK = '\t<task id="%s">\n\t\t<title>\n\t\t\t%s\n\t\t</title>\n\t</task>\n'
+
+
+def make_xml(titles):
+    return XML % "".join(TASK % ("%d@1" % i, title)
+                         for i, title in enumerate(titles))
+
+
+class TestBackupStore(unittest.TestCase):
+    """ Tests for the BackupStore object. """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.store = BackupStore(os.path.join(self.tmpdir, "backup"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def count_objects(self):
+        objects = os.path.join(self.tmpdir, "backup", "objects")
+        return sum(len(files) for path, dirs, files in os.walk(objects))
+
+    def test_split_blocks(self):
+        """ An XML file is cut before each child of the root element """
+        data = make_xml(["one", "two"])
+        blocks = split_blocks(data)
+        self.assertEqual("".join(blocks), data)
+        self.assertEqual(len(blocks), 3)
+        self.assertTrue(blocks[1].startswith('\t<task id="0@1">'))
+        self.assertEqual(split_blocks("x" * 10), ["x" * 10])
+
+    def test_only_changed_blocks_are_written(self):
+        """ A new version writes its changed blocks and its block list """
+        self.store.backup("tasks.xml", make_xml(["a", "b", "c"]), 7)
+        before = self.count_objects()
+        self.store.backup("tasks.xml", make_xml(["a", "B", "c"]), 7)
+        self.assertEqual(self.count_objects(), before + 2)
+        # an unchanged file doesn't make a new version
+        self.store.backup("tasks.xml", make_xml(["a", "B", "c"]), 7)
+        self.assertEqual(len(self.store.get_versions("tasks.xml")), 2)
+
+    def test_point_in_time_restore(self):
+        """ Any version can be restored """
+        self.store.backup("tasks.xml", make_xml(["first"]), 7)
+        middle = time.time()
+        time.sleep(0.01)
+        self.store.backup("tasks.xml", make_xml(["second"]), 7)
+        self.assertEqual(self.store.restore("tasks.xml"),
+                         make_xml(["second"]))
+        self.assertEqual(self.store.restore("tasks.xml", before=middle),
+                         make_xml(["first"]))
+        self.assertEqual(self.store.restore("tasks.xml", before=0), None)
+
+    def test_prune(self):
+        """ Only the last versions and the first one of the day are kept """
+        for i in xrange(6):
+            self.store.backup("tasks.xml", make_xml(["v%d" % i]), 2)
+        versions = self.store.get_versions("tasks.xml")
+        self.assertEqual(len(versions), 3)
+        self.assertEqual(self.store.restore_version(versions[-1][1]),
+                         make_xml(["v0"]))
+        self.assertEqual(self.store.restore("tasks.xml"), make_xml(["v5"]))
+
+    def test_openxmlfile_recovery(self):
+        """ openxmlfile rebuilds a damaged file from the backup store """
+        path = os.path.join(self.tmpdir, "tasks.xml")
+        with open(path, "w") as xml_file:
+            xml_file.write(make_xml(["saved"]))
+        self.assertTrue(cleanxml.backupxml(path))
+        with open(path, "w") as xml_file:
+            xml_file.write(make_xml(["damaged"])[:-20])
+        doc, xmlproject = cleanxml.openxmlfile(path, "project")
+        self.assertEqual(cleanxml.readTextNode(xmlproject, "title"), "saved")
+
+    def test_savexml_is_atomic(self):
+        """ A write which fails leaves the previous file untouched """
+        path = os.path.join(self.tmpdir, "tasks.xml")
+        with open(path, "w") as xml_file:
+            xml_file.write(make_xml(["saved"]))
+        doc, xmlproject = cleanxml.openxmlfile(path, "project")
+        cleanxml.addTextNode(doc, xmlproject, "title", "new")
+
+        def failing_fsync(fd):
+            raise OSError("disk full")
+        fsync = os.fsync
+        os.fsync = failing_fsync
+        try:
+            self.assertFalse(cleanxml.savexml(path, doc))
+        finally:
+            os.fsync = fsync
+        with open(path) as xml_file:
+            self.assertEqual(xml_file.read(), make_xml(["saved"]))
+        self.assertFalse(os.path.exists(path + "__"))
+        self.assertTrue(cleanxml.savexml(path, doc))
+        doc, xmlproject = cleanxml.openxmlfile(path, "project")
+        self.assertEqual(len(xmlproject.getElementsByTagName("title")), 2)
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromTestCase(TestBackupStore)
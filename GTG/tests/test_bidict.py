@@ -64,6 +64,21 @@ class TestBiDict(unittest.TestCase):
         self.assertEqual(missing_first, 2)
         self.assertEqual(missing_second, 2)
 
+    def test_has_and_discard(self):
+        """ Tests for checking and discarding keys which may be missing """
+        bidict = BiDict((1, 'one'), (2, 'two'))
+        self.assertTrue(bidict.has_first(1))
+        self.assertTrue(bidict.has_second('two'))
+        self.assertFalse(bidict.has_first('one'))
+        bidict.discard_by_first(1)
+        bidict.discard_by_second('two')
+        bidict.discard_by_first(3)
+        bidict.discard_by_second('three')
+        self.assertFalse(bidict.has_first(1))
+        self.assertFalse(bidict.has_second('one'))
+        self.assertEqual(bidict._get_all_first(), [])
+        self.assertEqual(bidict._get_all_second(), [])
+
 
 def test_suite():
     return unittest.TestLoader().loadTestsFromTestCase(TestBiDict)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Getting Things GNOME! - a personal organizer for the GNOME desktop
+# Copyright (c) 2008-2012 - Lionel Dricot & Bertrand Rousseau
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+""" Tests for the ChangeFeed class """
+
+import unittest
+
+from GTG.tools.changefeed import ChangeFeed, CursorExpired
+
+
+class TestChangeFeed(unittest.TestCase):
+    """ Tests for the ChangeFeed object. """
+
+    def setUp(self):
+        self.feed = ChangeFeed(retention=5)
+
+    def test_sequence_numbers(self):
+        self.assertEqual(self.feed.get_cursor(), 0)
+        self.assertEqual(self.feed.append(ChangeFeed.ADDED, "1"), 1)
+        self.assertEqual(self.feed.append(ChangeFeed.ADDED, "2"), 2)
+        self.assertEqual(self.feed.get_cursor(), 2)
+        self.assertEqual(self.feed.get_changes(0),
+                         [(1, ChangeFeed.ADDED, "1"),
+                          (2, ChangeFeed.ADDED, "2")])
+        self.assertEqual(self.feed.get_changes(1),
+                         [(2, ChangeFeed.ADDED, "2")])
+        self.assertEqual(self.feed.get_changes(2), [])
+
+    def test_changes_are_collapsed(self):
+        cursor = self.feed.get_cursor()
+        self.feed.append(ChangeFeed.ADDED, "1")
+        self.feed.append(ChangeFeed.MODIFIED, "2")
+        self.feed.append(ChangeFeed.MODIFIED, "1")
+        self.feed.append(ChangeFeed.DELETED, "2")
+        self.assertEqual(self.feed.get_changes(cursor),
+                         [(3, ChangeFeed.ADDED, "1"),
+                          (4, ChangeFeed.DELETED, "2")])
+
+    def test_retention(self):
+        for tid in xrange(7):
+            self.feed.append(ChangeFeed.MODIFIED, str(tid))
+        self.assertRaises(CursorExpired, self.feed.get_changes, 0)
+        self.assertRaises(CursorExpired, self.feed.get_changes, 1)
+        self.assertEqual(len(self.feed.get_changes(2)), 5)
+        self.assertEqual(self.feed.get_changes(6),
+                         [(7, ChangeFeed.MODIFIED, "6")])
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromTestCase(TestChangeFeed)
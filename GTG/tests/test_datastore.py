@@ -22,6 +22,7 @@
 import unittest
 import uuid
 import time
+from datetime import datetime
 from random import randint
 import gobject
 
@@ -29,6 +30,7 @@ import GTG
 from GTG.core.datastore import DataStore
 from GTG.backends.genericbackend import GenericBackend
 from GTG.core import CoreConfig
+from GTG.tools.changefeed import ChangeFeed
 from liblarch import Tree
 
 
@@ -130,6 +132,52 @@ class TestDatastore(unittest.TestCase):
             stored_tasks.sort()
             self.assertEqual(task_ids, stored_tasks)
 
+    def test_push_tasks(self):
+        '''
+        Tests the push_tasks function
+        '''
+        tasks = [self.datastore.task_factory(str(uuid.uuid4()))
+                 for i in xrange(1, 10)]
+        # a task pushed twice in the same batch is accepted once
+        accepted = self.datastore.push_tasks(tasks + tasks[:1])
+        self.assertEqual(accepted, tasks)
+        # the tasks already in the datastore are discarded
+        self.assertEqual(self.datastore.push_tasks(tasks[:3]), [])
+        task_ids = [task.get_id() for task in tasks]
+        stored_tasks = self.datastore.get_all_tasks()
+        task_ids.sort()
+        stored_tasks.sort()
+        self.assertEqual(task_ids, stored_tasks)
+        for task in tasks:
+            self.assertTrue(task.is_loaded())
+
+    def test_set_task_fields(self):
+        '''
+        Tests that the backends receive the fields modified since the task
+        was last saved
+        '''
+        class FieldsBackend(GenericBackend):
+            _general_description = {
+                GenericBackend.BACKEND_TYPE: GenericBackend.TYPE_READONLY}
+            _static_parameters = {}
+            saved = []
+
+            def set_task_fields(self, task, fields):
+                self.saved.append(fields)
+
+        backend = FieldsBackend({"pid": "fields"})
+        task = self.datastore.task_factory(str(uuid.uuid4()))
+        self.datastore.push_task(task)
+        backend._set_modified_fields(task)
+        task.set_title("new title")
+        task.set_title("newer title")
+        task.set_due_date("2013-01-01")
+        backend._set_modified_fields(task)
+        backend._set_modified_fields(task)
+        self.assertEqual(FieldsBackend.saved,
+                         [None, set([task.FIELD_TITLE, task.FIELD_DATES]),
+                          set()])
+
     def test_register_backend(self):
         '''
         Tests the register_backend function. It also tests the
@@ -276,6 +324,106 @@ class TestDatastore(unittest.TestCase):
         new_backend_stored_tids.sort()
         self.assertEqual(new_backend_stored_tids, new_datastore_stored_tids)
 
+    def test_changes_since(self):
+        '''
+        Tests the change feed of the datastore
+        '''
+        task = self.datastore.new_task()
+        cursor = self.datastore.get_change_cursor()
+        task.set_title("changed")
+        other = self.datastore.new_task()
+        self.datastore.get_requester().delete_task(task.get_id())
+        changes = self.datastore.get_changes_since(cursor)
+        self.assertEqual([(action, tid) for seq, action, tid in changes],
+                         [(ChangeFeed.ADDED, other.get_id()),
+                          (ChangeFeed.DELETED, task.get_id())])
+        self.assertEqual(changes[-1][0], self.datastore.get_change_cursor())
+
+    def test_batch(self):
+        '''
+        Tests that the notifications of a batch are sent once, at its end
+        '''
+        tasks = [self.datastore.new_task() for i in xrange(3)]
+        modified = []
+        view = self.datastore.get_tasks_tree().get_main_view()
+        handle = view.register_cllbck(
+            'node-modified', lambda tid, path: modified.append(tid))
+        requester = self.datastore.get_requester()
+        with requester.batch():
+            for task in tasks:
+                task.set_title("first")
+                task.set_title("second")
+            with requester.batch():
+                tasks[0].sync()
+            self.assertEqual(modified, [])
+        view.deregister_cllbck('node-modified', handle)
+        self.assertEqual(modified, [task.get_id() for task in tasks])
+        self.assertEqual(tasks[2].get_title(), "second")
+
+    def test_attached_tags(self):
+        '''
+        Tests that a backend only stores the tasks with its attached tags
+        '''
+        tasks = [self.datastore.new_task() for i in xrange(4)]
+        tasks[0].add_tag('@work')
+        tasks[1].add_tag('@work')
+        backend = FakeBackend(enabled=True, attached_tags=['@work'])
+        self.datastore.register_backend({'backend': backend, 'pid': 'a'})
+        backend_id = backend.get_id()
+        self.datastore.flush_all_tasks(backend_id)
+        sleep_within_loop(2)
+        self.datastore.get_backend(backend_id).sync()
+        self.assertEqual(sorted(backend.fake_get_task_ids()),
+                         sorted([tasks[0].get_id(), tasks[1].get_id()]))
+        # tasks entering and leaving the view of the backend
+        tasks[2].add_tag('@work')
+        tasks[0].remove_tag('@work')
+        tasks[0].sync()
+        sleep_within_loop(2)
+        self.datastore.get_backend(backend_id).sync()
+        self.assertEqual(sorted(backend.fake_get_task_ids()),
+                         sorted([tasks[1].get_id(), tasks[2].get_id()]))
+        # changing the attached tags filters the same view again
+        view = self.datastore.get_backend(backend_id).tasktree
+        self.datastore.backend_change_attached_tags(backend_id, ['@home'])
+        self.datastore.get_backend(backend_id).sync()
+        self.assertEqual(backend.fake_get_task_ids(), [])
+        self.datastore.backend_change_attached_tags(backend_id, ['@work'])
+        self.assertTrue(self.datastore.get_backend(backend_id).tasktree is
+                        view)
+        sleep_within_loop(2)
+        self.datastore.get_backend(backend_id).sync()
+        self.assertEqual(sorted(backend.fake_get_task_ids()),
+                         sorted([tasks[1].get_id(), tasks[2].get_id()]))
+        # attaching the backend to all the tasks
+        self.datastore.backend_change_attached_tags(
+            backend_id, [CoreConfig.ALLTASKS_TAG])
+        sleep_within_loop(2)
+        self.datastore.get_backend(backend_id).sync()
+        self.assertEqual(sorted(backend.fake_get_task_ids()),
+                         sorted(task.get_id() for task in tasks))
+
+    def test_edits_while_loading(self):
+        '''
+        Tests that the tasks edited or deleted while the default backend is
+        loading are saved in it
+        '''
+        backend = LoadingBackend()
+        for i in xrange(3):
+            backend.fake_add_random_task()
+        edited, deleted, untouched = backend.fake_get_task_ids()
+
+        def edit():
+            self.datastore.get_task(edited).set_text("typed while loading")
+            self.requester.delete_task(deleted)
+
+        backend.while_loading = edit
+        self.datastore.register_backend({'backend': backend, 'pid': 'a'})
+        sleep_within_loop(2)
+        self.datastore.get_backend(backend.get_id()).sync()
+        self.assertEqual(backend.saved, [edited])
+        self.assertEqual(backend.fake_get_task_ids(), [edited, untouched])
+
 
 def test_suite():
     return unittest.TestLoader().loadTestsFromTestCase(TestDatastore)
@@ -286,8 +434,9 @@ class FakeBackend(unittest.TestCase):
     Mimics the behavior of a simple backend. Just used for testing
     '''
 
-    def __init__(self, enabled=True):
+    def __init__(self, enabled=True, attached_tags=None):
         self.enabled = enabled
+        self.attached_tags = attached_tags or [CoreConfig.ALLTASKS_TAG]
         self.initialized_count = 0
         self.tasks_ids = []
         self.backend_id = str(uuid.uuid4())
@@ -317,6 +466,9 @@ class FakeBackend(unittest.TestCase):
         for task_id in self.tasks_ids:
             self.datastore.push_task(self.datastore.task_factory(task_id))
 
+    def replay_spilled_operations(self):
+        pass
+
     def quit(self, disabled=False):
         self.enabled = not disabled
 
@@ -327,7 +479,10 @@ class FakeBackend(unittest.TestCase):
         pass
 
     def get_attached_tags(self):
-        return [CoreConfig.ALLTASKS_TAG]
+        return self.attached_tags
+
+    def set_attached_tags(self, tags):
+        self.attached_tags = tags
 
     def register_datastore(self, datastore):
         self.datastore = datastore
@@ -344,3 +499,27 @@ class FakeBackend(unittest.TestCase):
 
     def fake_add_random_task(self):
         self.tasks_ids.append(str(uuid.uuid4()))
+
+
+class LoadingBackend(FakeBackend):
+    '''
+    A FakeBackend which lets the tasks be edited while it's loading them
+    '''
+
+    def __init__(self):
+        FakeBackend.__init__(self)
+        self.while_loading = None
+        self.saved = []
+
+    def start_get_tasks(self):
+        for task_id in self.tasks_ids:
+            task = self.datastore.task_factory(task_id)
+            # as if it had been loaded from a file
+            task.set_modified(datetime(2000, 1, 1))
+            self.datastore.push_task(task)
+        if self.while_loading is not None:
+            self.while_loading()
+
+    def queue_set_task(self, task):
+        self.saved.append(task.get_id())
+        FakeBackend.queue_set_task(self, task)
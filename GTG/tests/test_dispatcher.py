@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Getting Things GNOME! - a personal organizer for the GNOME desktop
+# Copyright (c) 2008-2012 - Lionel Dricot & Bertrand Rousseau
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+""" Tests for the Dispatcher class """
+
+import threading
+import time
+import unittest
+
+from GTG.tools.dispatcher import Dispatcher
+
+
+class TestDispatcher(unittest.TestCase):
+    """ Tests for the Dispatcher object. """
+
+    def setUp(self):
+        self.dispatcher = Dispatcher(workers=2, max_pending=4)
+
+    def test_lane_is_serial(self):
+        done = []
+        running = []
+
+        def job(i):
+            running.append(i)
+            self.assertEqual(len(running), 1)
+            time.sleep(0.01)
+            done.append(i)
+            running.remove(i)
+
+        jobs = [self.dispatcher.submit("lane", job, args=(i, ))
+                for i in xrange(4)]
+        for job in jobs:
+            job.join(5)
+        self.assertEqual(done, range(4))
+        self.assertEqual(self.dispatcher.get_latency("lane")[0], 4)
+
+    def test_lanes_run_in_parallel(self):
+        release = threading.Event()
+        blocked = self.dispatcher.submit("slow", release.wait, args=(5, ))
+        other = self.dispatcher.submit("fast", lambda: None)
+        other.join(5)
+        self.assertTrue(other.is_done())
+        self.assertFalse(blocked.is_done())
+        release.set()
+        blocked.join(5)
+        self.assertTrue(blocked.is_done())
+
+    def test_delay_and_cancel(self):
+        done = []
+        job = self.dispatcher.submit("lane", done.append, args=(1, ),
+                                     delay=10)
+        self.assertEqual(self.dispatcher.get_depth("lane"), 1)
+        job.cancel()
+        job.join(5)
+        self.assertTrue(job.cancelled)
+        self.assertEqual(self.dispatcher.get_depth(), 0)
+        self.assertEqual(done, [])
+
+    def test_backpressure(self):
+        release = threading.Event()
+        self.dispatcher.submit("lane", release.wait, args=(5, ))
+        # wait for the first job to start
+        while self.dispatcher.get_depth() > 0:
+            time.sleep(0.01)
+        for i in xrange(4):
+            self.dispatcher.submit("lane", lambda: None)
+        submitted = threading.Event()
+
+        def submit():
+            self.dispatcher.submit("lane", lambda: None)
+            submitted.set()
+
+        thread = threading.Thread(target=submit)
+        thread.start()
+        self.assertFalse(submitted.wait(0.2))
+        release.set()
+        self.assertTrue(submitted.wait(5))
+        thread.join()
+
+    def test_system_exit(self):
+        """ A job calling sys.exit ends its thread, which is replaced, and
+        doesn't block its lane """
+        def job():
+            raise SystemExit(1)
+        self.dispatcher.submit("lane", job).join(5)
+        done = self.dispatcher.submit("lane", lambda: None)
+        done.join(5)
+        self.assertTrue(done.is_done())
+        self.assertEqual(self.dispatcher.get_latency("lane")[0], 2)
+        self.assertTrue(len(self.dispatcher._threads) <= 2)
+
+    def test_reserved_lane(self):
+        """ A reserved lane runs even when slow jobs take all the shared
+        threads """
+        self.dispatcher.reserve_lane("default")
+        release = threading.Event()
+        slow = [self.dispatcher.submit("slow%d" % i, release.wait,
+                                       args=(5, ))
+                for i in xrange(3)]
+        reserved = self.dispatcher.submit("default", lambda: None)
+        reserved.join(5)
+        self.assertTrue(reserved.is_done())
+        # only two of the slow jobs are running
+        self.assertEqual(self.dispatcher.get_depth(), 1)
+        release.set()
+        for job in slow:
+            job.join(5)
+            self.assertTrue(job.is_done())
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromTestCase(TestDispatcher)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Getting Things GNOME! - a personal organizer for the GNOME desktop
+# Copyright (c) 2008-2012 - Lionel Dricot & Bertrand Rousseau
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+""" Tests for the SaveScheduler class """
+
+import threading
+import time
+import unittest
+
+from GTG.tools.savescheduler import SaveScheduler
+
+
+class TestSaveScheduler(unittest.TestCase):
+    """ Tests for the SaveScheduler object. """
+
+    def setUp(self):
+        self.saved = threading.Event()
+        self.saves = 0
+
+    def save(self):
+        self.saves += 1
+        self.saved.set()
+        return True
+
+    def test_notifications_are_coalesced(self):
+        """ Many notifications result in a single write """
+        scheduler = SaveScheduler(self.save, interval=0.1, max_delay=5)
+        for i in xrange(100):
+            scheduler.mark_dirty()
+        self.saved.wait(5)
+        time.sleep(0.2)
+        self.assertEqual(self.saves, 1)
+        self.assertEqual(scheduler.writes, 1)
+        self.assertEqual(scheduler.get_writes_avoided(), 99)
+        self.assertFalse(scheduler.is_dirty())
+
+    def test_max_delay(self):
+        """ Data which keeps changing is written after max_delay """
+        scheduler = SaveScheduler(self.save, interval=1, max_delay=0.2)
+        start = time.time()
+        while not self.saved.is_set() and time.time() - start < 5:
+            scheduler.mark_dirty()
+            time.sleep(0.02)
+        self.assertTrue(self.saved.is_set())
+        self.assertTrue(time.time() - start < 1)
+
+    def test_flush(self):
+        """ flush() writes right away, and only dirty data """
+        scheduler = SaveScheduler(self.save, interval=60, max_delay=60)
+        self.assertFalse(scheduler.flush())
+        scheduler.mark_dirty()
+        self.assertTrue(scheduler.flush())
+        self.assertEqual(self.saves, 1)
+        self.assertFalse(scheduler.flush())
+        self.assertEqual(self.saves, 1)
+
+    def test_failed_write(self):
+        """ Data is still dirty after a failed write """
+        scheduler = SaveScheduler(lambda: False, interval=60, max_delay=60)
+        scheduler.mark_dirty()
+        self.assertFalse(scheduler.flush())
+        self.assertTrue(scheduler.is_dirty())
+        self.assertEqual(scheduler.writes, 0)
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromTestCase(TestSaveScheduler)
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Getting Things GNOME! - a personal organizer for the GNOME desktop
+# Copyright (c) 2008-2012 - Lionel Dricot & Bertrand Rousseau
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+""" Tests for the StartupOrchestrator class """
+
+import threading
+import time
+import unittest
+
+import gobject
+
+from GTG.core import startup
+from GTG.core.startup import StartupOrchestrator
+
+
+class FakeSource(object):
+    """ Mimics the TaskSource of a backend """
+
+    def __init__(self, backend_id, orchestrator, release=None, fail=False):
+        self.backend_id = backend_id
+        self.orchestrator = orchestrator
+        self.release = release
+        self.fail = fail
+        self.steps = []
+
+    def get_id(self):
+        return self.backend_id
+
+    def initialize(self):
+        self.steps.append("initialize")
+
+    def start_get_tasks(self):
+        self.steps.append("start_get_tasks")
+        if self.fail:
+            # as cleanxml.openxmlfile does on a damaged file
+            raise SystemExit(1)
+        self.orchestrator.run_in_main_loop(self.steps.append, "pushed")
+        if self.release is not None:
+            self.release.wait(5)
+
+
+class FakeDataStore(object):
+
+    def __init__(self):
+        self.queued = []
+
+    def queue_all_tasks(self, backend_id):
+        self.queued.append(backend_id)
+
+
+class TestStartupOrchestrator(unittest.TestCase):
+    """ Tests for the StartupOrchestrator object. """
+
+    def setUp(self):
+        self.datastore = FakeDataStore()
+        self.orchestrator = StartupOrchestrator(self.datastore,
+                                                concurrency=2)
+
+    def test_default_backend_runs_in_main_loop(self):
+        """ The default backend loads in the background, and the functions
+        it runs in the main loop are passed to gobject.idle_add """
+        idle = []
+
+        def idle_add(function, *args):
+            idle.append((function, args))
+
+        release = threading.Event()
+        source = FakeSource("default", self.orchestrator, release=release)
+        real_idle_add = gobject.idle_add
+        startup.gobject.idle_add = idle_add
+        try:
+            # returns while the backend is still loading
+            self.orchestrator.load_default_backend(source)
+            for i in xrange(500):
+                if idle:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(source.steps, ["start_get_tasks"])
+            release.set()
+            for i in xrange(500):
+                if "start_get_tasks" in \
+                        self.orchestrator.get_timings("default"):
+                    break
+                time.sleep(0.01)
+        finally:
+            startup.gobject.idle_add = real_idle_add
+            release.set()
+        for function, args in idle:
+            self.assertFalse(function(*args))
+        self.assertEqual(source.steps, ["start_get_tasks", "pushed"])
+        # out of the loading, the functions run right away
+        self.orchestrator.run_in_main_loop(source.steps.append, "direct")
+        self.assertEqual(source.steps[-1], "direct")
+
+    def test_default_backend_failure(self):
+        """ A SystemExit while loading the default backend is raised again
+        in the main loop """
+        aborted = []
+        self.orchestrator._abort = aborted.append
+        source = FakeSource("default", self.orchestrator, fail=True)
+        self.orchestrator.load_default_backend(source)
+        for i in xrange(500):
+            if aborted:
+                break
+            time.sleep(0.01)
+        self.assertEqual([error.code for error in aborted], [1])
+
+    def test_concurrency_is_bounded(self):
+        release = threading.Event()
+        sources = [FakeSource("backend%d" % i, self.orchestrator,
+                              release=release) for i in xrange(3)]
+        self.orchestrator.start_backends(sources)
+        # wait for the first two backends to block in start_get_tasks
+        for i in xrange(500):
+            if all(source.steps for source in sources[:2]):
+                break
+            time.sleep(0.01)
+        self.assertEqual(sources[2].steps, [])
+        release.set()
+        for i in xrange(500):
+            if len(self.datastore.queued) == 3:
+                break
+            time.sleep(0.01)
+        self.assertEqual(sorted(self.datastore.queued),
+                         ["backend0", "backend1", "backend2"])
+        self.assertEqual(sorted(self.orchestrator.get_timings("backend2")),
+                         ["initialize", "queue_all_tasks", "start_get_tasks"])
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromTestCase(
+        TestStartupOrchestrator)
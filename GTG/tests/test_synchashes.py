@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Getting Things GNOME! - a personal organizer for the GNOME desktop
+# Copyright (c) 2008-2012 - Lionel Dricot & Bertrand Rousseau
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+""" Tests for the SyncHashes class """
+
+import unittest
+
+from GTG.backends.syncengine import SyncHashes
+
+
+class TestSyncHashes(unittest.TestCase):
+    """ Tests for the SyncHashes object. """
+
+    def test_hashes_and_remote_ids(self):
+        """ Hashes are stored by local id, and remote ids can be added and
+        looked up in both directions """
+        hashes = SyncHashes()
+        hashes.set_hash('local', 'hash')
+        self.assertTrue(hashes.has_local_id('local'))
+        self.assertEqual(hashes.get_hash('local'), 'hash')
+        self.assertEqual(hashes.get_remote_id('local'), None)
+        self.assertEqual(hashes.get_local_id('remote'), None)
+        hashes.set_remote_id('local', 'remote')
+        self.assertEqual(hashes.get_remote_id('local'), 'remote')
+        self.assertEqual(hashes.get_local_id('remote'), 'local')
+        hashes.set_hash('local', 'new hash')
+        self.assertEqual(hashes.get_hash('local'), 'new hash')
+        self.assertEqual(hashes.get_remote_id('local'), 'remote')
+        hashes.set_hash('other', 'other hash')
+        self.assertEqual(sorted(hashes.get_all_local()), ['local', 'other'])
+        self.assertEqual(hashes.get_all_remote(), ['remote'])
+
+    def test_remove_local_id(self):
+        """ Removing a local id also forgets its remote id """
+        hashes = SyncHashes()
+        hashes.set_hash('local', 'hash')
+        hashes.set_remote_id('local', 'remote')
+        hashes.remove_local_id('local')
+        self.assertFalse(hashes.has_local_id('local'))
+        self.assertEqual(hashes.get_local_id('remote'), None)
+        self.assertEqual(hashes.get_all_remote(), [])
+        # removing an unknown id does nothing
+        hashes.remove_local_id('local')
+
+    def test_change_remote_id(self):
+        """ Setting a new remote id replaces the old one """
+        hashes = SyncHashes()
+        hashes.set_hash('local', 'hash')
+        hashes.set_remote_id('local', 'old')
+        hashes.set_remote_id('local', 'new')
+        self.assertEqual(hashes.get_local_id('old'), None)
+        self.assertEqual(hashes.get_local_id('new'), 'local')
+
+    def test_move_remote_id(self):
+        """ Relating a remote id to another local id unbinds it from the
+        first one """
+        hashes = SyncHashes()
+        hashes.set_hash('first', 'hash')
+        hashes.set_hash('second', 'hash')
+        hashes.set_remote_id('first', 'remote')
+        hashes.set_remote_id('second', 'remote')
+        self.assertEqual(hashes.get_local_id('remote'), 'second')
+        self.assertEqual(hashes.get_remote_id('first'), None)
+        self.assertEqual(hashes.get_all_remote(), ['remote'])
+        # the stale relationship can't be removed by accident
+        hashes.remove_local_id('first')
+        self.assertEqual(hashes.get_local_id('remote'), 'second')
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromTestCase(TestSyncHashes)
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Getting Things GNOME! - a personal organizer for the GNOME desktop
+# Copyright (c) 2008-2012 - Lionel Dricot & Bertrand Rousseau
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+""" Tests for the TaskJournal class """
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from GTG.tools.taskjournal import TaskJournal
+
+
+class TestTaskJournal(unittest.TestCase):
+    """ Tests for the TaskJournal object. """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "tasks.xml.journal")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_append_and_replay(self):
+        """ Records are replayed in the order they have been appended """
+        journal = TaskJournal(self.path)
+        journal.append_set("1@1", u'<task id="1@1"><title>one\ntwo</title>'
+                                  u'</task>')
+        journal.append_remove("2@1")
+        journal.append_set("3@1", u'<task id="3@1"/>')
+        self.assertEqual(journal.records, 3)
+        journal.close()
+
+        records = TaskJournal(self.path).replay()
+        self.assertEqual(records, [
+            ("set", "1@1", u'<task id="1@1"><title>one\ntwo</title></task>'),
+            ("remove", "2@1", None),
+            ("set", "3@1", u'<task id="3@1"/>')])
+
+    def test_damaged_last_record(self):
+        """ A record truncated by a crash is skipped """
+        journal = TaskJournal(self.path)
+        journal.append_remove("1@1")
+        journal.close()
+        with open(self.path, "a") as journal_file:
+            journal_file.write('{"op": "set", "id": "2@1", "xml": "<ta')
+        records = TaskJournal(self.path).replay()
+        self.assertEqual(records, [("remove", "1@1", None)])
+
+    def test_truncate(self):
+        """ A truncated journal is empty and can be appended again """
+        journal = TaskJournal(self.path)
+        journal.append_remove("1@1")
+        journal.truncate()
+        self.assertEqual(journal.records, 0)
+        self.assertEqual(journal.replay(), [])
+        journal.append_remove("2@1")
+        journal.close()
+        self.assertEqual(journal.replay(), [("remove", "2@1", None)])
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromTestCase(TestTaskJournal)
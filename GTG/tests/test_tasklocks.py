@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Getting Things GNOME! - a personal organizer for the GNOME desktop
+# Copyright (c) 2008-2012 - Lionel Dricot & Bertrand Rousseau
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+""" Tests for the TaskLocks class """
+
+import threading
+import unittest
+
+from GTG.tools.tasklocks import TaskLocks
+
+
+class TestTaskLocks(unittest.TestCase):
+    """ Tests for the TaskLocks object. """
+
+    def setUp(self):
+        self.locks = TaskLocks(stripes=8)
+
+    def _try_acquire_in_thread(self, lock):
+        """ Returns True if another thread can acquire the lock """
+        result = []
+
+        def try_acquire():
+            if lock.acquire(False):
+                lock.release()
+                result.append(True)
+            else:
+                result.append(False)
+
+        thread = threading.Thread(target=try_acquire)
+        thread.start()
+        thread.join()
+        return result[0]
+
+    def test_same_task_same_lock(self):
+        self.assertTrue(self.locks.get_task_lock("1@1") is
+                        self.locks.get_task_lock("1@1"))
+
+    def test_task_locks_are_independent(self):
+        tids = ["%d@1" % i for i in xrange(100)]
+        first = self.locks.get_task_lock(tids[0])
+        other = [tid for tid in tids
+                 if self.locks.get_task_lock(tid) is not first][0]
+        with first:
+            self.assertTrue(self._try_acquire_in_thread(
+                self.locks.get_task_lock(other)))
+            self.assertFalse(self._try_acquire_in_thread(first))
+
+    def test_global_lock_excludes_task_locks(self):
+        with self.locks.get_global_lock():
+            # the holder can still take a task lock
+            with self.locks.get_task_lock("1@1"):
+                pass
+            self.assertFalse(self._try_acquire_in_thread(
+                self.locks.get_task_lock("2@1")))
+        self.assertTrue(self._try_acquire_in_thread(
+            self.locks.get_task_lock("2@1")))
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromTestCase(TestTaskLocks)
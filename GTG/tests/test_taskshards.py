@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Getting Things GNOME! - a personal organizer for the GNOME desktop
+# Copyright (c) 2008-2012 - Lionel Dricot & Bertrand Rousseau
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+""" Tests for the sharded task files """
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from GTG.tools import cleanxml
+from GTG.tools.taskshards import ShardedTaskFile
+
+
+class TestShardedTaskFile(unittest.TestCase):
+    """ Tests for the ShardedTaskFile object. """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.directory = os.path.join(self.tmpdir, "tasks")
+        self.doc = cleanxml.emptydoc("project")[0]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def new_task_node(self, tid):
+        node = self.doc.createElement("task")
+        node.setAttribute("id", tid)
+        return node
+
+    def load(self):
+        sharded = ShardedTaskFile(self.directory, "project", "task",
+                                  shard_size=2)
+        list(sharded.load())
+        return sharded
+
+    def test_write_and_load(self):
+        """ Tasks are spread in shards, which are loaded back in order """
+        sharded = self.load()
+        for i in xrange(5):
+            sharded.add_task_node(self.new_task_node("%d@1" % i))
+        self.assertEqual([shard.size for shard in sharded.shards], [2, 2, 1])
+        self.assertTrue(sharded.write())
+
+        sharded = self.load()
+        self.assertEqual([shard.size for shard in sharded.shards], [2, 2, 1])
+        self.assertEqual([node.getAttribute("id")
+                          for node in sharded.iter_task_nodes()],
+                         ["0@1", "1@1", "2@1", "3@1", "4@1"])
+
+    def test_only_dirty_shards_are_written(self):
+        """ Removing a task rewrites only its shard """
+        sharded = self.load()
+        for i in xrange(4):
+            sharded.add_task_node(self.new_task_node("%d@1" % i))
+        sharded.write()
+
+        sharded = self.load()
+        first, second = sharded.shards
+        node = second.get_task_nodes()[0]
+        sharded.remove_task_node(second, node)
+        os.unlink(first.path)
+        self.assertTrue(sharded.write())
+        self.assertFalse(os.path.exists(first.path))
+        self.assertEqual(self.load().shards[1].size, 1)
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromTestCase(TestShardedTaskFile)
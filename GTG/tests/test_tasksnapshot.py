@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Getting Things GNOME! - a personal organizer for the GNOME desktop
+# Copyright (c) 2008-2012 - Lionel Dricot & Bertrand Rousseau
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+""" Tests for the snapshots of XML task files """
+
+import os
+import shutil
+import tempfile
+import marshal
+import unittest
+
+from GTG.core.datastore import DataStore
+from GTG.core.task import LazyTask
+from GTG.tools import tasksnapshot
+
+
+class TestTaskSnapshot(unittest.TestCase):
+    """ Tests for save_snapshot and load_snapshot. """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.xml_path = os.path.join(self.tmpdir, "tasks.xml")
+        self.path = self.xml_path + ".snapshot"
+        with open(self.xml_path, "w") as xml_file:
+            xml_file.write("<project/>")
+        self.fields = ("<content>c</content>", {("ns", "key"): u"value"})
+        self.record = ("digest", "1@1", "uuid", "Active", u"t\xe9sk",
+                       "2013-01-02", "", "", (2013, 1, 1, 12, 0, 0),
+                       ["@tag"], ["2@1"], [("backend", "42")])
+        self.records = [(self.record, marshal.dumps(self.fields)),
+                        (self.record, marshal.dumps(("", {})))]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_save_and_load(self):
+        """ A snapshot of an unchanged XML file is loaded """
+        self.assertTrue(tasksnapshot.save_snapshot(self.path, self.xml_path,
+                                                   self.records))
+        snapshot = tasksnapshot.load_snapshot(self.path, self.xml_path)
+        self.assertEqual([record[:tasksnapshot.RECORD_FIELDS]
+                          for record in snapshot.records],
+                         [self.record, self.record])
+
+    def test_lazy_fields(self):
+        """ The content and the attributes are read from the snapshot """
+        tasksnapshot.save_snapshot(self.path, self.xml_path, self.records)
+        snapshot = tasksnapshot.load_snapshot(self.path, self.xml_path)
+        offset, length = snapshot.records[0][tasksnapshot.RECORD_FIELDS:]
+        fields = tasksnapshot.LazyFields(snapshot, offset, length)
+        self.assertEqual(fields(), self.fields)
+        self.assertEqual(fields.get_raw(), self.records[0][1])
+
+    def test_lazy_task(self):
+        """ A LazyTask reads its fields from the snapshot when they are
+        first accessed """
+        tasksnapshot.save_snapshot(self.path, self.xml_path, self.records)
+        snapshot = tasksnapshot.load_snapshot(self.path, self.xml_path)
+        fields = tasksnapshot.get_lazy_fields(snapshot.records[0], snapshot)
+        task = DataStore().task_factory("1@1", loader=fields)
+        self.assertTrue(isinstance(task, LazyTask))
+        self.assertFalse(task.is_materialized())
+        # an unopened task is copied as is in the next snapshot
+        record, raw = tasksnapshot.task_to_record(task, "digest")
+        self.assertEqual(raw, self.records[0][1])
+        self.assertFalse(task.is_materialized())
+        self.assertEqual(task.get_text(), "<content>c</content>")
+        self.assertTrue(task.is_materialized())
+        self.assertEqual(task.get_attribute("key", namespace="ns"),
+                         u"value")
+
+    def test_stale_snapshot(self):
+        """ A snapshot is not loaded once the XML file has changed """
+        tasksnapshot.save_snapshot(self.path, self.xml_path, self.records)
+        with open(self.xml_path, "w") as xml_file:
+            xml_file.write("<project></project>")
+        self.assertEqual(
+            tasksnapshot.load_snapshot(self.path, self.xml_path), None)
+
+    def test_damaged_snapshot(self):
+        """ A truncated snapshot or a file in another format is not loaded """
+        tasksnapshot.save_snapshot(self.path, self.xml_path, self.records)
+        with open(self.path, "rb") as snapshot:
+            data = snapshot.read()
+        with open(self.path, "wb") as snapshot:
+            snapshot.write(data[:-5])
+        self.assertEqual(
+            tasksnapshot.load_snapshot(self.path, self.xml_path), None)
+        with open(self.path, "wb") as snapshot:
+            snapshot.write("not a snapshot" * 10)
+        self.assertEqual(
+            tasksnapshot.load_snapshot(self.path, self.xml_path), None)
+
+    def test_missing_snapshot(self):
+        """ There is nothing to load without a snapshot """
+        self.assertEqual(
+            tasksnapshot.load_snapshot(self.path, self.xml_path), None)
+        tasksnapshot.remove_snapshot(self.path)
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromTestCase(TestTaskSnapshot)
@@ -93,6 +93,20 @@ class TestTwoKeyDict(unittest.TestCase):
         tw_dict.add((local_id, remote_id, value))
         self.assertEqual(remote_id, tw_dict._get_secondary_key(local_id))
 
+    def test_set_and_remove_secondary_key(self):
+        tw_dict = TwoKeyDict((1, 'one', 'first'), (2, 'two', 'second'))
+        tw_dict.set_secondary_key(2, 'one')
+        self.assertTrue(tw_dict.has_secondary_key('one'))
+        self.assertFalse(tw_dict.has_secondary_key('two'))
+        self.assertEqual(tw_dict._get_primary_key('one'), 2)
+        self.assertRaises(KeyError, tw_dict._get_secondary_key, 1)
+        # the stored data is kept
+        self.assertTrue(tw_dict.has_primary_key(1))
+        tw_dict.remove_secondary_key(2)
+        tw_dict.remove_secondary_key(2)
+        self.assertFalse(tw_dict.has_secondary_key('one'))
+        self.assertEqual(tw_dict._get_by_primary(2), 'second')
+
 
 def test_suite():
     return unittest.TestLoader().loadTestsFromTestCase(TestTwoKeyDict)
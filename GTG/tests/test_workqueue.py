@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Getting Things GNOME! - a personal organizer for the GNOME desktop
+# Copyright (c) 2008-2012 - Lionel Dricot & Bertrand Rousseau
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+""" Tests for the WorkQueue class """
+
+import unittest
+
+from GTG.tools.workqueue import WorkQueue
+
+
+class TestWorkQueue(unittest.TestCase):
+    """ Tests for the WorkQueue object. """
+
+    def setUp(self):
+        self.queue = WorkQueue()
+
+    def test_fifo_order(self):
+        for tid in ["1", "2", "3"]:
+            self.assertTrue(self.queue.queue_set(tid, "task" + tid))
+        self.assertEqual(self.queue.get_depth(), 3)
+        self.assertEqual(self.queue.pop(), (WorkQueue.SET, "1", "task1"))
+        self.assertEqual(self.queue.pop(), (WorkQueue.SET, "2", "task2"))
+        self.assertEqual(self.queue.pop(), (WorkQueue.SET, "3", "task3"))
+        self.assertRaises(IndexError, self.queue.pop)
+
+    def test_set_is_deduplicated(self):
+        self.queue.queue_set("1")
+        self.queue.queue_set("2")
+        self.assertFalse(self.queue.queue_set("1"))
+        self.assertEqual(self.queue.get_depth(), 2)
+        self.assertEqual(self.queue.pop()[1], "1")
+
+    def test_remove_replaces_set(self):
+        self.queue.queue_set("1", "task1")
+        self.queue.queue_set("2", "task2")
+        self.assertTrue(self.queue.queue_remove("1"))
+        self.assertFalse(self.queue.queue_remove("1"))
+        self.assertTrue(self.queue.is_queued("1", WorkQueue.REMOVE))
+        self.assertFalse(self.queue.is_queued("1", WorkQueue.SET))
+        self.assertEqual(self.queue.get_depth(), 2)
+        self.assertEqual(self.queue.pop(), (WorkQueue.SET, "2", "task2"))
+        self.assertEqual(self.queue.pop(), (WorkQueue.REMOVE, "1", None))
+
+    def test_set_after_remove_is_ignored(self):
+        self.queue.queue_remove("1")
+        self.assertFalse(self.queue.queue_set("1", "task1"))
+        self.assertEqual(self.queue.pop(), (WorkQueue.REMOVE, "1", None))
+        self.assertFalse(self.queue.is_queued("1"))
+
+
+def test_suite():
+    return unittest.TestLoader().loadTestsFromTestCase(TestWorkQueue)
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Getting Things GNOME! - a personal organizer for the GNOME desktop
+# Copyright (c) 2008-2012 - Lionel Dricot & Bertrand Rousseau
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+'''
+A content-addressed store of file backups.
+
+A backed up file is cut in blocks: for the XML files written by cleanxml, a
+block is a child of the root element (a task, usually); other files are cut
+in blocks of fixed size. Each block is stored once, in a file named after the
+hash of its content, so a new backup only writes the blocks which have
+changed since the previous ones.
+A version of a file is the list of the hashes of its blocks. The versions of
+every file are listed, with their date, in "<name>.versions".
+'''
+
+import hashlib
+import os
+import threading
+import time
+import zlib
+
+from GTG.tools.logger import Log
+
+# Size of the blocks of files which are not XML
+BLOCK_SIZE = 64 * 1024
+# An XML block starts with a line opening a child of the root element
+XML_BLOCK_START = "\n\t<"
+
+
+def split_blocks(data):
+    '''
+    Cuts the content of a file in blocks
+    '''
+    if not data.startswith("<?xml"):
+        return [data[i:i + BLOCK_SIZE]
+                for i in xrange(0, len(data), BLOCK_SIZE)] or [""]
+    blocks = []
+    start = 0
+    position = data.find(XML_BLOCK_START)
+    while position != -1:
+        # the closing tags stay with their element
+        end = position + len(XML_BLOCK_START)
+        if data[end:end + 1] != "/":
+            blocks.append(data[start:position + 1])
+            start = position + 1
+        position = data.find(XML_BLOCK_START, position + 1)
+    blocks.append(data[start:])
+    return blocks
+
+
+class BackupStore(object):
+    '''
+    A directory holding the backups of several files
+    '''
+
+    _stores = {}
+    _stores_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, directory):
+        '''
+        Returns the BackupStore of a directory. The stores are shared, so that
+        the blocks known to exist are not checked again on each backup.
+        '''
+        directory = os.path.abspath(directory)
+        with cls._stores_lock:
+            if directory not in cls._stores:
+                cls._stores[directory] = cls(directory)
+            return cls._stores[directory]
+
+    def __init__(self, directory):
+        '''
+        @param directory: the directory of the store. It's created on the
+                          first backup.
+        '''
+        self.directory = directory
+        self._objects = os.path.join(directory, "objects")
+        self._lock = threading.RLock()
+        # hashes of the blocks known to be stored
+        self._known = set()
+        # number of versions forgotten since the unused blocks were deleted
+        self._pruned = 0
+
+    def _versions_path(self, name):
+        return os.path.join(self.directory, "%s.versions" % name)
+
+    def _object_path(self, digest):
+        return os.path.join(self._objects, digest[:2], digest[2:])
+
+    def _write_object(self, data):
+        '''
+        Stores a block, if it's not stored yet
+
+        @returns string: the hash of the block
+        '''
+        digest = hashlib.sha1(data).hexdigest()
+        if digest in self._known:
+            return digest
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            tmpfile = path + "__"
+            with open(tmpfile, "wb") as block:
+                block.write(zlib.compress(data))
+            os.rename(tmpfile, path)
+        self._known.add(digest)
+        return digest
+
+    def _read_object(self, digest):
+        '''
+        Reads a block, checking its hash
+
+        @returns string: the content of the block
+        '''
+        with open(self._object_path(digest), "rb") as block:
+            data = zlib.decompress(block.read())
+        if hashlib.sha1(data).hexdigest() != digest:
+            raise ValueError("Damaged block %s" % digest)
+        return data
+
+    def get_versions(self, name):
+        '''
+        Returns the versions of a file, the newest first
+
+        @param name: the name of the file in the store
+        @returns list: a list of (timestamp, version) tuples
+        '''
+        versions = []
+        path = self._versions_path(name)
+        if not os.path.exists(path):
+            return versions
+        with open(path, "r") as versions_file:
+            for line in versions_file:
+                try:
+                    timestamp, version = line.split()
+                    versions.append((float(timestamp), version))
+                except ValueError:
+                    continue
+        versions.reverse()
+        return versions
+
+    def backup(self, name, data, keep):
+        '''
+        Stores a new version of a file. Nothing is stored if the file has not
+        changed since its last version.
+
+        @param name: the name of the file in the store
+        @param data: the content of the file
+        @param keep: the number of recent versions to keep. The first version
+                     of each day is kept too.
+        @returns string: the version
+        '''
+        with self._lock:
+            blocks = [self._write_object(block)
+                      for block in split_blocks(data)]
+            version = self._write_object("\n".join(blocks))
+            versions = self.get_versions(name)
+            if versions and versions[0][1] == version:
+                return version
+            with open(self._versions_path(name), "a") as versions_file:
+                versions_file.write("%f %s\n" % (time.time(), version))
+            if len(versions) + 1 > keep:
+                self.prune(name, keep)
+            return version
+
+    def restore(self, name, before=None):
+        '''
+        Rebuilds a file, as it was at some point in time
+
+        @param name: the name of the file in the store
+        @param before: a timestamp. The newest version stored before it is
+                       restored. By default, the newest version.
+        @returns string: the content of the file, or None if there is no such
+                         version
+        '''
+        for timestamp, version in self.get_versions(name):
+            if before is None or timestamp <= before:
+                return self.restore_version(version)
+        return None
+
+    def restore_version(self, version):
+        '''
+        Rebuilds a given version of a file
+
+        @returns string: the content of the file
+        '''
+        blocks = self._read_object(version)
+        return "".join(self._read_object(digest)
+                       for digest in blocks.split("\n") if digest)
+
+    def prune(self, name, keep):
+        '''
+        Forgets the old versions of a file, but the "keep" newest ones and the
+        first one of each day. The blocks no longer used are deleted once
+        "keep" versions have been forgotten, since finding them requires
+        reading all the versions.
+        '''
+        with self._lock:
+            versions = self.get_versions(name)
+            versions.reverse()
+            kept = []
+            days = set()
+            for i, (timestamp, version) in enumerate(versions):
+                day = time.strftime("%Y-%m-%d", time.localtime(timestamp))
+                if day not in days or i >= len(versions) - keep:
+                    kept.append((timestamp, version))
+                days.add(day)
+            if len(kept) == len(versions):
+                return
+            path = self._versions_path(name)
+            with open(path + "__", "w") as versions_file:
+                for timestamp, version in kept:
+                    versions_file.write("%f %s\n" % (timestamp, version))
+            os.rename(path + "__", path)
+            self._pruned += len(versions) - len(kept)
+            if self._pruned >= keep:
+                self._collect_garbage()
+                self._pruned = 0
+
+    def _collect_garbage(self):
+        '''
+        Deletes the blocks which are not used by any version
+        '''
+        used = set()
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".versions"):
+                continue
+            for timestamp, version in self.get_versions(
+                    filename[:-len(".versions")]):
+                used.add(version)
+                try:
+                    with open(self._object_path(version), "rb") as block:
+                        used.update(zlib.decompress(block.read()).split("\n"))
+                except (IOError, zlib.error), msg:
+                    Log.warning("Damaged backup version %s: %s" %
+                                (version, msg))
+        for prefix in os.listdir(self._objects):
+            for suffix in os.listdir(os.path.join(self._objects, prefix)):
+                if prefix + suffix not in used:
+                    os.unlink(os.path.join(self._objects, prefix, suffix))
+                    self._known.discard(prefix + suffix)
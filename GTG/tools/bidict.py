@@ -83,6 +83,40 @@ class BiDict(object):
         del self._first_to_second[first]
         del self._second_to_first[second]
 
+    def has_first(self, first):
+        '''
+        Returns True if a pair has the given first key
+
+        @param first: the first key
+        '''
+        return first in self._first_to_second
+
+    def has_second(self, second):
+        '''
+        Returns True if a pair has the given second key
+
+        @param second: the second key
+        '''
+        return second in self._second_to_first
+
+    def discard_by_first(self, first):
+        '''
+        Removes the pair having the given first key, if there is one
+
+        @param first: the first key
+        '''
+        if first in self._first_to_second:
+            self._remove_by_first(first)
+
+    def discard_by_second(self, second):
+        '''
+        Removes the pair having the given second key, if there is one
+
+        @param second: the second key
+        '''
+        if second in self._second_to_first:
+            self._remove_by_second(second)
+
     def _get_all_first(self):
         '''
         Returns the list of all first keys
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Getting Things GNOME! - a personal organizer for the GNOME desktop
+# Copyright (c) 2008-2012 - Lionel Dricot & Bertrand Rousseau
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+'''
+Contains ChangeFeed, the log of the changes made to the tasks.
+
+Each change gets a sequence number, increasing by one at each change. A
+consumer remembers the sequence number of the last change it has seen (its
+cursor) and asks later for the changes made since then, instead of walking
+all the tasks. Only the most recent changes are kept: a consumer whose
+cursor is too old gets CursorExpired, and must walk all the tasks again.
+'''
+
+import threading
+from collections import deque
+from itertools import islice
+
+# Number of changes kept in the feed
+RETENTION = 10000
+
+
+class CursorExpired(Exception):
+    '''
+    Raised when the changes following a cursor are no longer in the feed
+    '''
+    pass
+
+
+class ChangeFeed(object):
+    '''
+    A bounded log of (sequence number, action, task id). All the operations
+    are thread-safe.
+    '''
+
+    ADDED = "added"
+    MODIFIED = "modified"
+    DELETED = "deleted"
+
+    def __init__(self, retention=RETENTION):
+        '''
+        @param retention: the number of changes kept in the feed
+        '''
+        self.retention = retention
+        # (seq, action, tid), oldest first
+        self._changes = deque()
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def append(self, action, tid):
+        '''
+        Records a change
+
+        @param action: ADDED, MODIFIED or DELETED
+        @param tid: the task id
+        @returns int: the sequence number of the change
+        '''
+        with self._lock:
+            self._seq += 1
+            self._changes.append((self._seq, action, tid))
+            if len(self._changes) > self.retention:
+                self._changes.popleft()
+            return self._seq
+
+    def get_cursor(self):
+        '''
+        Returns the sequence number of the last change. Passing it to
+        get_changes() later returns what changed in the meantime.
+        '''
+        return self._seq
+
+    def get_changes(self, cursor):
+        '''
+        Returns the changes made after a cursor. A task changed many times
+        appears once, with the sequence number of its last change: its
+        action is the last one, except that a task added and then modified
+        is still reported as ADDED.
+
+        @param cursor: a value returned by get_cursor(), or the sequence
+                       number of the last change seen
+        @returns list: the (seq, action, tid) tuples, oldest first
+        @raises CursorExpired: if some of the changes made after the cursor
+                               have been dropped
+        '''
+        with self._lock:
+            if cursor >= self._seq:
+                return []
+            first_seq = self._changes[0][0] if self._changes else \
+                self._seq + 1
+            if cursor < first_seq - 1:
+                raise CursorExpired("Changes after %d have been dropped "
+                                    "(the oldest is %d)" % (cursor,
+                                                            first_seq))
+            changes = list(islice(self._changes, cursor - first_seq + 1,
+                                  None))
+        # {tid: (seq, action)}
+        latest = {}
+        for seq, action, tid in changes:
+            if action == self.MODIFIED and tid in latest and \
+                    latest[tid][1] == self.ADDED:
+                action = self.ADDED
+            latest[tid] = (seq, action)
+        return sorted((seq, action, tid)
+                      for tid, (seq, action) in latest.iteritems())
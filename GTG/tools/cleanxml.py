@@ -19,11 +19,13 @@
 
 import os
 import xml.dom.minidom
-import shutil
+import xml.dom.pulldom
+import xml.sax
 import sys
 import re
 import datetime
 
+from GTG.tools.backupstore import BackupStore
 from GTG.tools.logger import Log
 
 # This is for the awful pretty xml things
@@ -94,11 +96,16 @@ def _try_openxmlfile(zefile, root):
     """ Open an XML file and clean whitespaces in it """
     f = open(zefile, "r")
     stringed = f.read()
+    f.close()
+    return _try_openxmlstring(stringed, root)
+
+
+def _try_openxmlstring(stringed, root):
+    """ Parse an XML string and clean whitespaces in it """
     stringed = cleanString(stringed, tab, enter)
     doc = xml.dom.minidom.parseString(stringed)
     cleanDoc(doc, tab, enter)
     xmlproject = doc.getElementsByTagName(root)[0]
-    f.close()
     return doc, xmlproject
 
 
@@ -115,7 +122,8 @@ def openxmlfile(zefile, root):
         - file__
         - file.bak.0
         - file.bak.1
-        - .... until BACKUP_NBR
+        - .... until BACKUP_NBR (backups made by older versions of GTG)
+        - the versions of the file in the backup store, newest first
 
     If file doesn't exist, create a new file """
 
@@ -163,10 +171,77 @@ def openxmlfile(zefile, root):
                 except Exception, msg:
                     Log.warning('Failed with reason: %s' % msg)
 
+        # Try to rebuild it from the backup store
+        store = BackupStore.get(os.path.dirname(backup_name))
+        name = os.path.basename(zefile)
+        for timestamp, version in store.get_versions(name):
+            Log.info("Trying to restore the backup of %s from %s" %
+                     (zefile, datetime.datetime.fromtimestamp(timestamp)))
+            try:
+                return _try_openxmlstring(store.restore_version(version), root)
+            except Exception, msg:
+                Log.warning('Failed with reason: %s' % msg)
+
         Log.info("No suitable backup was found")
         sys.exit(1)
 
 
+def streamxmlfile(zefile, root, tag):
+    """ Open an XML file for incremental parsing
+
+    Works like openxmlfile, but the children of the root element are parsed
+    one at a time, while they are consumed from the returned generator, which
+    yields those named "tag". They are not appended to the root element: this
+    way, the first nodes can be used while the rest of the file is still
+    being parsed, and neither the whole file nor its whole document are ever
+    held in memory.
+
+    If the file is missing or its beginning can't be parsed, this falls back
+    on openxmlfile (and its recovery of backups). A parsing error in the rest
+    of the file is raised by the generator as a xml.sax.SAXParseException.
+
+    @returns (doc, xmlproject, nodes): nodes is the generator
+    """
+    if os.path.exists(zefile):
+        f = open(zefile, "r")
+        try:
+            events = xml.dom.pulldom.parse(f)
+            for event, node in events:
+                if event == xml.dom.pulldom.START_ELEMENT:
+                    if node.tagName == root:
+                        return (node.ownerDocument, node,
+                                _stream_children(f, events, node, tag))
+                    break
+        except xml.sax.SAXParseException, msg:
+            Log.error("Error parsing XML file %s: %s" % (zefile, msg))
+        f.close()
+    doc, xmlproject = openxmlfile(zefile, root)
+    return doc, xmlproject, _iter_children(xmlproject, tag)
+
+
+def _stream_children(f, events, xmlproject, tag):
+    """ Generator used by streamxmlfile to parse the children of the root
+    element one at a time """
+    try:
+        for event, node in events:
+            if event == xml.dom.pulldom.START_ELEMENT:
+                events.expandNode(node)
+                # pulldom splits the text around entities in several nodes
+                node.normalize()
+                cleanNode(node, tab, enter)
+                if node.tagName == tag:
+                    yield node
+    finally:
+        f.close()
+
+
+def _iter_children(xmlproject, tag):
+    """ Yields the children of an already parsed root element named tag """
+    for node in xmlproject.childNodes:
+        if node.nodeName == tag:
+            yield node
+
+
 # Return a doc element with only one root element of the name "root"
 
 def emptydoc(root):
@@ -193,46 +268,45 @@ def savexml(zefile, doc, backup=False):
             return False
 
     try:
-        if os.path.exists(zefile):
-            os.rename(zefile, tmpfile)
-        f = open(zefile, mode='w+')
         pretty = doc.toprettyxml(tab, enter).encode("utf-8")
-        if f and pretty:
-            bwritten = os.write(f.fileno(), pretty)
-            if bwritten != len(pretty):
-                print "error writing file %s" % zefile
+        if pretty:
+            # the file is written aside and renamed over the old one: a crash
+            # can't leave a truncated file behind
+            f = open(tmpfile, mode='w')
+            try:
+                f.write(pretty)
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
                 f.close()
-                return False
-            f.close()
-
-            if os.path.exists(tmpfile):
-                os.unlink(tmpfile)
+            os.rename(tmpfile, zefile)
 
             if backup:
-                # We will now backup the file
-                backup_nbr = BACKUP_NBR
-                # We keep BACKUP_NBR versions of the file
-                # The 0 is the youngest one
-                while backup_nbr > 0:
-                    older = "%s.bak.%s" % (backup_name, backup_nbr)
-                    backup_nbr -= 1
-                    newer = "%s.bak.%s" % (backup_name, backup_nbr)
-                    if os.path.exists(newer):
-                        shutil.move(newer, older)
-                # The bak.0 is always a fresh copy of the closed file
-                # So that it's not touched in case of bad opening next time
-                current = "%s.bak.0" % backup_name
-                shutil.copy(zefile, current)
-
-                daily_backup = "%s.%s.bak" % (backup_name,
-                                              datetime.date.today().strftime(
-                                              "%Y-%m-%d"))
-                if not os.path.exists(daily_backup):
-                    shutil.copy(zefile, daily_backup)
+                return backupxml(zefile)
             return True
         else:
-            print "no file %s or no pretty xml" % zefile
+            print "no pretty xml for %s" % zefile
             return False
-    except IOError, msg:
+    except (IOError, OSError), msg:
+        print msg
+        if os.path.exists(tmpfile):
+            os.unlink(tmpfile)
+        return False
+
+
+def backupxml(zefile):
+    """ Store an XML file in the backup store of the backup/ directory.
+    Only the parts of the file which have changed since the previous backups
+    are written. The store keeps BACKUP_NBR versions of the file, and a daily
+    one. """
+    backup_name = _get_backup_name(zefile)
+    try:
+        f = open(zefile, "r")
+        stringed = f.read()
+        f.close()
+        BackupStore.get(os.path.dirname(backup_name)).backup(
+            os.path.basename(zefile), stringed, BACKUP_NBR)
+        return True
+    except (IOError, OSError), msg:
         print msg
         return False
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Getting Things GNOME! - a personal organizer for the GNOME desktop
+# Copyright (c) 2008-2012 - Lionel Dricot & Bertrand Rousseau
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+'''
+Contains Dispatcher, which runs the background work of the backends on a
+small pool of threads instead of a new thread for each piece of work.
+
+The work is organized in lanes (one per backend, usually): the jobs of a lane
+run one at a time, in the order they have been submitted, so that the
+changes sent to a backend stay ordered. Jobs of different lanes run in
+parallel, up to the size of the pool.
+A lane can be reserved (the one of the default backend, which saves the
+tasks): it gets a thread of its own, so that its jobs never wait for the
+jobs of the other lanes, which can be slow network requests.
+'''
+
+import threading
+import time
+from collections import deque
+
+from GTG.tools.logger import Log
+
+# Number of threads of the pool
+WORKERS = 4
+# Number of jobs which can wait in the dispatcher before submit() blocks
+MAX_PENDING = 64
+
+
+class Job(object):
+    '''
+    A function submitted to the dispatcher. Like a threading.Timer, it can be
+    cancelled before it runs, and joined.
+    '''
+
+    def __init__(self, dispatcher, lane, function, args, kwargs, due):
+        self._dispatcher = dispatcher
+        self.lane = lane
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        # the time at which the job can start
+        self.due = due
+        self.cancelled = False
+        self._done = threading.Event()
+
+    def cancel(self):
+        '''
+        Prevents the job from running, if it hasn't started yet
+        '''
+        self._dispatcher._cancel(self)
+
+    def join(self, timeout=None):
+        '''
+        Waits until the job has run or has been cancelled
+        '''
+        self._done.wait(timeout)
+
+    def is_done(self):
+        return self._done.is_set()
+
+
+class _LaneStats(object):
+    '''
+    The latency of the jobs of a lane
+    '''
+
+    def __init__(self):
+        self.jobs = 0
+        # seconds spent by the jobs waiting for a thread, after their due time
+        self.wait_time = 0.0
+        # seconds spent running the jobs
+        self.run_time = 0.0
+
+
+class Dispatcher(object):
+    '''
+    A pool of threads running the jobs of several serial lanes
+    '''
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def get(cls):
+        '''
+        Returns the dispatcher shared by all the backends
+        '''
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def __init__(self, workers=WORKERS, max_pending=MAX_PENDING):
+        '''
+        @param workers: the maximum number of threads
+        @param max_pending: the number of waiting jobs above which submit()
+                            blocks
+        '''
+        self.workers = workers
+        self.max_pending = max_pending
+        self._condition = threading.Condition()
+        # {lane: deque of jobs}
+        self._lanes = {}
+        # lanes which have a job running
+        self._busy = set()
+        self._pending = 0
+        self._threads = []
+        self._idle_threads = 0
+        self._worker_ids = set()
+        self._stats = {}
+        # lanes which have a thread of their own
+        self._reserved = set()
+
+    def reserve_lane(self, lane):
+        '''
+        Gives a lane a thread of its own: its jobs don't wait for a thread
+        used by the other lanes, and submitting them never blocks.
+
+        @param lane: the name of the lane
+        '''
+        with self._condition:
+            self._reserved.add(lane)
+
+    def submit(self, lane, function, args=(), kwargs=None, delay=0):
+        '''
+        Queues a function to run on a lane.
+        When too many jobs are waiting, this blocks until some of them have
+        run, so that the producers can't outrun the backends. Jobs submitted
+        from the threads of the pool never block.
+
+        @param lane: the name of the lane (the id of a backend, usually)
+        @param function: the function to run
+        @param args: its positional arguments
+        @param kwargs: its keyword arguments
+        @param delay: seconds to wait before running the function
+        @returns Job: the job
+        '''
+        job = Job(self, lane, function, args, kwargs or {},
+                  time.time() + delay)
+        with self._condition:
+            if threading.current_thread().ident not in self._worker_ids and \
+                    lane not in self._reserved:
+                while self._pending >= self.max_pending:
+                    self._condition.wait()
+            self._lanes.setdefault(lane, deque()).append(job)
+            self._pending += 1
+            if self._idle_threads == 0:
+                self._start_thread()
+            self._condition.notify_all()
+        return job
+
+    def _start_thread(self):
+        '''
+        Adds a thread to the pool, unless it's full. Must be called with the
+        condition held.
+        '''
+        if len(self._threads) < self.workers + len(self._reserved):
+            thread = threading.Thread(target=self._run)
+            thread.setDaemon(True)
+            self._threads.append(thread)
+            thread.start()
+
+    def get_depth(self, lane=None):
+        '''
+        Returns the number of jobs waiting to run
+
+        @param lane: if given, only the jobs of this lane are counted
+        '''
+        with self._condition:
+            if lane is None:
+                return self._pending
+            return len(self._lanes.get(lane, ()))
+
+    def get_latency(self, lane):
+        '''
+        Returns the latency of the jobs of a lane
+
+        @returns tuple: (number of jobs run, average seconds spent waiting
+                        for a thread, average seconds spent running)
+        '''
+        with self._condition:
+            stats = self._stats.get(lane)
+            if stats is None or stats.jobs == 0:
+                return 0, 0.0, 0.0
+            return (stats.jobs, stats.wait_time / stats.jobs,
+                    stats.run_time / stats.jobs)
+
+    def _cancel(self, job):
+        with self._condition:
+            jobs = self._lanes.get(job.lane)
+            if jobs is not None and job in jobs:
+                jobs.remove(job)
+                self._pending -= 1
+                job.cancelled = True
+                job._done.set()
+                self._condition.notify_all()
+
+    def _next_job(self):
+        '''
+        Picks the job to run next: the first due job of a lane which has no
+        job running. Jobs of lanes which are not reserved only run if less
+        than "workers" of them are running. Must be called with the
+        condition held.
+
+        @returns tuple: (job, seconds to wait before a job is due). One of
+                        them is None.
+        '''
+        now = time.time()
+        next_due = None
+        shared_full = len(self._busy - self._reserved) >= self.workers
+        for lane, jobs in self._lanes.iteritems():
+            if not jobs or lane in self._busy:
+                continue
+            if shared_full and lane not in self._reserved:
+                continue
+            if jobs[0].due <= now:
+                self._pending -= 1
+                return jobs.popleft(), None
+            if next_due is None or jobs[0].due < next_due:
+                next_due = jobs[0].due
+        if next_due is None:
+            return None, None
+        return None, next_due - now
+
+    def _run(self):
+        '''
+        Body of the threads of the pool. Only the exceptions are caught: a
+        job raising SystemExit (cleanxml exits when the tasks file can't be
+        recovered) ends its thread, which is replaced.
+        '''
+        self._worker_ids.add(threading.current_thread().ident)
+        try:
+            self._run_jobs()
+        finally:
+            with self._condition:
+                self._threads.remove(threading.current_thread())
+                self._worker_ids.discard(threading.current_thread().ident)
+                if self._pending > 0:
+                    self._start_thread()
+
+    def _run_jobs(self):
+        '''
+        Runs the jobs, forever
+        '''
+        while True:
+            with self._condition:
+                while True:
+                    job, delay = self._next_job()
+                    if job is not None:
+                        break
+                    self._idle_threads += 1
+                    self._condition.wait(delay)
+                    self._idle_threads -= 1
+                self._busy.add(job.lane)
+                # some producer may be waiting for a free slot
+                self._condition.notify_all()
+            start = time.time()
+            try:
+                job.function(*job.args, **job.kwargs)
+            except Exception, error:
+                Log.error("Error in a job of %s: %r" % (job.lane, error))
+            finally:
+                end = time.time()
+                with self._condition:
+                    self._busy.discard(job.lane)
+                    stats = self._stats.setdefault(job.lane, _LaneStats())
+                    stats.jobs += 1
+                    stats.wait_time += max(start - job.due, 0)
+                    stats.run_time += end - start
+                    job._done.set()
+                    self._condition.notify_all()
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Getting Things GNOME! - a personal organizer for the GNOME desktop
+# Copyright (c) 2008-2012 - Lionel Dricot & Bertrand Rousseau
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+'''
+Contains SaveScheduler, which coalesces many "something has changed"
+notifications into a few writes done on a dedicated thread.
+'''
+
+import threading
+import time
+
+# Seconds without new modifications before writing
+SAVE_INTERVAL = 2
+# Seconds after which a modification is written, even if more modifications
+# keep coming
+SAVE_MAX_DELAY = 10
+
+
+class SaveScheduler(object):
+    '''
+    Calls a save function on its own thread, once the data has been left
+    alone for "interval" seconds or has been dirty for "max_delay" seconds.
+    All the notifications received in the meantime result in a single write.
+    '''
+
+    def __init__(self, save, interval=SAVE_INTERVAL, max_delay=SAVE_MAX_DELAY):
+        '''
+        @param save: the function which writes the data. It must return True
+                     if the data has been written.
+        @param interval: seconds to wait after the last notification
+        @param max_delay: maximum seconds to wait after the first notification
+        '''
+        self._save = save
+        self.interval = interval
+        self.max_delay = max_delay
+        self._condition = threading.Condition()
+        # writes are serialized, so that flush() and the thread don't write
+        # at the same time
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._first_dirty = None
+        self._last_dirty = None
+        # counters
+        self.notifications = 0
+        self.writes = 0
+
+    def get_writes_avoided(self):
+        '''
+        Returns the number of notifications which didn't result in a write
+        '''
+        return max(self.notifications - self.writes, 0)
+
+    def is_dirty(self):
+        '''
+        Returns True if some notification hasn't been written yet
+        '''
+        with self._condition:
+            return self._first_dirty is not None
+
+    def mark_dirty(self):
+        '''
+        Notifies that the data has changed and must be written
+        '''
+        with self._condition:
+            now = time.time()
+            if self._first_dirty is None:
+                self._first_dirty = now
+            self._last_dirty = now
+            self.notifications += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.setDaemon(True)
+                self._thread.start()
+            self._condition.notify()
+
+    def flush(self):
+        '''
+        Writes the data right away, if it's dirty.
+
+        @returns bool: True if something has been written
+        '''
+        return self._write()
+
+    def _run(self):
+        '''
+        Body of the writing thread. It quits once there is nothing left to
+        write.
+        '''
+        while True:
+            with self._condition:
+                while True:
+                    if self._first_dirty is None:
+                        self._thread = None
+                        return
+                    delay = min(self._last_dirty + self.interval,
+                                self._first_dirty + self.max_delay) - \
+                        time.time()
+                    if delay <= 0:
+                        break
+                    self._condition.wait(delay)
+            self._write()
+
+    def _write(self):
+        '''
+        Calls the save function if the data is dirty. If the save fails, the
+        data is marked as dirty again, so that it's retried later.
+        '''
+        with self._write_lock:
+            with self._condition:
+                if self._first_dirty is None:
+                    return False
+                self._first_dirty = None
+                self._last_dirty = None
+            if self._save():
+                self.writes += 1
+                return True
+            with self._condition:
+                now = time.time()
+                if self._first_dirty is None:
+                    self._first_dirty = now
+                    self._last_dirty = now
+            return False
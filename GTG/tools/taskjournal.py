@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Getting Things GNOME! - a personal organizer for the GNOME desktop
+# Copyright (c) 2008-2012 - Lionel Dricot & Bertrand Rousseau
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+'''
+Contains TaskJournal, an append-only log of task modifications which is kept
+next to an XML task file.
+Each modification is a single line, so that saving a task costs as much as the
+task itself and not as much as the whole file. The journal is folded back in
+the XML file from time to time (see the localfile backend).
+'''
+
+import os
+import json
+import threading
+
+from GTG.tools.logger import Log
+
+
+class TaskJournal(object):
+    '''
+    An append-only journal of "set" and "remove" records.
+    A "set" record carries the XML representation of a single task, a
+    "remove" record just the id of the removed task.
+    '''
+
+    OP_SET = "set"
+    OP_REMOVE = "remove"
+
+    def __init__(self, path):
+        '''
+        @param path: the path of the journal file. It's created on the first
+                     append.
+        '''
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+        self.records = 0
+
+    def append_set(self, tid, task_xml):
+        '''
+        Records that a task has been created or modified
+
+        @param tid: the task id
+        @param task_xml: the XML representation of the task, as a string
+        '''
+        self._append({"op": self.OP_SET, "id": tid, "xml": task_xml})
+
+    def append_remove(self, tid):
+        '''
+        Records that a task has been removed
+
+        @param tid: the task id
+        '''
+        self._append({"op": self.OP_REMOVE, "id": tid})
+
+    def _append(self, record):
+        '''
+        Writes a record at the end of the journal. The record is flushed
+        immediately, so that it survives a crash of GTG.
+
+        @param record: a dictionary
+        '''
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a")
+            self._file.write(line)
+            self._file.flush()
+            self.records += 1
+
+    def replay(self):
+        '''
+        Reads the journal from the beginning.
+        A truncated last line (GTG has been killed while writing it) is
+        skipped.
+
+        @returns list: a list of (op, tid, task_xml) tuples, in the order they
+                       have been appended. task_xml is None for removals.
+        '''
+        records = []
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, "r") as journal:
+            for line in journal:
+                try:
+                    record = json.loads(line)
+                    records.append((record["op"], record["id"],
+                                    record.get("xml", None)))
+                except (ValueError, KeyError):
+                    Log.warning("Skipping damaged record in journal %s" %
+                                self.path)
+        self.records = len(records)
+        return records
+
+    def truncate(self):
+        '''
+        Empties the journal. To be called once its records have been folded
+        in the XML file.
+        '''
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            self.records = 0
+
+    def close(self):
+        '''
+        Closes the journal file. Further appends reopen it.
+        '''
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
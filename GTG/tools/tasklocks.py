@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Getting Things GNOME! - a personal organizer for the GNOME desktop
+# Copyright (c) 2008-2012 - Lionel Dricot & Bertrand Rousseau
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+'''
+Contains TaskLocks, the locks used by the backends to modify the tasks.
+
+A task lock protects a single task: backends modifying different tasks don't
+wait for each other. The task ids are spread over a fixed number of locks
+(the stripes), so that there is no need to create a lock for each task.
+The global lock protects the whole set of tasks (adding and deleting tasks):
+it's acquired by taking all the stripes, so it excludes every task lock.
+
+To avoid deadlocks, never acquire the global lock while holding a task lock,
+nor a task lock while holding another one.
+'''
+
+import threading
+
+# Number of locks the task ids are spread over
+STRIPES = 64
+
+
+class _GlobalLock(object):
+    '''
+    Acquires all the stripes, in order
+    '''
+
+    def __init__(self, stripes):
+        self._stripes = stripes
+
+    def acquire(self):
+        for stripe in self._stripes:
+            stripe.acquire()
+        return True
+
+    def release(self):
+        for stripe in reversed(self._stripes):
+            stripe.release()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class TaskLocks(object):
+    '''
+    A set of striped locks, keyed by task id
+    '''
+
+    def __init__(self, stripes=STRIPES):
+        # re-entrant, so that the holder of the global lock can still take
+        # a task lock
+        self._stripes = [threading.RLock() for i in xrange(stripes)]
+        self._global_lock = _GlobalLock(self._stripes)
+
+    def get_task_lock(self, tid):
+        '''
+        Returns the lock protecting a task. It can be used in a "with"
+        statement.
+
+        @param tid: the task id
+        '''
+        return self._stripes[hash(tid) % len(self._stripes)]
+
+    def get_global_lock(self):
+        '''
+        Returns the lock protecting the whole set of tasks. It can be used in
+        a "with" statement.
+        '''
+        return self._global_lock
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Getting Things GNOME! - a personal organizer for the GNOME desktop
+# Copyright (c) 2008-2012 - Lionel Dricot & Bertrand Rousseau
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+'''
+A sharded task file is a directory which holds the tasks in several small XML
+files (the shards), listed by a manifest. Only the shards which have been
+modified are written (and backed up), instead of the whole set of tasks.
+'''
+
+import os
+import Queue
+import threading
+
+from GTG.tools import cleanxml
+
+MANIFEST_NAME = "manifest.xml"
+MANIFEST_ROOT = "manifest"
+MANIFEST_NODE = "shard"
+# New tasks go in the last shard, until it holds this many tasks
+SHARD_SIZE = 500
+# Number of threads parsing the shards at startup
+LOADING_THREADS = 4
+
+
+class TaskShard(object):
+    '''
+    A single XML file of a sharded task file
+    '''
+
+    def __init__(self, path, root, tag):
+        '''
+        @param path: the path of the XML file
+        @param root: the name of the root element
+        @param tag: the name of the task elements
+        '''
+        self.path = path
+        self.name = os.path.basename(path)
+        self.root = root
+        self.tag = tag
+        self.doc = None
+        self.xmlproj = None
+        # number of task nodes in the shard
+        self.size = 0
+        # True if the shard has been modified since it was last written
+        self.dirty = False
+
+    def new(self):
+        '''
+        Makes this shard an empty one
+        '''
+        self.doc, self.xmlproj = cleanxml.emptydoc(self.root)
+        self.size = 0
+        self.dirty = True
+
+    def load(self):
+        '''
+        Parses the XML file of the shard
+        '''
+        self.doc, self.xmlproj = cleanxml.openxmlfile(self.path, self.root)
+        self.size = len(self.get_task_nodes())
+        self.dirty = False
+
+    def get_task_nodes(self):
+        '''
+        Returns the task nodes of the shard
+        '''
+        return [node for node in self.xmlproj.childNodes
+                if node.nodeName == self.tag]
+
+    def save(self, backup=False):
+        '''
+        Writes the XML file of the shard
+
+        @returns bool: True if the file has been written
+        '''
+        if cleanxml.savexml(self.path, self.doc, backup=backup):
+            self.dirty = False
+            return True
+        return False
+
+
+class ShardedTaskFile(object):
+    '''
+    A directory of shards, and their manifest
+    '''
+
+    def __init__(self, directory, root, tag, shard_size=SHARD_SIZE):
+        '''
+        @param directory: the path of the directory. It's created if needed.
+        @param root: the name of the root element of the shards
+        @param tag: the name of the task elements
+        @param shard_size: the number of tasks put in a shard before starting
+                           a new one
+        '''
+        self.directory = directory
+        self.root = root
+        self.tag = tag
+        self.shard_size = shard_size
+        self.manifest_path = os.path.join(directory, MANIFEST_NAME)
+        self.shards = []
+        self._manifest_dirty = False
+
+    def _new_shard_path(self):
+        '''
+        Returns the path of a shard which is not in the manifest yet
+        '''
+        names = set(shard.name for shard in self.shards)
+        index = len(self.shards)
+        while "shard-%04d.xml" % index in names:
+            index += 1
+        return os.path.join(self.directory, "shard-%04d.xml" % index)
+
+    def load(self):
+        '''
+        Reads the manifest and parses the shards in parallel.
+        This is a generator: it yields the shards in the order they are
+        parsed.
+        '''
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        doc, manifest = cleanxml.openxmlfile(self.manifest_path,
+                                             MANIFEST_ROOT)
+        self.shards = []
+        for node in manifest.childNodes:
+            if node.nodeName == MANIFEST_NODE:
+                # The manifest only names files in its own directory
+                name = os.path.basename(node.getAttribute("name"))
+                self.shards.append(TaskShard(
+                    os.path.join(self.directory, name), self.root, self.tag))
+        self._manifest_dirty = False
+
+        to_load = list(self.shards)
+        to_load_lock = threading.Lock()
+        loaded = Queue.Queue()
+
+        def loading_thread():
+            while True:
+                with to_load_lock:
+                    if not to_load:
+                        return
+                    shard = to_load.pop(0)
+                try:
+                    shard.load()
+                    loaded.put((shard, None))
+                # openxmlfile quits GTG when no backup can be restored: the
+                # error must reach the thread reading the shards
+                except BaseException, error:
+                    loaded.put((shard, error))
+
+        for i in xrange(min(LOADING_THREADS, len(to_load))):
+            thread = threading.Thread(target=loading_thread)
+            thread.setDaemon(True)
+            thread.start()
+        for i in xrange(len(self.shards)):
+            shard, error = loaded.get()
+            if error is not None:
+                raise error
+            yield shard
+
+    def add_task_node(self, node):
+        '''
+        Puts a new task node in the last shard, or in a new shard if the last
+        one is full
+
+        @returns TaskShard: the shard holding the node
+        '''
+        if not self.shards or self.shards[-1].size >= self.shard_size:
+            shard = TaskShard(self._new_shard_path(), self.root, self.tag)
+            shard.new()
+            self.shards.append(shard)
+            self._manifest_dirty = True
+        shard = self.shards[-1]
+        shard.xmlproj.appendChild(node)
+        shard.size += 1
+        shard.dirty = True
+        return shard
+
+    def remove_task_node(self, shard, node):
+        '''
+        Removes a task node from its shard
+        '''
+        shard.xmlproj.removeChild(node)
+        shard.size -= 1
+        shard.dirty = True
+
+    def iter_task_nodes(self):
+        '''
+        Yields all the task nodes, shard after shard
+        '''
+        for shard in self.shards:
+            for node in shard.get_task_nodes():
+                yield node
+
+    def write(self, backup=False):
+        '''
+        Writes the modified shards and, if a shard has been added, the
+        manifest. The manifest is written last, so that it never lists a
+        shard which doesn't exist.
+
+        @param backup: whether to backup the written shards
+        @returns bool: True if everything has been written
+        '''
+        success = True
+        for shard in self.shards:
+            if shard.dirty:
+                success = shard.save(backup=backup) and success
+        if self._manifest_dirty and success:
+            doc, manifest = cleanxml.emptydoc(MANIFEST_ROOT)
+            for shard in self.shards:
+                node = doc.createElement(MANIFEST_NODE)
+                node.setAttribute("name", shard.name)
+                manifest.appendChild(node)
+            if cleanxml.savexml(self.manifest_path, doc):
+                self._manifest_dirty = False
+            else:
+                success = False
+        return success
+
+    def backup(self):
+        '''
+        Backups all the shards
+        '''
+        for shard in self.shards:
+            cleanxml.backupxml(shard.path)
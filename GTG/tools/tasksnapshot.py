@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Getting Things GNOME! - a personal organizer for the GNOME desktop
+# Copyright (c) 2008-2012 - Lionel Dricot & Bertrand Rousseau
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+'''
+A snapshot is a binary copy of the tasks stored in an XML file, which is much
+faster to load than the XML file itself.
+A snapshot records the modification time and the size of the XML file it has
+been taken from: if the XML file has changed since, the snapshot is stale and
+is not loaded.
+The content and the attributes of the tasks are stored after the records of
+all the tasks, so that they can be read only when needed (see LazyFields and
+GTG.core.task.LazyTask).
+'''
+
+import datetime
+import marshal
+import mmap
+import os
+import struct
+
+from GTG.core.task import LazyTask
+from GTG.tools.dates import Date
+from GTG.tools.logger import Log
+
+MAGIC = "GTGSNAP\n"
+# Bump this when the format of the records changes
+VERSION = 2
+# magic, version, modification time and size of the XML file, size of the
+# records
+HEADER = struct.Struct("!8sIdQQ")
+
+# Positions of some fields in a record
+RECORD_DIGEST = 0
+RECORD_ID = 1
+RECORD_STATUS = 3
+RECORD_FIELDS = 12
+
+
+def task_to_record(task, digest):
+    '''
+    Returns the fields of a task which are stored in the XML file.
+    The content and the attributes are the biggest fields and are only needed
+    when a task is displayed: they are stored apart from the record, as a
+    string.
+
+    @param task: the task
+    @param digest: the digest of the task (see taskxml.task_digest)
+    @returns tuple: (record, fields), where record is a tuple of simple
+                    values and fields a string
+    '''
+    if isinstance(task, LazyTask) and \
+            isinstance(task.get_lazy_loader(), LazyFields):
+        # the task has not been opened since it was loaded from a snapshot
+        fields = task.get_lazy_loader().get_raw()
+    else:
+        fields = marshal.dumps((task.get_text(), task.attributes))
+    record = (digest, task.get_id(), task.get_uuid(), task.get_status(),
+              task.get_title(), task.get_due_date().xml_str(),
+              task.get_start_date().xml_str(),
+              task.get_closed_date().xml_str(),
+              task.get_modified().timetuple()[:6], task.get_tags_name(),
+              task.get_children(), task.get_remote_ids().items())
+    return record, fields
+
+
+def get_lazy_fields(record, snapshot):
+    '''
+    Returns the LazyFields of a record, to create a LazyTask
+
+    @param record: a record of snapshot.records
+    @param snapshot: the Snapshot holding the record
+    '''
+    offset, length = record[RECORD_FIELDS:]
+    return LazyFields(snapshot, offset, length)
+
+
+def task_from_record(task, record, snapshot, dates=None):
+    '''
+    Fills an empty task with the fields of a record. This is the counterpart
+    of taskxml.task_from_xml.
+
+    @param task: the task, which must not be loaded yet. If it's a LazyTask
+                 (see get_lazy_fields), its content and attributes are not
+                 read.
+    @param record: a record of snapshot.records
+    @param snapshot: the Snapshot holding the record
+    @param dates: a dictionary used to cache the parsed dates. Pass the same
+                  one when loading many tasks.
+    '''
+    if dates is None:
+        dates = {}
+
+    def get_date(value):
+        if value not in dates:
+            dates[value] = Date(value)
+        return dates[value]
+
+    (digest, tid, uuid, status, title, duedate, startdate, donedate,
+     modified, tags, children, remote_ids, offset, length) = record
+    task.set_uuid(uuid)
+    task.set_title(title)
+    task.set_status(status, donedate=get_date(donedate))
+    # The dates of a snapshot are already consistent, so we don't go through
+    # set_due_date and set_start_date, which update the related tasks
+    task.due_date = get_date(duedate)
+    task.start_date = get_date(startdate)
+    for tag in tags:
+        task.tag_added(tag.decode("UTF-8"))
+    for child in children:
+        task.add_child(child)
+    for backend_id, remote_task_id in remote_ids:
+        task.add_remote_id(backend_id, remote_task_id)
+    if not isinstance(task, LazyTask):
+        content, attributes = LazyFields(snapshot, offset, length)()
+        if content:
+            task.set_text(content)
+        for (namespace, key), value in attributes.iteritems():
+            task.set_attribute(key, value, namespace=namespace)
+    task.set_modified(datetime.datetime(*modified))
+    return task
+
+
+class LazyFields(object):
+    '''
+    The content and the attributes of a task, read from a snapshot when
+    called. It's the loader of a LazyTask.
+    '''
+
+    def __init__(self, snapshot, offset, length):
+        self._snapshot = snapshot
+        self._offset = offset
+        self._length = length
+
+    def get_raw(self):
+        '''
+        Returns the fields as stored in the snapshot
+        '''
+        return self._snapshot.read(self._offset, self._length)
+
+    def __call__(self):
+        '''
+        @returns tuple: (content, attributes)
+        '''
+        return marshal.loads(self.get_raw())
+
+
+class Snapshot(object):
+    '''
+    A loaded snapshot. The fields stored apart from the records are read
+    from the memory-mapped snapshot file when they are needed.
+    '''
+
+    def __init__(self, records, data, fields_offset):
+        '''
+        @param records: the records of the tasks
+        @param data: the content of the snapshot file (a mmap object)
+        @param fields_offset: the position of the fields in data
+        '''
+        self.records = records
+        self._data = data
+        self._fields_offset = fields_offset
+
+    def read(self, offset, length):
+        '''
+        Returns the fields stored at offset
+        '''
+        start = self._fields_offset + offset
+        return self._data[start:start + length]
+
+
+def save_snapshot(path, xml_path, records):
+    '''
+    Writes a snapshot of the tasks of an XML file
+
+    @param path: the path of the snapshot
+    @param xml_path: the path of the XML file, which must be up to date
+    @param records: the (record, fields) tuples of all the tasks of the XML
+                    file, as returned by task_to_record
+    @returns bool: True if the snapshot has been written
+    '''
+    tmpfile = path + "__"
+    offset = 0
+    index = []
+    for record, fields in records:
+        index.append(record + (offset, len(fields)))
+        offset += len(fields)
+    try:
+        index = marshal.dumps(index)
+        xml_stat = os.stat(xml_path)
+        with open(tmpfile, "wb") as snapshot:
+            snapshot.write(HEADER.pack(MAGIC, VERSION, xml_stat.st_mtime,
+                                       xml_stat.st_size, len(index)))
+            snapshot.write(index)
+            for record, fields in records:
+                snapshot.write(fields)
+        os.rename(tmpfile, path)
+        return True
+    except (IOError, OSError, ValueError), msg:
+        Log.error("Error writing snapshot %s: %s" % (path, msg))
+        return False
+
+
+def load_snapshot(path, xml_path):
+    '''
+    Reads a snapshot of the tasks of an XML file
+
+    @param path: the path of the snapshot
+    @param xml_path: the path of the XML file
+    @returns Snapshot: the snapshot, or None if there is no valid snapshot of
+                       the current XML file
+    '''
+    if not os.path.exists(path) or not os.path.exists(xml_path):
+        return None
+    try:
+        xml_stat = os.stat(xml_path)
+        with open(path, "rb") as snapshot:
+            header = snapshot.read(HEADER.size)
+            if len(header) != HEADER.size:
+                return None
+            magic, version, mtime, size, index_size = HEADER.unpack(header)
+            if magic != MAGIC or version != VERSION:
+                return None
+            if mtime != xml_stat.st_mtime or size != xml_stat.st_size:
+                Log.debug("Snapshot %s is stale" % path)
+                return None
+            data = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+        fields_offset = HEADER.size + index_size
+        records = marshal.loads(data[HEADER.size:fields_offset])
+        if not isinstance(records, list):
+            return None
+        for record in records:
+            if record[RECORD_FIELDS] + record[RECORD_FIELDS + 1] > \
+                    len(data) - fields_offset:
+                return None
+    except (IOError, OSError, EOFError, ValueError, TypeError,
+            IndexError, mmap.error), msg:
+        Log.warning("Error reading snapshot %s: %s" % (path, msg))
+        return None
+    return Snapshot(records, data, fields_offset)
+
+
+def remove_snapshot(path):
+    '''
+    Removes a snapshot, if it exists
+    '''
+    if os.path.exists(path):
+        os.unlink(path)
@@ -18,13 +18,19 @@
 # -----------------------------------------------------------------------------
 
 # Functions to convert a Task object to an XML string and back
-import xml.dom.minidom as minidom
 import xml.sax.saxutils as saxutils
 from datetime import datetime
+from hashlib import md5
 
 from GTG.tools import cleanxml
 from GTG.tools.dates import Date
 
+# Children of a task node which hold a single text value
+TEXT_FIELDS = ("title", "donedate", "duedate", "startdate", "modified",
+               "content")
+CONTENT_START = "<content>"
+CONTENT_END = "</content>"
+
 
 def get_text(node):
     if len(node.childNodes) > 0:
@@ -42,25 +48,46 @@ def read_node(xmlnode, name):
 
 
 # Take an empty task, an XML node and return a Task.
+# The children of the node are visited once: their values are collected, then
+# set on the task in the order the task expects them.
 
 def task_from_xml(task, xmlnode):
     # print "********************************"
     # print xmlnode.toprettyxml()
 
+    fields = {}
+    subtasks = []
+    attributes = []
+    remote_ids = []
+    for node in xmlnode.childNodes:
+        name = node.nodeName
+        if name == "subtask":
+            subtasks.append(get_text(node))
+        elif name == "attribute":
+            attributes.append((node.getAttribute("namespace"),
+                               node.getAttribute("key"), get_text(node)))
+        elif name == "task-remote-ids":
+            for backend in node.childNodes:
+                if backend.nodeType == backend.ELEMENT_NODE:
+                    remote_ids.append(backend)
+                    break
+        elif name in TEXT_FIELDS and name not in fields:
+            fields[name] = get_text(node)
+
     task.set_uuid(xmlnode.getAttribute("uuid"))
-    task.set_title(read_node(xmlnode, "title"))
+    task.set_title(fields.get("title", ""))
 
     status = xmlnode.getAttribute("status")
-    donedate = Date.parse(read_node(xmlnode, "donedate"))
+    donedate = Date.parse(fields.get("donedate", ""))
     task.set_status(status, donedate=donedate)
 
-    duedate = Date(read_node(xmlnode, "duedate"))
+    duedate = Date(fields.get("duedate", ""))
     task.set_due_date(duedate)
 
-    startdate = Date(read_node(xmlnode, "startdate"))
+    startdate = Date(fields.get("startdate", ""))
     task.set_start_date(startdate)
 
-    modified = read_node(xmlnode, "modified")
+    modified = fields.get("modified", "")
     if modified != "":
         modified = datetime.strptime(modified, "%Y-%m-%dT%H:%M:%S")
         task.set_modified(modified)
@@ -71,36 +98,26 @@ def task_from_xml(task, xmlnode):
         # FIXME why unescape????
         task.tag_added(saxutils.unescape(tag))
 
-    # FIXME why we need to convert that through an XML?
-    content = read_node(xmlnode, "content")
+    # The content is kept as it is stored: it's already the XML of the task
+    # description, without the enclosing <content> element
+    content = fields.get("content", "")
     if content != "":
-        content = "<content>%s</content>" % content
-        content = minidom.parseString(content).firstChild.toxml()
-        task.set_text(content)
-
-    for subtask in xmlnode.getElementsByTagName("subtask"):
-        task.add_child(get_text(subtask))
-
-    for attr in xmlnode.getElementsByTagName("attribute"):
-        if len(attr.childNodes) > 0:
-            value = get_text(attr)
-        else:
-            value = ""
-        key = attr.getAttribute("key")
-        namespace = attr.getAttribute("namespace")
+        task.set_text("<content>%s</content>" % content)
+
+    for subtask in subtasks:
+        task.add_child(subtask)
+
+    for namespace, key, value in attributes:
         task.set_attribute(key, value, namespace=namespace)
 
     # FIXME do we need remote task ids? I don't think so
     # FIXME if so => rework them into a more usable structure!!!
     #                (like attributes)
     # REMOTE TASK IDS
-    remote_ids_list = xmlnode.getElementsByTagName("task-remote-ids")
-    for remote_id in remote_ids_list:
-        if remote_id.childNodes:
-            node = remote_id.childNodes[0]
-            backend_id = node.firstChild.nodeValue
-            remote_task_id = node.childNodes[1].firstChild.nodeValue
-            task.add_remote_id(backend_id, remote_task_id)
+    for node in remote_ids:
+        backend_id = node.firstChild.nodeValue
+        remote_task_id = node.childNodes[1].firstChild.nodeValue
+        task.add_remote_id(backend_id, remote_task_id)
 
     return task
 
@@ -138,13 +155,12 @@ def task_to_xml(doc, task):
         t_xml.appendChild(element)
     tex = task.get_text()
     if tex:
-        # We take the xml text and convert it to a string
-        # but without the "<content />"
-        element = minidom.parseString(tex)
-        temp = element.firstChild.toxml().partition("<content>")[2]
-
-        desc = temp.partition("</content>")[0]
-        # t_xml.appendChild(element.firstChild)
+        # We take the xml text without the "<content />"
+        desc = tex
+        if desc.startswith(CONTENT_START):
+            desc = desc[len(CONTENT_START):]
+        if desc.endswith(CONTENT_END):
+            desc = desc[:-len(CONTENT_END)]
         cleanxml.addTextNode(doc, t_xml, "content", desc)
     # self.__write_textnode(doc,t_xml,"content",t.get_text())
 
@@ -162,3 +178,18 @@ def task_to_xml(doc, task):
         task_element.appendChild(doc.createTextNode(task_id))
 
     return t_xml
+
+
+# Return a digest of the fields of the task which are written by task_to_xml.
+# Two tasks with the same digest have the same XML representation, but the
+# digest is much cheaper to compute than the XML.
+
+def task_digest(task):
+    fields = (task.get_id(), task.get_status(), task.get_uuid(),
+              task.get_tags_name(), task.get_title(),
+              task.get_due_date().xml_str(), task.get_modified_string(),
+              task.get_start_date().xml_str(),
+              task.get_closed_date().xml_str(), task.get_children(),
+              sorted(task.attributes.iteritems()), task.get_text(),
+              sorted(task.get_remote_ids().iteritems()))
+    return md5(repr(fields)).hexdigest()
@@ -115,6 +115,44 @@ class TwoKeyDict(object):
         '''
         return self._key_to_key_bidict._get_by_second(secondary)
 
+    def has_primary_key(self, primary):
+        '''
+        Returns True if some data is stored with the given primary key
+
+        @param primary: the primary key
+        '''
+        return primary in self._primary_to_value
+
+    def has_secondary_key(self, secondary):
+        '''
+        Returns True if the given secondary key is bound to a primary key
+
+        @param secondary: the secondary key
+        '''
+        return self._key_to_key_bidict.has_second(secondary)
+
+    def set_secondary_key(self, primary, secondary):
+        '''
+        Binds a secondary key to a primary key. The previous secondary key of
+        the primary one and the previous primary key of the secondary one are
+        unbound, so each key is bound to a single other key.
+
+        @param primary: the primary key
+        @param secondary: the secondary key
+        '''
+        self._key_to_key_bidict.discard_by_first(primary)
+        self._key_to_key_bidict.discard_by_second(secondary)
+        self._key_to_key_bidict.add((primary, secondary))
+
+    def remove_secondary_key(self, primary):
+        '''
+        Unbinds the secondary key of a primary key, if it has one. The stored
+        data is kept.
+
+        @param primary: the primary key
+        '''
+        self._key_to_key_bidict.discard_by_first(primary)
+
     def _get_all_primary_keys(self):
         '''
         Returns all primary keys
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Getting Things GNOME! - a personal organizer for the GNOME desktop
+# Copyright (c) 2008-2012 - Lionel Dricot & Bertrand Rousseau
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+'''
+Contains WorkQueue, the queue of the tasks waiting to be saved or removed by
+a backend.
+'''
+
+import threading
+from collections import OrderedDict
+
+
+class WorkQueue(object):
+    '''
+    An ordered set of pending operations on tasks, identified by their task
+    id. There is at most one operation queued for each task id: queuing a
+    task which is already queued does nothing, and removing a task cancels
+    the saving of the task if it's still pending.
+    Operations are popped in the order they have been queued. All the
+    operations take constant time and are thread-safe.
+    '''
+
+    SET = "set"
+    REMOVE = "remove"
+
+    def __init__(self):
+        # {tid: (action, value)}
+        self._queue = OrderedDict()
+        self._lock = threading.Lock()
+
+    def queue_set(self, tid, value=None):
+        '''
+        Queues the saving of a task. Nothing is done if the task is already
+        queued, either to be saved or to be removed.
+
+        @param tid: the task id
+        @param value: what pop() returns along with the task id (the task
+                      object, usually)
+        @returns bool: True if the operation has been queued
+        '''
+        with self._lock:
+            if tid in self._queue:
+                return False
+            self._queue[tid] = (self.SET, value)
+            return True
+
+    def queue_remove(self, tid):
+        '''
+        Queues the removal of a task. If the task is queued to be saved, the
+        saving is replaced by the removal.
+
+        @param tid: the task id
+        @returns bool: True if the operation has been queued
+        '''
+        with self._lock:
+            if tid in self._queue:
+                if self._queue[tid][0] == self.REMOVE:
+                    return False
+                del self._queue[tid]
+            self._queue[tid] = (self.REMOVE, None)
+            return True
+
+    def pop(self):
+        '''
+        Removes the oldest operation from the queue
+
+        @returns tuple: (action, tid, value), where action is SET or REMOVE
+        @raises IndexError: if the queue is empty
+        '''
+        with self._lock:
+            try:
+                tid, (action, value) = self._queue.popitem(last=False)
+            except KeyError:
+                raise IndexError("pop from an empty WorkQueue")
+            return action, tid, value
+
+    def is_queued(self, tid, action=None):
+        '''
+        Returns True if an operation is queued for a task
+
+        @param action: if given, only an operation of this kind counts
+        '''
+        with self._lock:
+            if tid not in self._queue:
+                return False
+            return action is None or self._queue[tid][0] == action
+
+    def get_depth(self):
+        '''
+        Returns the number of operations waiting in the queue
+        '''
+        return len(self._queue)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Getting Things GNOME! - a personal organizer for the GNOME desktop
+# Copyright (c) 2008-2012 - Lionel Dricot & Bertrand Rousseau
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+"""
+Benchmark for the localfile backend: marks a batch of tasks as done and
+measures how long the backend takes to store them.
+Run it from the root of the GTG source tree:
+    ./scripts/benchmark_localfile.py [-n 5000] [--no-journal]
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import time
+from optparse import OptionParser
+
+sys.path.insert(0, os.getcwd())
+
+from GTG.core import CoreConfig
+from GTG.core.datastore import DataStore
+from GTG.core.task import Task
+from GTG.backends import backend_localfile
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-n", "--tasks", type="int", dest="tasks",
+                      default=5000, help="number of tasks to mark as done")
+    parser.add_option("--no-journal", action="store_false", dest="journal",
+                      default=True, help="rewrite the whole XML file "
+                      "instead of appending to the journal")
+    (options, args) = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp()
+    CoreConfig().set_data_dir(data_dir)
+    try:
+        datastore = DataStore()
+        backend = backend_localfile.Backend({
+            "path": os.path.join(data_dir, "gtg_tasks.xml"),
+            "pid": "benchmark",
+            "Enabled": True,
+            "journal": options.journal})
+        backend.register_datastore(datastore.filtered_datastore)
+        backend.initialize()
+
+        tasks = []
+        for i in xrange(options.tasks):
+            task = datastore.new_task()
+            task.set_title("Benchmark task %d" % i)
+            backend.set_task(task)
+            tasks.append(task)
+
+        start = time.time()
+        for task in tasks:
+            task.set_status(Task.STA_DONE)
+            backend.set_task(task)
+        elapsed = time.time() - start
+        backend.quit()
+
+        print "Marked %d tasks as done in %.3f s (%.3f ms per task)" % (
+            options.tasks, elapsed, elapsed * 1000.0 / options.tasks)
+        if not options.journal:
+            scheduler = backend._save_scheduler
+            print "%d writes of the XML file, %d avoided" % (
+                scheduler.writes, scheduler.get_writes_avoided())
+    finally:
+        shutil.rmtree(data_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+# Getting Things GNOME! - a personal organizer for the GNOME desktop
+# Copyright (c) 2008-2012 - Lionel Dricot & Bertrand Rousseau
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more
+# details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program.  If not, see <http://www.gnu.org/licenses/>.
+# -----------------------------------------------------------------------------
+
+"""
+Micro-benchmark for GTG.tools.taskxml: decodes and encodes a batch of tasks
+with the current functions and with the ones they replaced, which searched
+the task node once per field and parsed the content of every task with
+minidom.
+Run it from the root of the GTG source tree:
+    ./scripts/benchmark_taskxml.py [-n 10000]
+"""
+
+import os
+import sys
+import time
+import xml.dom.minidom as minidom
+import xml.sax.saxutils as saxutils
+from datetime import datetime
+from optparse import OptionParser
+
+sys.path.insert(0, os.getcwd())
+
+from GTG.core.datastore import DataStore
+from GTG.tools import cleanxml, taskxml
+from GTG.tools.dates import Date
+
+
+def old_task_from_xml(task, xmlnode):
+    """ taskxml.task_from_xml, as it was before the single-pass decoder """
+    task.set_uuid(xmlnode.getAttribute("uuid"))
+    task.set_title(taskxml.read_node(xmlnode, "title"))
+    status = xmlnode.getAttribute("status")
+    donedate = Date.parse(taskxml.read_node(xmlnode, "donedate"))
+    task.set_status(status, donedate=donedate)
+    task.set_due_date(Date(taskxml.read_node(xmlnode, "duedate")))
+    task.set_start_date(Date(taskxml.read_node(xmlnode, "startdate")))
+    modified = taskxml.read_node(xmlnode, "modified")
+    if modified != "":
+        modified = datetime.strptime(modified, "%Y-%m-%dT%H:%M:%S")
+        task.set_modified(modified)
+    tags = xmlnode.getAttribute("tags").replace(' ', '')
+    tags = (tag for tag in tags.split(',') if tag.strip() != "")
+    for tag in tags:
+        task.tag_added(saxutils.unescape(tag))
+    content = taskxml.read_node(xmlnode, "content")
+    if content != "":
+        content = "<content>%s</content>" % content
+        content = minidom.parseString(content).firstChild.toxml()
+        task.set_text(content)
+    for subtask in xmlnode.getElementsByTagName("subtask"):
+        task.add_child(taskxml.get_text(subtask))
+    for attr in xmlnode.getElementsByTagName("attribute"):
+        task.set_attribute(attr.getAttribute("key"), taskxml.get_text(attr),
+                           namespace=attr.getAttribute("namespace"))
+    for remote_id in xmlnode.getElementsByTagName("task-remote-ids"):
+        if remote_id.childNodes:
+            node = remote_id.childNodes[0]
+            task.add_remote_id(node.firstChild.nodeValue,
+                               node.childNodes[1].firstChild.nodeValue)
+    return task
+
+
+def old_task_to_xml(doc, task):
+    """ taskxml.task_to_xml, as it was before: the content went through
+    minidom """
+    t_xml = doc.createElement("task")
+    t_xml.setAttribute("id", task.get_id())
+    t_xml.setAttribute("status", task.get_status())
+    t_xml.setAttribute("uuid", task.get_uuid())
+    tags_str = ""
+    for tag in task.get_tags_name():
+        tags_str = tags_str + saxutils.escape(str(tag)) + ","
+    t_xml.setAttribute("tags", tags_str[:-1])
+    cleanxml.addTextNode(doc, t_xml, "title", task.get_title())
+    cleanxml.addTextNode(doc, t_xml, "duedate", task.get_due_date().xml_str())
+    cleanxml.addTextNode(doc, t_xml, "modified", task.get_modified_string())
+    cleanxml.addTextNode(doc, t_xml, "startdate",
+                         task.get_start_date().xml_str())
+    cleanxml.addTextNode(doc, t_xml, "donedate",
+                         task.get_closed_date().xml_str())
+    childs = task.get_children()
+    for c in childs:
+        cleanxml.addTextNode(doc, t_xml, "subtask", c)
+    for a in task.attributes:
+        namespace, key = a
+        content = task.attributes[a]
+        element = doc.createElement('attribute')
+        element.setAttribute("namespace", namespace)
+        element.setAttribute("key", key)
+        element.appendChild(doc.createTextNode(content))
+        t_xml.appendChild(element)
+    tex = task.get_text()
+    if tex:
+        element = minidom.parseString(tex)
+        temp = element.firstChild.toxml().partition("<content>")[2]
+        desc = temp.partition("</content>")[0]
+        cleanxml.addTextNode(doc, t_xml, "content", desc)
+
+    remote_ids_element = doc.createElement("task-remote-ids")
+    t_xml.appendChild(remote_ids_element)
+    remote_ids_dict = task.get_remote_ids()
+    for backend_id, task_id in remote_ids_dict.iteritems():
+        backend_element = doc.createElement('backend')
+        remote_ids_element.appendChild(backend_element)
+        backend_element.appendChild(doc.createTextNode(backend_id))
+        task_element = doc.createElement('task-id')
+        backend_element.appendChild(task_element)
+        task_element.appendChild(doc.createTextNode(task_id))
+
+    return t_xml
+
+
+def make_nodes(datastore, doc, number):
+    """ Creates the XML nodes of "number" tasks """
+    nodes = []
+    for i in xrange(number):
+        task = datastore.new_task()
+        task.set_title("Benchmark task %d" % i)
+        task.set_due_date(Date.parse("2013-05-%02d" % (i % 28 + 1)))
+        task.set_text("<content><tag>@work</tag> write the report for "
+                      "&lt;client %d&gt;\n<subtask>%d@1</subtask></content>"
+                      % (i, i + 1))
+        task.tags.append("@work")
+        task.set_attribute("list", "inbox", namespace="benchmark")
+        task.add_remote_id("benchmark-backend", str(i))
+        nodes.append(taskxml.task_to_xml(doc, task))
+    return nodes
+
+
+def measure(name, number, function):
+    """ Runs function and prints its throughput """
+    start = time.time()
+    function()
+    elapsed = time.time() - start
+    print "%-8s %.3f s (%d tasks per second)" % (name, elapsed,
+                                                 number / elapsed)
+    return elapsed
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("-n", "--tasks", type="int", dest="tasks",
+                      default=10000, help="number of tasks")
+    (options, args) = parser.parse_args()
+
+    datastore = DataStore()
+    doc, xmlproj = cleanxml.emptydoc("project")
+    nodes = make_nodes(datastore, doc, options.tasks)
+    tasks = {}
+
+    def decode(function, suffix):
+        def run():
+            for node in nodes:
+                tid = node.getAttribute("id") + suffix
+                tasks[tid] = function(datastore.task_factory(tid), node)
+        return run
+
+    def encode(function, suffix):
+        def run():
+            for node in nodes:
+                function(doc, tasks[node.getAttribute("id") + suffix])
+        return run
+
+    print "Decoding %d tasks" % options.tasks
+    old = measure("old", options.tasks, decode(old_task_from_xml, "old"))
+    new = measure("new", options.tasks, decode(taskxml.task_from_xml, "new"))
+    print "speedup  %.2fx" % (old / new)
+    print "Encoding %d tasks" % options.tasks
+    old = measure("old", options.tasks, encode(old_task_to_xml, "old"))
+    new = measure("new", options.tasks, encode(taskxml.task_to_xml, "new"))
+    print "speedup  %.2fx" % (old / new)
+
+
+if __name__ == '__main__':
+    main()